@@ -0,0 +1,245 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from mock_server import BEIJING_TZ, MockBookingServer
+from nuist_booking.config import CALIBRATION_MARGIN, TOKEN_CHECK_LEAD
+
+# 端到端基准：让各版本脚本以子进程方式对着本地模拟服务器 (mock_server.py) 反复运行，
+# 统计“放号 -> 发出预约请求”与“放号 -> 预约确认”的延迟分位数、每次成功所需请求数以及 CPU 时间。
+# 用法示例: python bench_e2e.py --versions v3 v6 --runs 5 --output bench_e2e.json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_COURT = "场地1"
+BENCH_TIME = "18:00"
+
+def _args_polling(run):
+    """v1~v3：按固定间隔轮询 (只给一个场地和时段，三者参数兼容)"""
+    return ["-tk", run["token"], "-c", BENCH_COURT, "-t", BENCH_TIME, "-i", str(run["interval"])]
+
+def _args_schedule(run):
+    """v4/v5：schedule 库按本机时间的 HH:MM 触发一次"""
+    return ["-tk", run["token"], "-c", BENCH_COURT, "-t", BENCH_TIME,
+            "-st", time.strftime("%H:%M", time.localtime(run["release_epoch"]))]
+
+V6_STARTUP_SECONDS = 1.0 # 子进程启动 (导入、解析参数) 预留的时间
+
+def v6_calibrate_lead(samples):
+    """
+    v6 的时钟校准提前量：每次采样最多等 1 秒对齐整秒，另外要在触发前的 Token 检查之前结束。
+    提前量不够时 v6 只用来得及的样本，测到的就不再是完整校准后的热路径。
+    """
+    return samples + TOKEN_CHECK_LEAD + CALIBRATION_MARGIN
+
+def v6_min_lead(samples):
+    """v6 需要的最小 --lead：启动 + 连接预热 (在校准之前) + 完整校准"""
+    return V6_STARTUP_SECONDS + 1.0 + v6_calibrate_lead(samples)
+
+def _args_v6(run):
+    """v6：精确触发 (北京时间 HH:MM:SS.ffffff)，校准提前量按采样次数计算，预热在它之前"""
+    trigger = datetime.fromtimestamp(run["release_epoch"], BEIJING_TZ).strftime("%H:%M:%S.%f")
+    return ["-tk", run["token"], "-c", BENCH_COURT, "-t", BENCH_TIME, "-st", trigger,
+            "--warmup-seconds", str(run["lead"] - V6_STARTUP_SECONDS),
+            "--calibrate-samples", str(run["calibrate_samples"]),
+            "--calibrate-lead", str(v6_calibrate_lead(run["calibrate_samples"])),
+            "--max-retries", "50", "--retry-delay", str(run["interval"])]
+
+# 版本名 -> (脚本, 参数构造函数, 放号时间是否需要对齐到整分钟)
+VERSIONS = {
+    "v1": ("book_badminton.py", _args_polling, False),
+    "v2": ("book_badmintonv2.py", _args_polling, False),
+    "v3": ("book_badmintonv3.py", _args_polling, False),
+    "v4": ("book_badmintonv4.py", _args_schedule, True),
+    "v5": ("book_badmintonv5.py", _args_schedule, True),
+    "v6": ("book_badmintonv6.py", _args_v6, False),
+}
+
+def percentile(values, q):
+    """线性插值分位数 (q 取 0~100)；空列表返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    low, high = math.floor(pos), math.ceil(pos)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+def summarize_latencies(values):
+    """返回 {p50, p90, p99, max} (毫秒)，没有样本时各项为 None"""
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+def pick_release_epoch(lead, align_minute):
+    """选择本轮的放号时间：至少 lead 秒之后；schedule 只支持 HH:MM，需要对齐到整分钟"""
+    release = time.time() + lead
+    if align_minute:
+        release = math.ceil(release / 60.0) * 60.0
+    return release
+
+def reap_child(proc, block=False):
+    """
+    检查 (或等待) 子进程是否退出。用 wait4 回收以便拿到它的 CPU 时间，
+    不能先调用 proc.poll()，否则进程被 Popen 回收后 rusage 就丢失了。
+    Returns:
+        tuple: (是否已退出, CPU 时间 [用户态 + 内核态，秒])；平台不支持 wait4 时 CPU 时间为 None。
+    """
+    if not hasattr(os, "wait4"):
+        exited = proc.wait() is not None if block else proc.poll() is not None
+        return exited, None
+    pid, _, usage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return False, None
+    proc.returncode = 0 # 已由 wait4 回收，避免 Popen 再次 waitpid
+    return True, usage.ru_utime + usage.ru_stime
+
+def run_once(mock, version, run_index, args):
+    """运行一次指定版本，返回本轮的原始测量结果"""
+    script, build_args, align_minute = VERSIONS[version]
+    release_epoch = pick_release_epoch(args.lead, align_minute)
+    mock.reset(release_epoch)
+    run = {
+        "token": f"bench-{version}-{run_index}",
+        "release_epoch": release_epoch,
+        "lead": args.lead,
+        "interval": args.interval,
+        "calibrate_samples": args.calibrate_samples,
+    }
+    env = dict(os.environ, NUIST_BASE_URL=mock.base_url, PYTHONUNBUFFERED="1")
+    log_path = os.path.join(args.log_dir, f"{version}-{run_index}.log") if args.log_dir else os.devnull
+    started = time.time()
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, script)] + build_args(run),
+                                cwd=SCRIPT_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        deadline = release_epoch + args.run_timeout
+        confirmed_at = None
+        exited, cpu_seconds = False, None
+        # 成功后再等一小段宽限期，让 book-all/并发中的请求也计入统计
+        while time.time() < deadline:
+            exited, cpu_seconds = reap_child(proc)
+            if exited:
+                break
+            if confirmed_at is None and any(r["token"] == run["token"] and r["kind"] == "book" and r["status"] == 0
+                                            for r in mock.stats()["requests"]):
+                confirmed_at = time.time()
+            if confirmed_at is not None and time.time() - confirmed_at >= args.grace:
+                break
+            time.sleep(0.05)
+        if not exited:
+            proc.terminate()
+            _, cpu_seconds = reap_child(proc, block=True)
+    wall_seconds = time.time() - started
+
+    own = [r for r in mock.stats()["requests"] if r["token"] == run["token"]]
+    bookings = [r for r in own if r["kind"] == "book" and r["time"] >= release_epoch]
+    successes = [r for r in bookings if r["status"] == 0]
+    return {
+        "version": version,
+        "run": run_index,
+        "release_epoch": release_epoch,
+        "release_to_request_ms": (bookings[0]["time"] - release_epoch) * 1000 if bookings else None,
+        "release_to_confirm_ms": (successes[0]["finished"] - release_epoch) * 1000 if successes else None,
+        "requests": len(own),
+        "requests_after_release": sum(1 for r in own if r["time"] >= release_epoch),
+        "successes": len(successes),
+        "cpu_seconds": cpu_seconds,
+        "wall_seconds": wall_seconds,
+    }
+
+def summarize_version(version, runs):
+    """把同一版本的多轮结果汇总为分位数与均值"""
+    to_request = [r["release_to_request_ms"] for r in runs if r["release_to_request_ms"] is not None]
+    to_confirm = [r["release_to_confirm_ms"] for r in runs if r["release_to_confirm_ms"] is not None]
+    successes = sum(r["successes"] for r in runs)
+    requests_total = sum(r["requests"] for r in runs)
+    cpu = [r["cpu_seconds"] for r in runs if r["cpu_seconds"] is not None]
+    return {
+        "version": version,
+        "runs": len(runs),
+        "successful_runs": sum(1 for r in runs if r["successes"]),
+        "release_to_request_ms": summarize_latencies(to_request),
+        "release_to_confirm_ms": summarize_latencies(to_confirm),
+        "requests_per_success": requests_total / successes if successes else None,
+        "cpu_seconds_mean": sum(cpu) / len(cpu) if cpu else None,
+    }
+
+def _fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+def print_summary(summaries):
+    print(f"\n{'版本':<6}{'成功':>8}{'请求 p50':>12}{'请求 p90':>12}{'确认 p50':>12}{'确认 p90':>12}{'确认 p99':>12}{'请求/成功':>12}{'CPU(s)':>10}")
+    for s in summaries:
+        req, conf = s["release_to_request_ms"], s["release_to_confirm_ms"]
+        print(f"{s['version']:<6}{s['successful_runs']:>5}/{s['runs']:<2}"
+              f"{_fmt(req['p50']):>12}{_fmt(req['p90']):>12}"
+              f"{_fmt(conf['p50']):>12}{_fmt(conf['p90']):>12}{_fmt(conf['p99']):>12}"
+              f"{_fmt(s['requests_per_success'], '.2f'):>12}{_fmt(s['cpu_seconds_mean'], '.3f'):>10}")
+    print("(延迟单位: 毫秒，均相对模拟服务器的放号时刻)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="端到端基准：各版本脚本从放号到预约确认的延迟",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--versions", nargs='+', choices=sorted(VERSIONS), default=sorted(VERSIONS),
+                        help="要测试的版本，默认全部 (v4/v5 需要对齐整分钟，每轮最长约 1 分钟)")
+    parser.add_argument("--runs", type=int, default=5, help="每个版本运行的轮数，默认 5")
+    parser.add_argument("--lead", type=float, default=15.0, help="子进程在放号前多少秒启动，默认 15 (v6 用于预热与校准)")
+    parser.add_argument("--calibrate-samples", type=int, default=4,
+                        help="v6 的时钟校准采样次数，默认 4；--lead 必须留够完整校准的时间")
+    parser.add_argument("--interval", type=float, default=1.0, help="轮询类版本的查询间隔 / v6 的重试间隔 (秒)，默认 1.0")
+    parser.add_argument("--run-timeout", type=float, default=20.0, help="放号后最多等待多少秒，默认 20")
+    parser.add_argument("--grace", type=float, default=1.0, help="首次确认后再等待多少秒才结束子进程，默认 1.0")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="模拟服务器延迟中位数 (毫秒)，默认 30")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="模拟服务器延迟对数正态 sigma，默认 0.5")
+    parser.add_argument("--rivals", type=int, default=0, help="模拟的竞争客户端数量，默认 0")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务器返回 5xx 的概率，默认 0")
+    parser.add_argument("--seed", type=int, default=42, help="模拟服务器随机种子，默认 42")
+    parser.add_argument("--log-dir", help="保存每轮子进程输出的目录 (默认丢弃)")
+    parser.add_argument("-o", "--output", default="bench_e2e.json", help="结果 JSON 文件，默认 bench_e2e.json")
+    args = parser.parse_args()
+    if "v6" in args.versions and args.lead < v6_min_lead(args.calibrate_samples):
+        parser.error(f"--lead {args.lead:g} 不够 v6 完成 {args.calibrate_samples} 次时钟校准采样，"
+                     f"至少需要 {v6_min_lead(args.calibrate_samples):g} 秒 (或减少 --calibrate-samples)")
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    mock = MockBookingServer(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, rivals=args.rivals,
+                             error_rate=args.error_rate, seed=args.seed, release_epoch=time.time() + 3600)
+    mock.start()
+    print(f"[*] 模拟服务器: {mock.base_url}, 版本: {', '.join(args.versions)}, 每个版本 {args.runs} 轮")
+
+    results = []
+    try:
+        for version in args.versions:
+            for i in range(args.runs):
+                result = run_once(mock, version, i + 1, args)
+                results.append(result)
+                print(f"[*] {version} 第 {i + 1}/{args.runs} 轮: 请求 {_fmt(result['release_to_request_ms'])} ms, "
+                      f"确认 {_fmt(result['release_to_confirm_ms'])} ms, 共 {result['requests']} 次请求, "
+                      f"CPU {_fmt(result['cpu_seconds'], '.3f')} s")
+    except KeyboardInterrupt:
+        print("\n[!] 检测到 Ctrl+C，提前结束基准测试，已完成的结果仍会写入文件。")
+    finally:
+        mock.stop()
+
+    summaries = [summarize_version(v, [r for r in results if r["version"] == v])
+                 for v in args.versions if any(r["version"] == v for r in results)]
+    print_summary(summaries)
+    report = {
+        "created": datetime.now(BEIJING_TZ).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "log_dir")},
+        "summary": summaries,
+        "runs": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[*] 结果已写入 {args.output}")
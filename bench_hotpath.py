@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import time
+
+# 热路径微基准：在合成的大场馆数据上比较各版本的单次轮询开销
+# 用法示例: python bench_hotpath.py matcher --resources 40 --slots 28 --repeat 200
+
+def make_synthetic_payload(resource_count, slots_per_resource, free_ratio=0.2, seed=42):
+    """构造与 searchByDate 返回结构一致的合成数据 (data.list[].slotInfo[])"""
+    rng = random.Random(seed)
+    resources = []
+    for r in range(resource_count):
+        slot_info = []
+        for s in range(slots_per_resource):
+            start_minutes = 6 * 60 + s * 30
+            start_time = f"{start_minutes // 60 % 24:02d}:{start_minutes % 60:02d}"
+            end_minutes = start_minutes + 30
+            end_time = f"{end_minutes // 60 % 24:02d}:{end_minutes % 60:02d}"
+            slot_info.append({
+                "slotId": f"slot-{r}-{s}",
+                "startTime": start_time,
+                "endTime": end_time,
+                "status": 0 if rng.random() < free_ratio else 1,
+                "bookedNums": 0,
+                "slotOrder": s,
+                "scheduleId": f"schedule-{r}",
+            })
+        resources.append({"id": f"resource-{r}", "name": f"场地{r + 1}", "slotInfo": slot_info})
+    return {"status": 0, "message": "success", "data": {"list": resources}}
+
+def time_call(func, repeat):
+    """运行 func repeat 次 (屏蔽其打印输出)，返回每次调用的平均耗时 (微秒)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        func() # 预热
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = time.perf_counter() - started
+    return elapsed / repeat * 1e6
+
+def bench_matcher(args):
+    """比较 v4 (偏好×场地×时段)、v6 原始扫描与 v6 偏好索引的单次匹配耗时"""
+    v4 = importlib.import_module("book_badmintonv4")
+    v6 = importlib.import_module("book_badmintonv6")
+    payload = make_synthetic_payload(args.resources, args.slots)
+    all_times = [slot["startTime"] for slot in payload["data"]["list"][0]["slotInfo"]]
+    courts = [f"场地{i + 1}" for i in range(0, args.resources, max(1, args.resources // args.courts))][:args.courts]
+    times = all_times[::max(1, len(all_times) // args.times)][:args.times]
+    target_date = "2099-01-01"
+    index = v6.build_preference_index(courts, times)
+
+    print(f"[*] 合成数据: {args.resources} 个场地 × {args.slots} 个时段, 偏好 {len(courts)} 个场地 × {len(times)} 个时段, 重复 {args.repeat} 次")
+    results = [
+        ("v4 find_all_available_preferred_slots", time_call(lambda: v4.find_all_available_preferred_slots(payload, target_date, courts, times), args.repeat)),
+        ("v6 find_all_available_preferred_slots", time_call(lambda: v6.find_all_available_preferred_slots(payload, target_date, courts, times), args.repeat)),
+        ("v6 find_ranked_available_slots (索引已构建)", time_call(lambda: v6.find_ranked_available_slots(payload, target_date, index), args.repeat)),
+    ]
+    baseline = results[0][1]
+    for name, micros in results:
+        print(f"    {name:<48} {micros:>10.1f} us/次  ({baseline / micros:.2f}x)")
+
+def peak_allocation(func):
+    """返回单次调用 func 的峰值内存分配 (KiB)"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+def bench_parse(args):
+    """比较完整 json.loads 与 v6 选择性解析在大响应上的耗时与峰值内存"""
+    v6 = importlib.import_module("book_badmintonv6")
+    payload = make_synthetic_payload(args.resources, args.slots)
+    text = json.dumps(payload, ensure_ascii=False)
+    names = [resource["name"] for resource in payload["data"]["list"]]
+    scenarios = [
+        ("偏好场地靠前 (可提前结束)", names[:args.courts]),
+        ("偏好场地分散", names[::max(1, len(names) // args.courts)][:args.courts]),
+        ("偏好场地靠后", names[-args.courts:]),
+    ]
+    print(f"[*] 合成响应: {args.resources} 个场地 × {args.slots} 个时段, {len(text.encode('utf-8')) / 1024:.0f} KiB, 重复 {args.repeat} 次")
+    full = time_call(lambda: json.loads(text), args.repeat)
+    full_peak = peak_allocation(lambda: json.loads(text))
+    print(f"    {'json.loads (完整解析)':<36} {full:>10.1f} us/次  峰值分配 {full_peak:>8.0f} KiB")
+    for label, wanted in scenarios:
+        micros = time_call(lambda: v6.parse_slot_payload_selective(text, wanted), args.repeat)
+        peak = peak_allocation(lambda: v6.parse_slot_payload_selective(text, wanted))
+        print(f"    {'选择性解析: ' + label:<36} {micros:>10.1f} us/次  峰值分配 {peak:>8.0f} KiB  ({full / micros:.2f}x)")
+
+def bench_logging(args):
+    """
+    比较一次典型尝试 (匹配 + 收到预约响应) 在调用线程上的日志开销：
+    v4 同步 print (含完整响应 JSON) 对比 v6 队列日志 (INFO / DEBUG)。输出写入 --sink 指定的文件或终端。
+    队列日志同时给出调用线程的 CPU 时间与墙钟时间：背靠背循环里后台线程 (序列化 JsonDump、写文件) 会与调用线程争抢 GIL，
+    墙钟时间里包含了这部分；真实的尝试之间隔着网络等待，后台线程在那时完成工作。
+    """
+    v4 = importlib.import_module("book_badmintonv4")
+    v6 = importlib.import_module("book_badmintonv6")
+    payload = make_synthetic_payload(args.resources, args.slots)
+    all_times = [slot["startTime"] for slot in payload["data"]["list"][0]["slotInfo"]]
+    courts = [f"场地{i + 1}" for i in range(args.courts)]
+    times = all_times[:args.times]
+    target_date = "2099-01-01"
+    result = {"status": 0, "message": "预约成功", "data": "/wechat/book3/result.html?id=0", "extdata": {"id": "0" * 32}}
+
+    def attempt_print():
+        v4.find_all_available_preferred_slots(payload, target_date, courts, times)
+        print(f"\n[*] 收到预约响应 (目标: 场地1 18:00-19:00, HTTP 200):")
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    def attempt_queued():
+        v6.find_all_available_preferred_slots(payload, target_date, courts, times)
+        v6.log.debug("\n[*] 收到预约响应 (目标: %s, HTTP %s):\n%s", "场地1 18:00-19:00", 200, v6.JsonDump(result))
+
+    print(f"[*] 每次尝试: 匹配 {args.resources} 个场地 × {args.slots} 个时段 (偏好 {args.courts} × {args.times}) + 一次预约响应, "
+          f"重复 {args.repeat} 次, 输出到 {args.sink}")
+    with open(args.sink, "w", encoding="utf-8") as sink:
+        with contextlib.redirect_stdout(sink):
+            attempt_print() # 预热
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                attempt_print()
+            baseline = (time.perf_counter() - started) / args.repeat * 1e6
+        print(f"    {'v4 同步 print':<28} {baseline:>10.1f} us/次")
+
+        for level in (logging.INFO, logging.DEBUG):
+            listener = v6.setup_logging(level, stream=sink)
+            attempt_queued() # 预热
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            for _ in range(args.repeat):
+                attempt_queued()
+            caller_cpu = (time.thread_time() - cpu_started) / args.repeat * 1e6
+            caller = (time.perf_counter() - started) / args.repeat * 1e6
+            drain_started = time.perf_counter()
+            listener.stop() # 等后台线程写完剩余日志
+            drain = (time.perf_counter() - drain_started) * 1000
+            name = f"v6 队列日志 ({logging.getLevelName(level)})"
+            print(f"    {name:<28} {caller:>10.1f} us/次  ({baseline / caller:.2f}x, 调用线程 CPU {caller_cpu:.1f} us, "
+                  f"后台收尾 {drain:.1f} ms)")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STARTUP_BUDGET_MS = 50.0
+
+def time_subprocess(code, repeat):
+    """在新的解释器进程里执行 code，返回各次耗时的中位数 (毫秒)；执行失败返回 None"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if proc.returncode != 0:
+            return None
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def bench_startup(args):
+    """
+    冷启动开销：在新进程里导入命令行入口 (以及对照的网络模块、v5 的顶层依赖)，减去空解释器的启动时间。
+    导入 nuist_booking.cli 超过 --budget-ms，或者导入时就带进了 requests，都以非零状态退出，可当作导入时间预算检查。
+    """
+    baseline = time_subprocess("pass", args.repeat)
+    print(f"[*] 每项在新进程中运行 {args.repeat} 次取中位数, 空解释器启动 {baseline:.1f} ms (已从下面各项扣除)")
+    cli_cost = None
+    for label, code in (("import nuist_booking.cli (命令行入口)", "import nuist_booking.cli"),
+                        ("import nuist_booking.booking (网络部分)", "import nuist_booking.booking"),
+                        ("v5 的顶层依赖 (requests + schedule)", "import requests, schedule")):
+        elapsed = time_subprocess(code, args.repeat)
+        if elapsed is None:
+            print(f"    {label:<40} {'导入失败 (未安装?)':>12}")
+            continue
+        cost = max(0.0, elapsed - baseline)
+        if cli_cost is None:
+            cli_cost = cost
+        print(f"    {label:<40} {cost:>10.1f} ms")
+
+    leaked = subprocess.run([sys.executable, "-c", "import sys, nuist_booking.cli; sys.exit('requests' in sys.modules)"],
+                            cwd=SCRIPT_DIR).returncode != 0
+    failures = []
+    if cli_cost is None or cli_cost > args.budget_ms:
+        failures.append(f"导入 nuist_booking.cli 超出预算 {args.budget_ms:g} ms")
+    if leaked:
+        failures.append("导入 nuist_booking.cli 时已经带进了 requests (应在参数解析之后才导入)")
+    for failure in failures:
+        print(f"[!] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[+] 命令行入口的导入开销在预算 ({args.budget_ms:g} ms) 之内")
+
+def bench_jobstore(args):
+    """
+    守护进程任务库：一次写入 --jobs 个每天重复的任务，然后模拟重启 (重新打开文件)，
+    测量调度器恢复所需的查找 (最早触发时刻、到期的一批、各状态计数) 与列出全部任务的耗时。
+    """
+    from nuist_booking.daemon import build_job
+    from nuist_booking.jobstore import JobStore
+    defaults = {"event": "0" * 32, "courts": ["场地1", "场地2"], "times": ["18:00", "19:00"], "trigger": None,
+                "daily": False, "book_all": False, "top_n": 0, "max_retries": 100, "retry_delay": 0.3, "date": None,
+                "days_ahead": 1}
+    now = time.time()
+    jobs = [build_job({"trigger": f"{i // 60 % 24:02d}:{i % 60:02d}:{i % 7:02d}", "daily": True}, defaults, now)
+            for i in range(args.jobs)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        store = JobStore(path)
+        started = time.perf_counter()
+        store.add(jobs)
+        added = (time.perf_counter() - started) * 1000
+        store.close()
+
+        started = time.perf_counter()
+        store = JobStore(path)
+        next_fire = store.next_fire()
+        batch = store.due(next_fire)
+        counts = store.counts()
+        resumed = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        listed = len(store.list())
+        listing = (time.perf_counter() - started) * 1000
+        store.close()
+    print(f"[*] 任务库: {args.jobs} 个每天重复的任务")
+    print(f"    {'写入 (一个事务)':<28} {added:>10.2f} ms")
+    print(f"    {'重启后恢复调度':<28} {resumed:>10.2f} ms  (等待中 {counts.get('pending', 0)} 个, 最早一批 {len(batch)} 个)")
+    print(f"    {'列出全部任务':<28} {listing:>10.2f} ms  ({listed} 个)")
+
+def bench_history(args):
+    """
+    时段历史：模拟每 0.5 秒一次的轮询 (每次以 --change-rate 的概率有一个时段被预约或取消)，测量查询线程调用 record 的耗时、
+    后台线程处理全部结果的耗时与文件大小，再用 mmap 读取端 (经 memoryview 直接解码，不复制文件内容) 查询最近一小时的记录与重新放出的时段。
+    """
+    from nuist_booking.history import HISTORY_RECORD, SlotHistory, SlotHistoryRecorder
+    rng = random.Random(7)
+    payload = make_synthetic_payload(args.resources, args.slots)
+    interval = 0.5
+    start = time.time() - args.polls * interval
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.bin")
+        recorder = SlotHistoryRecorder(path, queue_size=args.polls) # 背靠背模拟时不让队列满；真实轮询间隔 0.5 秒，后台早已处理完
+        elapsed = cpu = 0.0
+        total_started = time.perf_counter()
+        for poll in range(args.polls):
+            if rng.random() < args.change_rate:
+                # 交给记录器的结果由后台线程稍后对比，不能原地修改；真实查询每次都是新解析的 JSON
+                payload = json.loads(json.dumps(payload))
+                slot = rng.choice([slot for resource in payload['data']['list'] for slot in resource['slotInfo']])
+                slot['status'] = 1 - slot['status'] if slot['status'] in (0, 1) else 0
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            recorder.record("0" * 32, "2025-04-20", payload, timestamp=start + poll * interval)
+            cpu += time.thread_time() - cpu_started
+            elapsed += time.perf_counter() - started
+        recorder.close()
+        total = time.perf_counter() - total_started
+        size = os.path.getsize(path)
+        records = recorder.records
+
+        started = time.perf_counter()
+        with SlotHistory(path) as history:
+            opened = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            recent = sum(1 for _ in history.records(since=start + args.polls * interval - 3600))
+            recent_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            freed = sum(1 for _ in history.reappearances(court="场地1"))
+            freed_ms = (time.perf_counter() - started) * 1000
+    span_days = args.polls * interval / 86400
+    print(f"[*] 时段历史: {args.resources} 个场地 x {args.slots} 个时段, 每 {interval} 秒轮询一次, 共 {args.polls} 次 ({span_days:.1f} 天)")
+    # 背靠背调用时后台线程一直在跑，墙钟时间包含等 GIL 的时间；查询线程自己的 CPU 时间才是 record 的开销
+    print(f"    {'记录 (查询线程, 每次轮询)':<28} {elapsed / args.polls * 1e6:>10.1f} us  (查询线程 CPU {cpu / args.polls * 1e6:.1f} us)")
+    print(f"    {'全部处理完 (含后台线程)':<28} {total * 1000:>10.1f} ms  (丢弃 {recorder.dropped} 个结果)")
+    print(f"    {'文件大小':<28} {size / 1024:>10.1f} KB  ({records} 条记录 x {HISTORY_RECORD.size} 字节, "
+          f"约 {size / span_days * 7 / 1024 / 1024:.1f} MB/周)")
+    print(f"    {'打开 (mmap)':<28} {opened:>10.2f} ms")
+    print(f"    {'最近一小时的记录':<28} {recent_ms:>10.2f} ms  ({recent} 条)")
+    print(f"    {'场地1 重新放出的时段':<28} {freed_ms:>10.2f} ms  ({freed} 次)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预约脚本热路径微基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    matcher_parser = subparsers.add_parser("matcher", help="比较时段匹配函数的单次轮询耗时")
+    matcher_parser.add_argument("--resources", type=int, default=40, help="合成场地数，默认 40")
+    matcher_parser.add_argument("--slots", type=int, default=28, help="每个场地的时段数，默认 28")
+    matcher_parser.add_argument("--courts", type=int, default=8, help="偏好场地数，默认 8")
+    matcher_parser.add_argument("--times", type=int, default=6, help="偏好时段数，默认 6")
+    matcher_parser.add_argument("--repeat", type=int, default=500, help="重复次数，默认 500")
+    matcher_parser.set_defaults(func=bench_matcher)
+
+    parse_parser = subparsers.add_parser("parse", help="比较完整 JSON 解析与选择性解析")
+    parse_parser.add_argument("--resources", type=int, default=200, help="合成场地数，默认 200")
+    parse_parser.add_argument("--slots", type=int, default=48, help="每个场地的时段数，默认 48")
+    parse_parser.add_argument("--courts", type=int, default=3, help="偏好场地数，默认 3")
+    parse_parser.add_argument("--repeat", type=int, default=100, help="重复次数，默认 100")
+    parse_parser.set_defaults(func=bench_parse)
+
+    logging_parser = subparsers.add_parser("logging", help="比较同步 print 与队列日志在调用线程上的开销")
+    logging_parser.add_argument("--resources", type=int, default=8, help="合成场地数，默认 8")
+    logging_parser.add_argument("--slots", type=int, default=28, help="每个场地的时段数，默认 28")
+    logging_parser.add_argument("--courts", type=int, default=4, help="偏好场地数，默认 4")
+    logging_parser.add_argument("--times", type=int, default=4, help="偏好时段数，默认 4")
+    logging_parser.add_argument("--repeat", type=int, default=1000, help="重复次数，默认 1000")
+    logging_parser.add_argument("--sink", default=os.devnull,
+                                help="日志输出目标，默认丢弃；传 /dev/tty 或 CON 可测真实终端的开销")
+    logging_parser.set_defaults(func=bench_logging)
+
+    startup_parser = subparsers.add_parser("startup", help="命令行入口的冷启动导入开销 (超出预算时非零退出)")
+    startup_parser.add_argument("--repeat", type=int, default=15, help="每项运行的进程数，默认 15")
+    startup_parser.add_argument("--budget-ms", type=float, default=DEFAULT_STARTUP_BUDGET_MS,
+                                help=f"import nuist_booking.cli 的预算 (毫秒，已扣除解释器启动)，默认 {DEFAULT_STARTUP_BUDGET_MS:g}")
+    startup_parser.set_defaults(func=bench_startup)
+
+    jobstore_parser = subparsers.add_parser("jobstore", help="守护进程任务库的写入、重启恢复与列出耗时")
+    jobstore_parser.add_argument("--jobs", type=int, default=5000, help="任务数，默认 5000")
+    jobstore_parser.set_defaults(func=bench_jobstore)
+
+    history_parser = subparsers.add_parser("history", help="时段历史记录器的每次轮询开销、文件大小与查询耗时")
+    history_parser.add_argument("--resources", type=int, default=8, help="合成场地数，默认 8")
+    history_parser.add_argument("--slots", type=int, default=28, help="每个场地的时段数，默认 28")
+    history_parser.add_argument("--polls", type=int, default=100000, help="模拟的轮询次数，默认 100000 (约 14 小时)")
+    history_parser.add_argument("--change-rate", type=float, default=0.05,
+                                help="每次轮询有一个时段状态变化的概率，默认 0.05")
+    history_parser.set_defaults(func=bench_history)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,5 +1,6 @@
 import requests
 import json
+import os
 import time
 import argparse
 from datetime import date, timedelta
@@ -8,7 +9,7 @@ from datetime import date, timedelta
 # 本代码 token 值为可选参数
 
 # --- 配置 ---
-BASE_URL = "http://wechatmeeting.nuist.edu.cn"
+BASE_URL = os.environ.get("NUIST_BASE_URL", "http://wechatmeeting.nuist.edu.cn") # 可指向 mock_server.py 做本地测试
 # Event ID 通常是固定的，代表特定的预约项目
 DEFAULT_EVENT_ID = "b8d2f7e00603f0f5af4de278c0b461b8"
 
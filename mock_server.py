@@ -0,0 +1,397 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 本地模拟的 wechatmeeting 预约接口，用于在不访问学校服务器的情况下测试/压测各版本脚本
+# 用法示例: python mock_server.py --port 8080 --release-in 30 --rivals 20
+# 然后让脚本指向它: NUIST_BASE_URL=http://127.0.0.1:8080 python book_badmintonv6.py -tk test ...
+
+SEARCH_PATH = "/api/v2/appBookGeneral/date/slot/searchByDate"
+BOOK_PATH = "/api/v2/appBookGeneral/book/afterConfirm"
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+SLOT_FREE = 0       # 可预约
+SLOT_BOOKED = 1     # 已被预约
+SLOT_NOT_OPEN = 2   # 尚未开放
+
+MSG_NOT_OPEN = "不在开放日期范围内！"
+MSG_EMPTY_RECORDS = "预约时间段不能为空"
+MSG_AUTH_FAILED = "认证失败，请重新登录"
+MSG_TAKEN = "该时段已被预约"
+MSG_QUOTA = "超过最大未使用预约个数"
+MSG_RATE_LIMITED = "请求过于频繁，请稍后再试"
+
+class MockVenue:
+    """一个 (eventId, 日期) 的场地与时段状态"""
+    def __init__(self, event_id, book_date, courts, slots_per_court, start_hour, slot_minutes):
+        self.event_id = event_id
+        self.book_date = book_date
+        self.resources = []
+        self.slots = {} # slotId -> (resource, slot)
+        for c in range(courts):
+            resource_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{event_id}/{c}").hex
+            resource = {"id": resource_id, "name": f"场地{c + 1}", "slotInfo": []}
+            for s in range(slots_per_court):
+                start = start_hour * 60 + s * slot_minutes
+                end = start + slot_minutes
+                slot = {
+                    "slotId": uuid.uuid5(uuid.NAMESPACE_URL, f"{event_id}/{book_date}/{c}/{s}").hex,
+                    "startTime": f"{start // 60 % 24:02d}:{start % 60:02d}",
+                    "endTime": f"{end // 60 % 24:02d}:{end % 60:02d}",
+                    "status": SLOT_NOT_OPEN,
+                    "bookedNums": 0,
+                    "slotOrder": s + 1,
+                    "scheduleId": uuid.uuid5(uuid.NAMESPACE_URL, f"{event_id}/{book_date}/schedule").hex,
+                }
+                resource["slotInfo"].append(slot)
+                self.slots[slot["slotId"]] = (resource, slot)
+            self.resources.append(resource)
+
+    def free_slots(self):
+        return [slot for _, slot in self.slots.values() if slot["status"] == SLOT_FREE]
+
+class MockBookingServer:
+    """
+    模拟服务器的状态与行为：放号时间、延迟分布、竞争对手、故障注入。
+    可以通过 start()/stop() 在当前进程的后台线程中运行 (供基准测试使用)，也可以从命令行独立运行。
+    """
+    def __init__(self, host="127.0.0.1", port=0, release_epoch=None, courts=8, slots_per_court=14,
+                 start_hour=8, slot_minutes=60, latency_ms=30.0, latency_sigma=0.5, rivals=0,
+                 rival_reaction_ms=400.0, cancel_rate=0.0, error_rate=0.0, timeout_rate=0.0,
+                 hang_seconds=20.0, rate_limit=0.0, max_unused=1, clock_skew_ms=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.release_epoch = release_epoch if release_epoch is not None else time.time()
+        self.venue_args = (courts, slots_per_court, start_hour, slot_minutes)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rivals = rivals
+        self.rival_reaction_ms = rival_reaction_ms
+        self.cancel_rate = cancel_rate
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.rate_limit = rate_limit
+        self.max_unused = max_unused
+        self.clock_skew = clock_skew_ms / 1000.0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.venues = {}
+        self.opened = False     # 当前放号时间是否已开放
+        self.bookings = {}      # token -> 已预约 slotId 列表
+        self.request_times = {} # token -> 最近请求时间戳 (限流用)
+        self.log = []           # 每个请求的记录，供基准测试统计
+        self.httpd = None
+        self.threads = []
+        self.stopping = threading.Event()
+
+    # --- 状态 ---
+    def now(self):
+        """服务器时钟 (可通过 clock_skew_ms 模拟与客户端的时钟偏差)"""
+        return time.time() + self.clock_skew
+
+    def released(self):
+        return self.now() >= self.release_epoch
+
+    def venue(self, event_id, book_date):
+        key = (event_id, book_date)
+        venue = self.venues.get(key)
+        if venue is None:
+            venue = MockVenue(event_id, book_date, *self.venue_args)
+            self.venues[key] = venue
+            self.opened = False
+        self.open_if_released()
+        return venue
+
+    def reset(self, release_epoch=None):
+        """清空所有预约与统计，并设置新的放号时间"""
+        with self.lock:
+            self.venues.clear()
+            self.bookings.clear()
+            self.request_times.clear()
+            self.log.clear()
+            self.opened = False
+            if release_epoch is not None:
+                self.release_epoch = release_epoch
+
+    def stats(self):
+        """返回请求统计与预约记录 (JSON 可序列化)"""
+        with self.lock:
+            return {"release_epoch": self.release_epoch, "server_time": self.now(), "requests": list(self.log)}
+
+    def open_if_released(self):
+        """放号：到达放号时间后把所有尚未开放的时段置为可约 (调用方需持有 self.lock)"""
+        if self.opened or not self.released():
+            return
+        for venue in self.venues.values():
+            for _, slot in venue.slots.values():
+                if slot["status"] == SLOT_NOT_OPEN:
+                    slot["status"] = SLOT_FREE
+        self.opened = True
+
+    def sample_latency(self):
+        """按对数正态分布采样一次服务端处理延迟 (秒)"""
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.random.lognormvariate(math.log(self.latency_ms / 1000.0), self.latency_sigma)
+
+    # --- 接口逻辑 ---
+    def handle_search(self, token, body):
+        if not token:
+            return {"status": 9999, "message": MSG_AUTH_FAILED}
+        with self.lock:
+            venue = self.venue(body.get("eventId"), body.get("date"))
+            return {"status": 0, "message": "查询成功", "data": {"list": json.loads(json.dumps(venue.resources))}}
+
+    def handle_book(self, token, body):
+        if not token:
+            return {"status": 9999, "message": MSG_AUTH_FAILED}
+        records = body.get("records") or []
+        if not records or any(not record.get("bookSlotId") or not record.get("bookSlot") for record in records):
+            return {"status": 1, "message": MSG_EMPTY_RECORDS}
+        if not self.released():
+            return {"status": 1, "message": MSG_NOT_OPEN}
+        with self.lock:
+            owned = self.bookings.setdefault(token, [])
+            if len(owned) + len(records) > self.max_unused:
+                return {"status": 1, "message": MSG_QUOTA}
+            targets = []
+            for record in records:
+                venue = self.venue(body.get("eventId"), record.get("bookDate"))
+                entry = venue.slots.get(record["bookSlotId"])
+                if entry is None or entry[1]["status"] != SLOT_FREE:
+                    return {"status": 1, "message": MSG_TAKEN}
+                targets.append(entry[1])
+            for slot in targets: # 多条记录要么全部成功，要么全部失败
+                slot["status"] = SLOT_BOOKED
+                slot["bookedNums"] += 1
+                owned.append(slot["slotId"])
+        booking_id = uuid.uuid4().hex
+        return {"status": 0, "message": "预约成功", "data": f"/wechat/book3/result.html?id={booking_id}",
+                "extdata": {"id": booking_id}}
+
+    def check_rate_limit(self, token):
+        """每个 token 每秒最多 rate_limit 个请求 (0 表示不限)"""
+        if not self.rate_limit:
+            return False
+        now = time.time()
+        with self.lock:
+            recent = [t for t in self.request_times.get(token, []) if now - t < 1.0]
+            recent.append(now)
+            self.request_times[token] = recent
+            return len(recent) > self.rate_limit
+
+    # --- 后台活动：竞争对手、退订 ---
+    def _rival_loop(self, rival_id):
+        """一个竞争对手：放号后经过一段反应时间，随机抢一个空闲时段 (每次放号抢一次)"""
+        token = f"rival-{rival_id}"
+        booked_for_release = None
+        while not self.stopping.is_set():
+            if not self.released() or booked_for_release == self.release_epoch:
+                self.stopping.wait(0.01)
+                continue
+            release = self.release_epoch
+            reaction = self.random.expovariate(1000.0 / self.rival_reaction_ms) if self.rival_reaction_ms > 0 else 0
+            if self.stopping.wait(max(0.0, release + reaction - self.now())):
+                return
+            with self.lock:
+                self.open_if_released()
+                candidates = [slot for venue in self.venues.values() for slot in venue.free_slots()]
+                if candidates:
+                    slot = self.random.choice(candidates)
+                    slot["status"] = SLOT_BOOKED
+                    slot["bookedNums"] += 1
+                    self.bookings.setdefault(token, []).append(slot["slotId"])
+                    self.log.append({"time": self.now(), "kind": "rival", "token": token, "slotId": slot["slotId"], "status": 0})
+            booked_for_release = release
+
+    def _cancel_loop(self):
+        """按 cancel_rate (每分钟) 随机退订已被预约的时段，模拟有人取消后空位重新出现"""
+        while not self.stopping.wait(self.random.expovariate(self.cancel_rate / 60.0)):
+            with self.lock:
+                booked = [slot for venue in self.venues.values() for _, slot in venue.slots.values()
+                          if slot["status"] == SLOT_BOOKED]
+                if booked:
+                    slot = self.random.choice(booked)
+                    slot["status"] = SLOT_FREE
+                    for owned in self.bookings.values():
+                        if slot["slotId"] in owned:
+                            owned.remove(slot["slotId"])
+
+    # --- 生命周期 ---
+    def start(self):
+        """在后台线程中启动 HTTP 服务，返回实际的 base URL"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.threads = [threading.Thread(target=self.httpd.serve_forever, daemon=True)]
+        self.threads += [threading.Thread(target=self._rival_loop, args=(i,), daemon=True) for i in range(self.rivals)]
+        if self.cancel_rate > 0:
+            self.threads.append(threading.Thread(target=self._cancel_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self):
+        self.stopping.set()
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+def _make_handler(server):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # 支持 keep-alive，与真实服务器一致
+
+        def date_time_string(self, timestamp=None):
+            return formatdate(server.now() if timestamp is None else timestamp, usegmt=True)
+
+        def log_message(self, format, *args):
+            pass # 保持安静，统计信息通过 /__mock__/stats 获取
+
+        def _token(self):
+            for part in self.headers.get("Cookie", "").split(";"):
+                name, _, value = part.strip().partition("=")
+                if name == "token" and value:
+                    return value
+            return None
+
+        def _send_json(self, body, status=200):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == "/__mock__/stats":
+                self._send_json(server.stats())
+            else:
+                self._send_json({"status": 0, "message": "mock wechatmeeting server"})
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError: # 包括 JSONDecodeError 与非 UTF-8 请求体的 UnicodeDecodeError
+                body = None
+            if not isinstance(body, dict):
+                self._send_json({"status": 1, "message": "请求格式错误：请求体必须是 JSON 对象"}, status=400)
+                return
+            if path == "/__mock__/reset":
+                release_epoch = body.get("release_epoch")
+                if release_epoch is not None and (isinstance(release_epoch, bool)
+                                                  or not isinstance(release_epoch, (int, float))):
+                    self._send_json({"status": 1, "message": "release_epoch 必须是 Unix 时间戳 (秒)"}, status=400)
+                    return
+                server.reset(release_epoch)
+                self._send_json({"status": 0})
+                return
+
+            received = server.now()
+            token = self._token()
+            time.sleep(server.sample_latency())
+            # 故障注入：超时 (长时间不响应) 与 5xx
+            roll = server.random.random()
+            if roll < server.timeout_rate:
+                time.sleep(server.hang_seconds)
+            elif roll < server.timeout_rate + server.error_rate:
+                self._send_json({"status": 500, "message": "Internal Server Error"}, status=503)
+                return
+
+            if server.check_rate_limit(token):
+                result = {"status": 1, "message": MSG_RATE_LIMITED}
+            elif path == SEARCH_PATH:
+                result = server.handle_search(token, body)
+            elif path == BOOK_PATH:
+                result = server.handle_book(token, body)
+            else:
+                self._send_json({"status": 404, "message": "Not Found"}, status=404)
+                return
+            with server.lock:
+                server.log.append({
+                    "time": received,
+                    "kind": "search" if path == SEARCH_PATH else "book",
+                    "token": token,
+                    "slotId": (body.get("records") or [{}])[0].get("bookSlotId") if path == BOOK_PATH else None,
+                    "status": result.get("status"),
+                    "finished": server.now(),
+                })
+            self._send_json(result)
+
+    return MockHandler
+
+def parse_release_time(time_str):
+    """把北京时间 HH:MM[:SS[.fff]] 解析为下一次出现的 Unix 时间戳"""
+    parts = time_str.split(":")
+    seconds = int(parts[0]) * 3600 + int(parts[1]) * 60 + (float(parts[2]) if len(parts) > 2 else 0.0)
+    now = datetime.now(BEIJING_TZ)
+    target = now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() + seconds
+    return target if target > now.timestamp() else target + 24 * 3600
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟的 wechatmeeting 预约接口 (searchByDate / afterConfirm)",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="监听端口，默认 8080")
+    release = parser.add_mutually_exclusive_group()
+    release.add_argument("--release-in", type=float, default=10.0, help="多少秒后放号，默认 10 秒")
+    release.add_argument("--release-at", help="放号时间 (北京时间 HH:MM[:SS[.fff]])")
+    parser.add_argument("--courts", type=int, default=8, help="场地数，默认 8")
+    parser.add_argument("--slots-per-court", type=int, default=14, help="每个场地的时段数，默认 14")
+    parser.add_argument("--start-hour", type=int, default=8, help="第一个时段的开始小时，默认 8")
+    parser.add_argument("--slot-minutes", type=int, default=60, help="每个时段的分钟数，默认 60")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="服务端处理延迟中位数 (毫秒)，默认 30")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="延迟对数正态分布的 sigma，默认 0.5")
+    parser.add_argument("--rivals", type=int, default=0, help="模拟的竞争客户端数量，默认 0")
+    parser.add_argument("--rival-reaction-ms", type=float, default=400.0, help="竞争者放号后的平均反应时间 (毫秒)，默认 400")
+    parser.add_argument("--cancel-rate", type=float, default=0.0, help="每分钟随机退订的时段数，默认 0")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 5xx 的概率 (0~1)，默认 0")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="长时间不响应的概率 (0~1)，默认 0")
+    parser.add_argument("--hang-seconds", type=float, default=20.0, help="模拟超时时不响应的秒数，默认 20")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="每个 token 每秒最多请求数，超出返回限流提示，默认不限")
+    parser.add_argument("--max-unused", type=int, default=1, help="每个 token 最大未使用预约个数，默认 1")
+    parser.add_argument("--clock-skew-ms", type=float, default=0.0, help="服务器时钟相对本机的偏差 (毫秒)，默认 0")
+    parser.add_argument("--seed", type=int, help="随机种子 (用于复现)")
+    args = parser.parse_args()
+
+    release_epoch = parse_release_time(args.release_at) if args.release_at else time.time() + args.release_in
+    mock = MockBookingServer(
+        host=args.host, port=args.port, release_epoch=release_epoch, courts=args.courts,
+        slots_per_court=args.slots_per_court, start_hour=args.start_hour, slot_minutes=args.slot_minutes,
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, rivals=args.rivals,
+        rival_reaction_ms=args.rival_reaction_ms, cancel_rate=args.cancel_rate, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds, rate_limit=args.rate_limit,
+        max_unused=args.max_unused, clock_skew_ms=args.clock_skew_ms, seed=args.seed)
+    base_url = mock.start()
+    release_display = datetime.fromtimestamp(release_epoch, BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    print(f"[*] 模拟服务器已启动: {base_url}")
+    print(f"[*] 放号时间 (服务器时钟, 北京时间): {release_display}")
+    print(f"[*] 让脚本指向它: NUIST_BASE_URL={base_url} python book_badmintonv6.py -tk test ...")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[!] 检测到 Ctrl+C，停止模拟服务器。")
+    finally:
+        mock.stop()
@@ -0,0 +1,68 @@
+"""
+南信大场馆预约的可导入实现：查询 (search) -> 匹配 (match) -> 预约 (booking)，外加定时触发、预热、多目标监视等。
+命令行入口为 python -m nuist_booking (见 cli.py)。
+
+包内名称按需导入：import nuist_booking 本身几乎没有开销，
+只有用到 BookingClient、book_court 等网络相关的名称时才会导入 requests。
+    from nuist_booking import build_preference_index, find_ranked_available_slots
+"""
+import importlib
+
+# 模块名 -> 该模块对外提供的名称
+_MODULE_EXPORTS = {
+    "config": ("BASE_URL", "DEFAULT_EVENT_ID", "DEFAULT_AUTH_TOKEN", "DEFAULT_TARGET_DATE",
+               "DEFAULT_SCHEDULE_TIME", "DEFAULT_MAX_RETRIES", "DEFAULT_RETRY_DELAY", "DEFAULT_POOL_SIZE",
+               "DEFAULT_CONCURRENCY", "DEFAULT_BATCH_SIZE", "DEFAULT_SPIN_MS", "DEFAULT_CALIBRATION_SAMPLES",
+               "DEFAULT_CALIBRATION_LEAD", "CALIBRATION_MARGIN", "DEFAULT_WARMUP_SECONDS",
+               "DEFAULT_KEEPALIVE_INTERVAL",
+               "DEFAULT_PREFETCH_LEAD", "DEFAULT_MIN_DELAY", "DEFAULT_MAX_DELAY", "DEFAULT_CRITICAL_WINDOW",
+               "DEFAULT_FAR_WINDOW", "DEFAULT_MAX_WORKERS", "DEFAULT_REQUEST_BUDGET", "DEFAULT_HEDGE_MIN_MS",
+               "DEFAULT_HEDGE_INITIAL_DELAY", "HEDGE_MIN_SAMPLES", "HEDGE_SAMPLE_WINDOW", "HEDGE_SETTLE_TIMEOUT", "DEFAULT_SEARCH_TTL_MS",
+               "DEFAULT_HISTORY_BUFFER", "DEFAULT_HISTORY_FLUSH_INTERVAL", "DEFAULT_HISTORY_QUEUE",
+               "DEFAULT_TOKEN_CHECK_INTERVAL", "TOKEN_CHECK_LEAD", "DEFAULT_METRICS_HOST", "DEFAULT_API_HOST", "DEFAULT_API_PORT",
+               "DEFAULT_ARM_LEAD", "DEFAULT_RECALIBRATE_INTERVAL", "FIRE_GROUP_WINDOW", "BEIJING_TZ"),
+    "logs": ("log", "DeferredQueueHandler", "JsonDump", "setup_logging", "critical_window_logging"),
+    "tracing": ("TRACE_BUCKETS", "PhaseTracer", "install_tracer", "record_span", "begin_attempt", "traced",
+                "http_started", "record_http_spans", "record_connect", "start_metrics_server"),
+    "client": ("TimedHTTPConnection", "TimedHTTPSConnection", "TimedHTTPConnectionPool",
+               "TimedHTTPSConnectionPool", "BookingClient", "RequestBudget", "build_headers"),
+    "parsing": ("parse_slot_payload_selective",),
+    "tokens": ("token_expiry", "describe_token", "TokenManager"),
+    "search": ("POLL_OK", "POLL_TIMEOUT", "POLL_SERVER_ERROR", "POLL_RATE_LIMITED", "POLL_AUTH_ERROR",
+               "POLL_API_ERROR", "POLL_NETWORK_ERROR", "RATE_LIMIT_KEYWORDS", "get_slot_details",
+               "SearchCoalescer", "PollRateController"),
+    "match": ("find_all_available_preferred_slots", "build_preference_index", "find_ranked_available_slots",
+              "SLOT_NEW", "SLOT_FREED", "SLOT_TAKEN", "SLOT_CHANGED", "SlotEvent", "SlotDiffEngine",
+              "find_ranked_slots_in_events"),
+    "booking": ("BOOK_OK", "BOOK_TERMINAL", "BOOK_RETRY_NOW", "BOOK_RETRY", "BOOK_RETRY_AFTER_RELEASE", "BOOK_BACKOFF",
+                "AUTH_ERROR_STATUSES", "BOOKING_ERROR_RULES", "BookingOutcome", "classify_booking_error",
+                "booking_failure", "BookingRetryPolicy", "build_booking_record", "book_court", "book_court_batch",
+                "prefetch_slot_identifiers", "save_prefetched_slots", "load_prefetched_slots",
+                "group_consecutive_slots", "batch_needs_fallback", "book_slots_concurrently", "make_accounts",
+                "accounts_finished", "assign_slots_to_accounts", "book_for_accounts", "print_account_stats",
+                "RequestHedger"),
+    "watch": ("load_targets", "TargetWatcher", "watch_targets"),
+    "trigger": ("validate_time_format", "validate_trigger_time", "parse_trigger_time", "next_trigger_epoch",
+                "rolled_target_date", "wait_until"),
+    "warmup": ("estimate_server_clock_offset", "print_clock_calibration", "warm_up_client", "print_warmup_report",
+               "ConnectionKeeper"),
+    "jobstore": ("JOB_PENDING", "JOB_ARMED", "JOB_RUNNING", "JOB_SUCCEEDED", "JOB_FAILED", "JOB_MISSED", "JOB_CANCELLED",
+                 "JOB_COLUMNS", "JobStore"),
+    "history": ("HISTORY_MAGIC", "HISTORY_RECORD", "HistoryRecord", "SlotHistoryRecorder", "SlotHistory"),
+    "daemon": ("build_job", "BookingDaemon", "start_api_server"),
+    "cli": ("build_parser", "main"),
+}
+_EXPORTS = {name: module for module, names in _MODULE_EXPORTS.items() for name in names}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value # 之后直接命中模块字典，不再经过 __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,571 @@
+"""预约：错误分类与重试策略、afterConfirm 请求 (单个/合并/对冲)、并发预约与多账号分配"""
+import functools
+import json
+import math
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from .client import build_headers
+from .config import (BASE_URL, DEFAULT_CONCURRENCY, DEFAULT_HEDGE_INITIAL_DELAY, DEFAULT_HEDGE_MIN_MS,
+                     DEFAULT_MAX_DELAY, DEFAULT_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_SAMPLE_WINDOW, HEDGE_SETTLE_TIMEOUT)
+from .logs import JsonDump, log
+from .match import build_preference_index, find_ranked_available_slots
+from .search import RATE_LIMIT_KEYWORDS, get_slot_details
+from .tracing import http_started, record_http_spans, traced
+
+# --- 预约错误分类：不同错误对应不同的重试策略 ---
+BOOK_OK = None
+BOOK_TERMINAL = "terminal"                       # 再试也不会成功：认证失败、payload 错误、超过预约上限
+BOOK_RETRY_NOW = "retry_now"                     # 时段被抢：立即重新查询再试
+BOOK_RETRY = "retry"                             # 未能识别的错误：按常规间隔重试
+BOOK_RETRY_AFTER_RELEASE = "retry_after_release" # 还没放号：等到放号时刻再试
+BOOK_BACKOFF = "backoff"                         # 5xx、限流、超时、连接失败：服务器吃力或网络中断，退避后再试
+AUTH_ERROR_STATUSES = (9999, 4011) # 业务 status 中表示 Token 问题的取值
+
+# (关键字, 错误类别, 原因)，按顺序匹配服务器返回的 message
+BOOKING_ERROR_RULES = (
+    (("认证失败", "重新登录"), BOOK_TERMINAL, "auth"),
+    (("预约时间段不能为空",), BOOK_TERMINAL, "payload"),
+    (("最大未使用", "预约个数"), BOOK_TERMINAL, "quota"),
+    (("不在开放日期范围内", "未到开放时间"), BOOK_RETRY_AFTER_RELEASE, "not_open"),
+    (RATE_LIMIT_KEYWORDS, BOOK_BACKOFF, "rate_limited"),
+    (("已被预约", "已约满"), BOOK_RETRY_NOW, "taken"),
+)
+
+class BookingOutcome(namedtuple("BookingOutcome", ["error_class", "reason", "status", "message", "http_status"])):
+    """book_court 的结果：成功时为真值，失败时为假值并带上错误类别与原因，兼容原来的 True/False 判断"""
+    __slots__ = ()
+
+    def __bool__(self):
+        return self.error_class is BOOK_OK
+
+def classify_booking_error(status=None, message="", http_status=None, exception=None):
+    """
+    把一次失败的预约请求归类，返回 (错误类别 BOOK_*, 原因)。
+    未能识别的业务错误归为 retry (按常规间隔重试)；只有 "时段被抢" 才值得不等待立即重试，
+    其他错误如果也立即重试，持续出错或服务器宕机时会变成对服务器不间断的查询+预约循环。
+    """
+    if exception is not None:
+        if isinstance(exception, requests.exceptions.Timeout):
+            return BOOK_BACKOFF, "timeout"
+        if http_status is None:
+            return BOOK_BACKOFF, "network"
+    if http_status in (401, 403) or status in AUTH_ERROR_STATUSES:
+        return BOOK_TERMINAL, "auth"
+    if http_status == 429:
+        return BOOK_BACKOFF, "rate_limited"
+    if http_status is not None and http_status >= 500:
+        return BOOK_BACKOFF, "server_error"
+    message = message or ""
+    for keywords, error_class, reason in BOOKING_ERROR_RULES:
+        if any(keyword in message for keyword in keywords):
+            return error_class, reason
+    return BOOK_RETRY, "unknown"
+
+def booking_failure(status=None, message="", http_status=None, exception=None):
+    """构造一个失败的 BookingOutcome (错误类别由 classify_booking_error 决定)"""
+    error_class, reason = classify_booking_error(status, message, http_status, exception)
+    return BookingOutcome(error_class, reason, status, message or (str(exception) if exception else ""), http_status)
+
+class BookingRetryPolicy:
+    """
+    按错误类别决定一轮预约之后、下一次查询之前等待多久：
+    - terminal: 该账号不再发请求 (见 book_for_accounts)，等待时间不受影响；
+    - retry_now: 时段被抢，立即重新查询，不等待；
+    - retry: 未能识别的错误，按常规间隔 (default_delay，即 --retry-delay 或自适应轮询给出的间隔) 重试；
+    - retry_after_release: 等到放号时刻；已过放号时刻 (多半是时钟偏差) 则按最小间隔重试；
+    - backoff: 按连续出现的轮数指数退避，不少于常规间隔。
+    同一轮出现多种错误时，退避优先于等待放号，等待放号优先于常规间隔，常规间隔优先于立即重试。
+    """
+    def __init__(self, base_delay, release_epoch=None, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.base_delay = base_delay
+        self.release_epoch = release_epoch
+        self.min_delay = min(min_delay, base_delay)
+        self.max_delay = max(max_delay, base_delay)
+        self.backoff_streak = 0
+        self.counts = {} # (错误类别, 原因) -> 次数
+
+    def next_delay(self, outcomes, default_delay, now=None):
+        """根据本轮的预约结果调整下一次查询前的等待秒数；本轮没有失败的预约时返回 default_delay"""
+        classes = set()
+        for outcome in outcomes:
+            if outcome:
+                continue
+            key = (outcome.error_class, outcome.reason)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            classes.add(outcome.error_class)
+        if BOOK_BACKOFF in classes:
+            self.backoff_streak = min(self.backoff_streak + 1, 6)
+            delay = max(default_delay, min(self.max_delay, self.base_delay * 2 ** self.backoff_streak))
+            log.info("[*] 预约遇到服务器繁忙/限流/超时，退避 %.3f 秒 (连续 %d 轮)", delay, self.backoff_streak)
+            return delay
+        self.backoff_streak = 0
+        if BOOK_RETRY_AFTER_RELEASE in classes:
+            now = time.time() if now is None else now
+            if self.release_epoch is not None and self.release_epoch > now:
+                delay = self.release_epoch - now
+                log.info("[*] 服务器提示尚未放号，等待 %.3f 秒到放号时刻再试", delay)
+                return delay
+            log.info("[*] 服务器提示尚未放号 (本机已过放号时刻，可能存在时钟偏差)，%.3f 秒后再试", self.min_delay)
+            return self.min_delay
+        if BOOK_RETRY in classes:
+            return default_delay
+        if BOOK_RETRY_NOW in classes:
+            log.info("[*] 时段被抢，立即重新查询。")
+            return 0.0
+        return default_delay
+
+    def summary(self):
+        """返回 "原因 (类别) 次数" 形式的统计文本"""
+        return ", ".join(f"{reason} ({error_class}) {count}" for (error_class, reason), count in sorted(self.counts.items()))
+
+def build_booking_record(slot_to_book):
+    """构建实际发送的 record，确保包含 API 需要的所有字段"""
+    return {
+        "bookDate": slot_to_book['bookDate'],
+        "bookSlotId": slot_to_book['bookSlotId'],
+        "bookSlot": slot_to_book['bookSlot'], # <<<--- 修正：取消注释/添加回来
+        "number": slot_to_book['number'],
+        "price": slot_to_book.get('price', ""), # 使用 .get 以防万一 price 缺失，并提供默认值
+        "resourceId": slot_to_book['resourceId'],
+        "slotOrder": slot_to_book['slotOrder'],
+        "seatId": slot_to_book.get('seatId', ""), # 使用 .get 提供默认值
+        "scheduleId": slot_to_book['scheduleId']
+        # "resourceName" 是我们自己添加用于日志的，API 不需要，所以不包含在这里
+    }
+
+def _slot_label(slot):
+    return f"{slot.get('resourceName', '未知场地')} {slot.get('bookSlot', '未知时段')}" # 使用 .get 增加健壮性
+
+@traced("book")
+def book_court(slot_to_book, event_id, headers, client=None):
+    """
+    发送单次预约请求 (传入 client 时复用其连接池)。
+    Returns:
+        BookingOutcome: 成功时为真值；失败时为假值，error_class/reason 给出错误分类 (见 classify_booking_error)。
+    """
+    return _send_booking([build_booking_record(slot_to_book)], event_id, headers, client, _slot_label(slot_to_book))
+
+@traced("book")
+def book_court_batch(slots, event_id, headers, client=None):
+    """
+    在一个 afterConfirm 请求中预约多个时段 (records 列表里放多条记录)。
+    服务器对整批给出一个结果：成功即全部成功；失败时由调用方决定是否退回逐个预约 (见 book_slots_concurrently)。
+    """
+    return _send_booking([build_booking_record(slot) for slot in slots], event_id, headers, client,
+                         " + ".join(_slot_label(slot) for slot in slots))
+
+def _send_booking(records, event_id, headers, client, target_info):
+    """发送 afterConfirm 请求并把响应归类为 BookingOutcome"""
+    booking_url = f"{BASE_URL}/api/v2/appBookGeneral/book/afterConfirm"
+    payload = {
+        "eventId": event_id,
+        "extAttr": "",
+        "payAmount": 0, # 确认支付金额是否总是 0
+        "records": records # API 需要一个记录列表
+    }
+    log.info("\n[*] 准备发送预约请求 (目标: %s)...", target_info)
+    # print(f"[*] Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}") # 取消注释以调试 payload
+
+    try:
+        # 确保 Referer 使用当前的 event_id
+        current_headers = headers.copy()
+        current_headers['Referer'] = f'{BASE_URL}/wechat/book3/book.html?type=eventInfo?eventId={event_id}'
+
+        http = client or requests
+        request_started = http_started()
+        response = http.post(booking_url, headers=current_headers, json=payload, timeout=15)
+        record_http_spans("book", response, request_started)
+
+        try:
+            result = response.json()
+            # 完整响应只在 DEBUG 级别输出，json.dumps 延迟到后台线程真正写出时才执行
+            log.debug("\n[*] 收到预约响应 (目标: %s, HTTP %s):\n%s", target_info, response.status_code, JsonDump(result))
+        except json.JSONDecodeError:
+            log.warning("[!] 预约失败 (%s): 无法解析 JSON 响应 (HTTP %s) - %s...", target_info, response.status_code, response.text[:200])
+            if response.status_code in [401, 403]:
+                 log.warning("[!] 预约请求失败：认证错误 (401/403)，请检查 Token 是否有效或过期。")
+            return booking_failure(message=response.text[:200], http_status=response.status_code)
+
+        if result.get('status') == 0:
+            log.info("[+++] 成功预约: %s!", target_info)
+            return BookingOutcome(BOOK_OK, "", 0, result.get('message', ''), response.status_code)
+        else:
+            error_message = result.get('message', '无错误信息')
+            outcome = booking_failure(result.get('status'), error_message, response.status_code)
+            log.info("[-] 预约失败 (%s): %s [%s, %s]", target_info, error_message, outcome.reason, outcome.error_class)
+            # 特别注意：如果错误信息是 '预约时间段不能为空'，说明 payload 仍有问题
+            if outcome.reason == "payload":
+                 log.error("[!!!] Payload 构造可能仍有问题，请检查 build_booking_record 函数中的 record 字典！")
+            if outcome.reason == "auth":
+                log.warning("[!] Token 可能已失效或无权限，请检查 Token。")
+            # 如果是之前的 "不在开放日期范围内！" 错误，说明请求早于服务器的放号时刻
+            if outcome.reason == "not_open":
+                log.warning("[!] 注意：服务器提示不在开放日期范围内，可能需要精确掐点或日期选择有误。")
+            return outcome
+
+    except requests.exceptions.Timeout as e:
+        log.warning("[!] 预约请求超时 (%s)。", target_info)
+        return booking_failure(exception=e)
+    except requests.exceptions.RequestException as e:
+        log.warning("[!] 发送预约请求失败 (%s): %s", target_info, e)
+        http_status = e.response.status_code if getattr(e, 'response', None) is not None else None
+        if http_status in [401, 403]:
+             log.warning("[!] 预约请求失败：认证错误 (401/403)，请检查 Token 是否有效或过期。")
+        return booking_failure(http_status=http_status, exception=e)
+
+# --- 推测预约：提前缓存时段标识 ---
+def prefetch_slot_identifiers(target_date, event_id, auth_token, preferred_courts, preferred_times, client=None):
+    """
+    提前查询目标日期的时段，缓存预约所需的标识 (bookSlotId/resourceId/slotOrder/scheduleId)，
+    不论时段当前是否可约。结果按偏好顺序 (先场地后时间) 排列。
+    Returns:
+        list: slot_details 字典列表；查询失败时返回空列表。
+    """
+    slot_data = get_slot_details(target_date, event_id, build_headers(auth_token), client=client)
+    preference_index = build_preference_index(preferred_courts, preferred_times)
+    return find_ranked_available_slots(slot_data, target_date, preference_index, require_available=False)
+
+def save_prefetched_slots(path, target_date, event_id, slots):
+    """把预取的时段标识写入 JSON 缓存文件 (例如前一天预取，第二天使用)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"date": target_date, "eventId": event_id, "fetchedAt": time.time(), "slots": slots},
+                  f, ensure_ascii=False, indent=2)
+
+def load_prefetched_slots(path, target_date, event_id):
+    """
+    读取缓存文件中的时段标识；日期或 Event ID 不匹配时视为无效。
+    Returns:
+        list: slot_details 字典列表；缓存不存在或不匹配时返回空列表。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"[!] 读取时段缓存失败 ({path}): {e}")
+        return []
+    if cache.get('date') != target_date or cache.get('eventId') != event_id:
+        log.warning(f"[!] 时段缓存 ({path}) 与目标日期/Event ID 不匹配，已忽略。")
+        return []
+    return cache.get('slots', [])
+
+# --- 并发预约引擎 ---
+def group_consecutive_slots(slots, batch_size):
+    """
+    把同一天、同一场地上首尾相接的时段 (上一个的结束时间等于下一个的开始时间) 合并成一组，每组最多 batch_size 个；
+    其余时段各自成组。组按组内最高排名排序，组内按时间先后排列。
+    """
+    if batch_size <= 1:
+        return [[slot] for slot in slots]
+    by_court = {}
+    for rank, slot in enumerate(slots):
+        by_court.setdefault((slot.get('bookDate'), slot.get('resourceId')), []).append((rank, slot))
+    groups = []
+    for entries in by_court.values():
+        entries.sort(key=lambda entry: entry[1].get('bookSlot', ''))
+        current = []
+        for rank, slot in entries:
+            if current and (len(current) >= batch_size or
+                            current[-1][1].get('bookSlot', '').split('-')[-1] != slot.get('bookSlot', '').split('-')[0]):
+                groups.append(current)
+                current = []
+            current.append((rank, slot))
+        groups.append(current)
+    groups.sort(key=lambda group: min(rank for rank, _ in group))
+    return [[slot for _, slot in group] for group in groups]
+
+def batch_needs_fallback(outcome):
+    """
+    整批预约失败后是否退回逐个预约：某个时段被抢、超过上限 (单个也许还能约)、服务器不接受多条记录等，
+    逐个预约仍可能约到一部分；认证失败、尚未放号、服务器繁忙时逐个预约只会多浪费请求。
+    """
+    return not outcome and outcome.reason != "auth" and outcome.error_class not in (BOOK_BACKOFF, BOOK_RETRY_AFTER_RELEASE)
+
+def book_slots_concurrently(slots, event_id, auth_token, client, concurrency=DEFAULT_CONCURRENCY, top_n=0, book_all=False,
+                            batch_size=1, duplicates=None):
+    """
+    同时为排名前 top_n 的候选时段发送 afterConfirm 请求，最多 concurrency 个并行。
+    结果按到达先后收集；非 book_all 模式下收到第一个成功后不再发出尚未开始的请求，
+    遇到 terminal 错误 (认证失败、超过预约上限等) 时同样停止，这个账号再发请求也不会成功
+    (已经发出的请求无法撤回，仍会等待其结果以便如实报告)。
+    book_all 模式下 batch_size > 1 时，同一场地相邻的时段合并到一个请求里 (见 group_consecutive_slots)；
+    整批被拒绝时退回逐个预约 (见 batch_needs_fallback)。client 设置了 hedger 时每个请求都以对冲方式发送，
+    对冲的两份都成功 (可能重复预约) 的目标追加到 duplicates 列表 (可能在本函数返回之后，见 RequestHedger.call)。
+    Returns:
+        list: [(slot, outcome, elapsed_seconds), ...]，outcome 为 BookingOutcome，按完成先后排列，未发出的时段不在其中。
+    """
+    candidates = list(slots[:top_n]) if top_n and top_n > 0 else list(slots)
+    if not candidates:
+        return []
+
+    stop_event = threading.Event()
+    groups = group_consecutive_slots(candidates, batch_size if book_all else 1)
+
+    def attempt(group):
+        if stop_event.is_set():
+            return group, None, 0.0 # 已有成功，跳过未开始的请求
+        started = time.perf_counter()
+        try:
+            headers = build_headers(auth_token)
+            func, target = (book_court, group[0]) if len(group) == 1 else (book_court_batch, group)
+            if client.hedger:
+                on_duplicate = (functools.partial(duplicates.append, " + ".join(_slot_label(slot) for slot in group))
+                                if duplicates is not None else None)
+                outcome = client.hedger.call(func, target, event_id, headers, client=client, on_duplicate=on_duplicate)
+            else:
+                outcome = func(target, event_id, headers, client=client)
+        except Exception as e:
+            log.warning("[!] 预约线程遇到意外错误 (%s): %s", " + ".join(_slot_label(slot) for slot in group), e)
+            outcome = booking_failure(message=str(e))
+        return group, outcome, time.perf_counter() - started
+
+    results = []
+    workers = max(1, min(concurrency, len(groups)))
+    batched = sum(1 for group in groups if len(group) > 1)
+    log.info("[*] 并发预约 %d 个候选时段 (并发上限 %d%s)...", len(candidates), workers,
+             f", 其中 {batched} 组相邻时段合并为一个请求" if batched else "")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(attempt, group) for group in groups}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                group, outcome, elapsed = future.result()
+                if outcome is None:
+                    continue
+                if len(group) > 1 and batch_needs_fallback(outcome):
+                    log.info("[*]   合并预约 %s 被拒绝 (%s)，改为逐个预约 (%.0f ms)",
+                             " + ".join(_slot_label(slot) for slot in group), outcome.reason, elapsed * 1000)
+                    if not stop_event.is_set():
+                        pending |= {executor.submit(attempt, [slot]) for slot in group}
+                    continue
+                for slot in group:
+                    results.append((slot, outcome, elapsed))
+                    log.info("[*]   %s: %s (%.0f ms)", _slot_label(slot), "成功" if outcome else f"失败 ({outcome.reason})",
+                             elapsed * 1000)
+                stop = (bool(outcome) and not book_all) or outcome.error_class == BOOK_TERMINAL
+                if stop and not stop_event.is_set():
+                    stop_event.set()
+                    for other in pending:
+                        other.cancel()
+    return results
+
+# --- 多账号：共享一个轮询器，候选时段分配给不同账号 ---
+def make_accounts(tokens):
+    """
+    为每个 token 建立一个账号记录 (含预约统计；blocked 为阻止该账号继续预约的 terminal 错误原因，
+    duplicates 为对冲的两份请求都成功、可能重复预约的目标)
+    """
+    return [{"name": f"账号{i + 1}", "token": token, "attempts": 0, "successes": 0, "latencies": [], "booked": [],
+             "blocked": None, "duplicates": []}
+            for i, token in enumerate(tokens)]
+
+def accounts_finished(accounts, recoverable=()):
+    """所有账号都已成功，或已被 terminal 错误阻止 (原因不在 recoverable 中) 时返回 True"""
+    return all(account['successes'] or (account['blocked'] and account['blocked'] not in recoverable)
+               for account in accounts)
+
+def assign_slots_to_accounts(candidates, accounts):
+    """
+    把按排名排序的候选时段分配给尚未成功 (且未被 terminal 错误阻止) 的账号，账号之间互不重复：
+    第 i 个账号依次拿到第 i, i+n, i+2n ... 个候选 (n 为待分配账号数)，排名最高的候选给第一个账号。
+    Returns:
+        list: [(account, [slot, ...]), ...]，没有分到候选的账号不在其中。
+    """
+    active = [account for account in accounts if not account['successes'] and not account['blocked']]
+    assignments = []
+    for i, account in enumerate(active):
+        slots = candidates[i::len(active)]
+        if slots:
+            assignments.append((account, slots))
+    return assignments
+
+def book_for_accounts(assignments, event_id, client, concurrency=DEFAULT_CONCURRENCY, top_n=0, book_all=False, batch_size=1):
+    """
+    各账号并行预约各自分到的候选时段 (每个账号内部仍使用 book_slots_concurrently)，并更新账号统计；
+    遇到 terminal 错误的账号被标记为 blocked，之后不再分配候选；对冲造成的重复预约记入账号的 duplicates。
+    Returns:
+        list: [(account, slot, outcome, elapsed_seconds), ...]
+    """
+    if not assignments:
+        return []
+    if len(assignments) == 1:
+        account, slots = assignments[0]
+        per_account = [(account, book_slots_concurrently(slots, event_id, account['token'], client,
+                                                         concurrency=concurrency, top_n=top_n, book_all=book_all,
+                                                         batch_size=batch_size, duplicates=account.setdefault('duplicates', [])))]
+    else:
+        with ThreadPoolExecutor(max_workers=len(assignments)) as executor:
+            futures = [(account, executor.submit(book_slots_concurrently, slots, event_id, account['token'], client,
+                                                 concurrency, top_n, book_all, batch_size, account.setdefault('duplicates', [])))
+                       for account, slots in assignments]
+            per_account = [(account, future.result()) for account, future in futures]
+
+    outcomes = []
+    for account, results in per_account:
+        for slot, outcome, elapsed in results:
+            account['attempts'] += 1
+            account['latencies'].append(elapsed)
+            if outcome:
+                account['successes'] += 1
+                account['booked'].append(f"{slot.get('resourceName', '未知场地')} {slot.get('bookSlot', '未知时段')}")
+            elif outcome.error_class == BOOK_TERMINAL and not account['blocked']:
+                account['blocked'] = outcome.reason
+                log.warning("[!] %s 遇到无法重试的错误 (%s: %s)，不再为其发送预约请求。", account['name'], outcome.reason, outcome.message)
+            outcomes.append((account, slot, outcome, elapsed))
+    return outcomes
+
+def print_account_stats(accounts):
+    """打印每个账号的预约成功情况与请求延迟"""
+    log.info("[*] 账号统计:")
+    for account in accounts:
+        latencies = sorted(account['latencies'])
+        if latencies:
+            median = latencies[len(latencies) // 2]
+            latency_text = f"延迟 中位数 {median * 1000:.0f} ms / 最大 {latencies[-1] * 1000:.0f} ms"
+        else:
+            latency_text = "未发出预约请求"
+        booked_text = f", 已预约: {'; '.join(account['booked'])}" if account['booked'] else ""
+        blocked_text = f", 已停止 ({account['blocked']})" if account['blocked'] else ""
+        log.info(f"[*]   {account['name']} ({account['token'][:10]}...): 成功 {account['successes']}/{account['attempts']} 次, {latency_text}{booked_text}{blocked_text}")
+        if account.get('duplicates'):
+            log.warning(f"[!]   {account['name']} 的对冲请求两份都返回成功，可能重复预约了: {'; '.join(account['duplicates'])}，"
+                        "请到预约记录中核对并取消多余的预约。")
+
+# --- 对冲预约请求 ---
+class RequestHedger:
+    """
+    预约请求在 "最近观测延迟的第 percentile 百分位" 内还没有响应时，在连接池的另一条连接上再发一份完全相同的请求。
+    两份请求预约的是同一组时段，服务器最多接受其中一份，另一份会得到 "已被预约/超过上限" 这类由自己造成的失败，
+    因此按以下规则合并结果：任意一份成功即立即返回成功；先到的是失败时继续等另一份，两份都失败才返回 (先到的) 失败。
+    """
+    def __init__(self, percentile, min_delay=DEFAULT_HEDGE_MIN_MS / 1000.0, initial_delay=DEFAULT_HEDGE_INITIAL_DELAY,
+                 max_workers=32):
+        self.percentile = min(max(percentile, 1.0), 100.0)
+        self.min_delay = min_delay
+        self.initial_delay = max(initial_delay, min_delay)
+        self.samples = deque(maxlen=HEDGE_SAMPLE_WINDOW)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.calls = 0      # 经过对冲器的预约次数
+        self.hedged = 0     # 其中发出了第二份请求的次数
+        self.hedge_wins = 0 # 由第二份请求给出成功结果的次数
+        self.duplicates = 0 # 两份请求都返回成功的次数 (服务器没有拦住重复预约)
+        self.late = set()   # 先到的一份已成功、仍未返回的另一份请求
+        self.saved = []     # 对冲获胜时，原请求晚到的秒数 (原请求最终返回时才记入)
+        self.outstanding = 0 # 对冲获胜后仍未返回的原请求数
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """记录一个预约请求的耗时样本"""
+        with self._lock:
+            self.samples.append(seconds)
+
+    def hedge_delay(self):
+        """当前的对冲等待时间：最近延迟的第 percentile 百分位，不少于 min_delay；样本不足时用 initial_delay"""
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return self.initial_delay
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(self.percentile / 100.0 * len(ordered)) - 1))
+        return max(self.min_delay, ordered[index])
+
+    def _timed(self, func, args, kwargs):
+        """发送一份预约请求；只有 afterConfirm 的耗时作为延迟样本 (查询、HEAD 预热/校准的往返要快得多，不能混进来)"""
+        started = time.perf_counter()
+        try:
+            outcome = func(*args, **kwargs)
+        except Exception as e:
+            outcome = booking_failure(message=str(e))
+        finished = time.perf_counter()
+        self.observe(finished - started)
+        return outcome, finished
+
+    def call(self, func, *args, on_duplicate=None, **kwargs):
+        """
+        以对冲方式调用预约函数 func (book_court / book_court_batch)，返回合并后的 BookingOutcome。
+        先到的一份成功后另一份也成功 (可能重复预约) 时，在请求线程里调用 on_duplicate() 通知调用方；
+        这发生在 call 返回之后，汇总前用 settle() 等晚到的请求返回。
+        """
+        delay = self.hedge_delay()
+        primary = self.executor.submit(self._timed, func, args, kwargs)
+        with self._lock:
+            self.calls += 1
+        if wait([primary], timeout=delay).done:
+            return primary.result()[0]
+
+        duplicate = self.executor.submit(self._timed, func, args, kwargs)
+        with self._lock:
+            self.hedged += 1
+        log.info("[*] 预约请求 %.0f ms 内未响应，已在另一条连接上发出对冲请求", delay * 1000)
+        pending = {primary, duplicate}
+        first_failure = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome, finished = future.result()
+                if outcome:
+                    with self._lock:
+                        self.late |= pending
+                    for other in pending:
+                        other.add_done_callback(functools.partial(self._reconcile, finished, future is duplicate, on_duplicate))
+                    if future is duplicate:
+                        with self._lock:
+                            self.hedge_wins += 1
+                            self.outstanding += len(pending)
+                    return outcome
+                if first_failure is None:
+                    first_failure = outcome
+        return first_failure
+
+    def _reconcile(self, decided_at, hedge_won, on_duplicate, future):
+        """先到的请求已成功：核对晚到的那一份 (在请求线程里回调)"""
+        try:
+            outcome, finished = future.result()
+        except Exception:
+            with self._lock:
+                self.late.discard(future)
+            return
+        with self._lock:
+            self.late.discard(future)
+            if hedge_won:
+                self.saved.append(finished - decided_at)
+                self.outstanding -= 1
+            if outcome:
+                self.duplicates += 1
+        if outcome:
+            if on_duplicate:
+                on_duplicate()
+            log.warning("[!] 对冲的两份预约请求都返回成功，可能产生了重复预约，请到预约记录中核对。")
+        else:
+            log.debug("[*] 对冲请求的另一份返回失败 (%s: %s)，预期内。", outcome.reason, outcome.message)
+
+    def settle(self, timeout=HEDGE_SETTLE_TIMEOUT):
+        """等先到一份已成功的对冲中，晚到的另一份返回 (最多 timeout 秒)，之后才能确定有没有重复预约"""
+        with self._lock:
+            late = list(self.late)
+        if late:
+            wait(late, timeout=timeout)
+
+    def report(self):
+        """打印对冲次数与节省的尾延迟"""
+        with self._lock:
+            calls, hedged, wins, duplicates, saved = self.calls, self.hedged, self.hedge_wins, self.duplicates, sorted(self.saved)
+            outstanding = self.outstanding
+        if not calls:
+            return
+        saved_text = (f", 节省的尾延迟 中位数 {saved[len(saved) // 2] * 1000:.0f} ms / 最大 {saved[-1] * 1000:.0f} ms"
+                      if saved else "")
+        if outstanding:
+            saved_text += f", 另有 {outstanding} 个被超越的原请求尚未返回"
+        log.info(f"[*] 对冲请求: 预约 {calls} 次, 对冲 {hedged} 次 ({hedged / calls:.0%}), 对冲先成功 {wins} 次"
+                 f"{saved_text}{f', 重复成功 {duplicates} 次' if duplicates else ''} (当前等待 {self.hedge_delay() * 1000:.0f} ms)")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,636 @@
+"""命令行入口：python -m nuist_booking [参数] (book_badmintonv6.py 是它的兼容入口)"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from .config import (DEFAULT_EVENT_ID, DEFAULT_AUTH_TOKEN, DEFAULT_SCHEDULE_TIME,
+                     DEFAULT_MAX_RETRIES, DEFAULT_RETRY_DELAY, DEFAULT_POOL_SIZE, DEFAULT_CONCURRENCY,
+                     DEFAULT_BATCH_SIZE, DEFAULT_SPIN_MS, DEFAULT_CALIBRATION_SAMPLES,
+                     DEFAULT_CALIBRATION_LEAD, CALIBRATION_MARGIN, DEFAULT_WARMUP_SECONDS, DEFAULT_KEEPALIVE_INTERVAL,
+                     DEFAULT_PREFETCH_LEAD, DEFAULT_MIN_DELAY, DEFAULT_MAX_DELAY, DEFAULT_CRITICAL_WINDOW,
+                     DEFAULT_MAX_WORKERS, DEFAULT_REQUEST_BUDGET, DEFAULT_HEDGE_MIN_MS, DEFAULT_SEARCH_TTL_MS,
+                     TOKEN_CHECK_LEAD, DEFAULT_METRICS_HOST, DEFAULT_API_HOST, DEFAULT_API_PORT, BEIJING_TZ)
+from .logs import critical_window_logging, log, setup_logging
+from .trigger import next_trigger_epoch, rolled_target_date, validate_trigger_time, wait_until
+
+def build_parser(prog=None):
+    # --- 参数解析部分 (增加重试相关参数) ---
+    parser = argparse.ArgumentParser(prog=prog, description="羽毛球场馆自动预约脚本 (支持定时执行、多偏好和失败重试)", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--token-file",
+                        help="Token 文件 (每行一个 Token，顺序对应账号)。运行期间会监视该文件，\n"
+                             "更新后无需重启即可换上新 Token；未提供 --token 时也从这里读取初始 Token。")
+    parser.add_argument("--booking-window", type=float,
+                        help="预计的预约窗口长度（秒），触发前据此检查 Token 是否会在窗口结束前过期。\n"
+                             "默认为 最大尝试次数 × 重试间隔。")
+    parser.add_argument("-tk", "--token", nargs='+',
+                        help="有效的认证 JWT Token。\n"
+                             "如果未提供，脚本将尝试使用内置默认 Token (如果设置了)。\n"
+                             "强烈建议通过命令行提供最新的 Token。\n"
+                             "可提供多个 Token (空格分隔)：多个账号共享同一个查询轮询器，\n"
+                             "并各自预约不同的候选时段。")
+    parser.add_argument("-d", "--date",
+                        help="目标预约日期 (格式: YYYY-MM-DD)。\n"
+                             "默认为每次触发当天 (北京时间) 的第二天，每天运行时目标日期随之前进。")
+    parser.add_argument("-t", "--time", nargs='+', default=["10:00"],
+                        help="偏好的预约时段开始时间列表 (格式: HH:MM)，用空格分隔。\n"
+                             "例如: --time 10:00 15:00\n"
+                             "默认为 '10:00'")
+    parser.add_argument("-c", "--court", nargs='+', default=["场地1"],
+                        help="偏好的场地名称列表，用空格分隔 (如果名称含空格需加引号)。\n"
+                             "例如: --court 场地1 场地2 \"场地 5\"\n"
+                             "默认为 '场地1'")
+    parser.add_argument("-e", "--event", default=DEFAULT_EVENT_ID,
+                        help=f"预约项目的 Event ID，默认为教职工羽毛球场 ({DEFAULT_EVENT_ID}) 常见值: \n"
+                             "教职工羽毛球场 (b8d2f7e00603f0f5af4de278c0b461b8) \n"
+                             "体育馆二楼羽毛球场 (fc5379ac197b421940fffa4c99723e11)")
+    parser.add_argument("--book-all", action="store_true",
+                        help="如果设置此标志，脚本会尝试预约找到的所有可用偏好时段，而不是只预约第一个。\n"
+                             "注意：这仍受限于系统的预约规则（如最大未使用数）。")
+    parser.add_argument("-st", "--schedule-time", type=validate_trigger_time, default=DEFAULT_SCHEDULE_TIME,
+                        help="脚本每天自动执行预约逻辑的时间 (北京时间)。\n"
+                             "支持 HH:MM、HH:MM:SS 或带毫秒的 HH:MM:SS.fff 格式。\n"
+                             f"例如: --schedule-time 07:59 或 --schedule-time 08:00:00.150\n"
+                             f"默认为 '{DEFAULT_SCHEDULE_TIME}'")
+    parser.add_argument("--spin-ms", type=float, default=DEFAULT_SPIN_MS,
+                        help="触发前最后多少毫秒改为忙等以提高触发精度 (会占满一个 CPU 核)。\n"
+                             f"默认为 {DEFAULT_SPIN_MS} 毫秒。")
+    parser.add_argument("--calibrate-samples", type=int, default=DEFAULT_CALIBRATION_SAMPLES,
+                        help="触发前用多少次请求校准服务器时钟 (根据 HTTP Date 头)。\n"
+                             f"默认为 {DEFAULT_CALIBRATION_SAMPLES} 次。设为 0 则不校准，直接使用本机时钟。")
+    parser.add_argument("--calibrate-lead", type=float, default=DEFAULT_CALIBRATION_LEAD,
+                        help="在触发前多少秒进行时钟校准。每次采样最多要等 1 秒对齐整秒，提前量不够完成全部采样时\n"
+                             "只用触发前来得及完成的样本 (并打印警告)。\n"
+                             f"默认为 {DEFAULT_CALIBRATION_LEAD} 秒。")
+    parser.add_argument("--warmup-seconds", type=float, default=DEFAULT_WARMUP_SECONDS,
+                        help="在触发前多少秒预热连接 (固定 DNS、打开连接池、预跑一次查询)。\n"
+                             f"默认为 {DEFAULT_WARMUP_SECONDS} 秒。设为 0 则不预热。")
+    parser.add_argument("--keepalive-interval", type=float, default=DEFAULT_KEEPALIVE_INTERVAL,
+                        help="预热后发送保活请求的间隔（秒）。\n"
+                             f"默认为 {DEFAULT_KEEPALIVE_INTERVAL} 秒。")
+    parser.add_argument("--speculative", action="store_true",
+                        help="推测预约模式：提前缓存时段标识，触发时跳过查询直接发送预约请求；\n"
+                             "若服务器拒绝 (标识过期等)，自动回退到正常的 查询-预约 流程。")
+    parser.add_argument("--prefetch-lead", type=float, default=DEFAULT_PREFETCH_LEAD,
+                        help="推测预约模式下，在触发前多少秒预取时段标识。\n"
+                             f"默认为 {DEFAULT_PREFETCH_LEAD} 秒。")
+    parser.add_argument("--prefetch-cache",
+                        help="时段标识缓存文件路径 (JSON)。预取成功时写入；\n"
+                             "触发前预取失败 (例如尚未开放查询) 时从该文件读取。")
+    parser.add_argument("--prefetch-only", action="store_true",
+                        help="只预取时段标识并写入 --prefetch-cache 后退出 (适合前一天运行)。")
+    parser.add_argument("--adaptive-delay", action="store_true",
+                        help="启用自适应轮询间隔：放号前后关键窗口内全速轮询，离放号远时放慢，\n"
+                             "遇到超时/5xx/限流时指数退避。--retry-delay 作为放号后的常规间隔。\n"
+                             "放号时刻由 --release-time 给出 (默认即触发时刻，此时触发后直接处于关键窗口)。")
+    parser.add_argument("--release-time", type=validate_trigger_time,
+                        help="放号时刻 (北京时间/服务器时钟，HH:MM[:SS[.fff]])，默认与 --schedule-time 相同。\n"
+                             "设为晚于 --schedule-time 的时刻时，脚本在触发后就开始轮询，配合 --adaptive-delay\n"
+                             "离放号远时放慢、临近放号时加速 (注意 --max-retries 要留够提前轮询的次数)；\n"
+                             "服务器提示尚未放号时也等到这个时刻再试。")
+    parser.add_argument("--min-delay", type=float, default=DEFAULT_MIN_DELAY,
+                        help=f"自适应轮询的最小间隔（秒），默认为 {DEFAULT_MIN_DELAY} 秒。")
+    parser.add_argument("--max-delay", type=float, default=DEFAULT_MAX_DELAY,
+                        help=f"自适应轮询的最大间隔（秒），默认为 {DEFAULT_MAX_DELAY} 秒。")
+    parser.add_argument("--critical-window", type=float, default=DEFAULT_CRITICAL_WINDOW,
+                        help=f"放号前后多少秒内全速轮询，默认为 {DEFAULT_CRITICAL_WINDOW} 秒。")
+    parser.add_argument("--targets",
+                        help="多目标监视：目标列表 JSON 文件，每项可包含 event、date/dates、courts、times、book_all、top_n，\n"
+                             "未给出的字段使用命令行参数。设置后在一个进程内并发监视所有目标。")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"多目标监视时同时轮询的目标数上限，默认为 {DEFAULT_MAX_WORKERS}。")
+    parser.add_argument("--request-budget", type=float, default=DEFAULT_REQUEST_BUDGET,
+                        help="多目标监视 (守护进程模式下为多个任务同时执行) 时全进程每秒最多发出的请求数 (令牌桶)。\n"
+                             f"默认为 {DEFAULT_REQUEST_BUDGET}。设为 0 则不限制。")
+    parser.add_argument("--search-ttl-ms", type=float, default=DEFAULT_SEARCH_TTL_MS,
+                        help="多目标监视/守护进程模式下，同一 (eventId, 日期) 的并发查询共用一个在途请求，\n"
+                             "成功的查询结果再缓存这么多毫秒供随后的查询直接使用。\n"
+                             f"默认为 {DEFAULT_SEARCH_TTL_MS:g}。设为 0 则只合并在途请求、不缓存。")
+    parser.add_argument("--no-search-coalesce", action="store_true",
+                        help="关闭查询合并与缓存，每个目标各自发出查询请求。")
+    # 新增：重试参数
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="在预约失败时，最大尝试次数（包括首次尝试）。\n"
+                             f"默认为 {DEFAULT_MAX_RETRIES} 次。设为 1 则不重试。")
+    parser.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY,
+                        help="每次重试之间的等待时间（秒）。\n"
+                             f"默认为 {DEFAULT_RETRY_DELAY} 秒。")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                        help="keep-alive 连接池大小，查询与预约共享同一个连接池。\n"
+                             f"默认为 {DEFAULT_POOL_SIZE}。")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="同时发出的预约请求上限。\n"
+                             f"默认为 {DEFAULT_CONCURRENCY}。设为 1 则逐个预约。")
+    parser.add_argument("--top-n", type=int, default=0,
+                        help="每轮只并发预约排名前 N 个候选时段，0 表示全部候选。\n"
+                             "默认为 0。")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="--book-all 模式下把同一场地相邻的时段 (例如连续两小时) 合并到一个预约请求里，每个请求最多 N 个时段；\n"
+                             "整批被拒绝时自动退回逐个预约。\n"
+                             f"默认为 {DEFAULT_BATCH_SIZE} (不合并)。")
+    parser.add_argument("--hedge-percentile", type=float, default=0,
+                        help="对冲预约请求：预约请求超过最近观测延迟的第 P 百分位 (例如 95) 仍未响应时，\n"
+                             "在另一条连接上再发一份相同的请求，采用先成功的结果。\n"
+                             "默认为 0 (不对冲)。")
+    parser.add_argument("--hedge-min-ms", type=float, default=DEFAULT_HEDGE_MIN_MS,
+                        help=f"对冲请求前至少等待多少毫秒，默认为 {DEFAULT_HEDGE_MIN_MS:g}。")
+    parser.add_argument("--trace-file",
+                        help="把每轮尝试中各阶段 (dns/connect/ttfb/download/decode/match/book 等) 的耗时\n"
+                             "逐条追加写入该 JSONL 文件。")
+    parser.add_argument("--history-file",
+                        help="把每次查询到的时段状态变化 (只记变化) 追加写入该二进制文件 (另有同名 .keys 文件)，\n"
+                             "记录所有场地 (不限于 -c 指定的偏好场地)，用于事后分析被取消的时段何时重新出现 (读取见 README)。")
+    parser.add_argument("--metrics-port", type=int,
+                        help="在该端口提供 Prometheus 文本格式的 /metrics 端点 (阶段耗时直方图与计数)，\n"
+                             "脚本等待触发期间也保持可用。")
+    parser.add_argument("--metrics-host", default=DEFAULT_METRICS_HOST,
+                        help=f"/metrics 端点的监听地址，默认为 {DEFAULT_METRICS_HOST}。")
+    parser.add_argument("--daemon", action="store_true",
+                        help="守护进程模式：常驻运行，保持连接池与时钟校准，预约任务通过本地接口提交\n"
+                             "(POST /jobs，状态查询 GET /jobs/<id>，详见 README)。\n"
+                             "此时 -d/-c/-t/-e/--book-all/--max-retries/--retry-delay 作为任务的默认值，-st 不再使用。")
+    parser.add_argument("--api-port", type=int, default=DEFAULT_API_PORT,
+                        help=f"守护进程任务接口的 HTTP 端口，默认为 {DEFAULT_API_PORT}。")
+    parser.add_argument("--api-host", default=DEFAULT_API_HOST,
+                        help=f"守护进程任务接口的监听地址，默认为 {DEFAULT_API_HOST}。")
+    parser.add_argument("--job-db",
+                        help="守护进程的任务库 (SQLite 文件)。指定后任务在重启后恢复，每天重复的任务继续排队；\n"
+                             "默认只保存在内存中。")
+    parser.add_argument("--api-socket",
+                        help="改为在该路径的 Unix socket 上提供任务接口 (权限 0600，只有当前用户可以提交任务)。")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="日志级别，默认为 INFO。DEBUG 会输出逐场地明细与完整的预约响应 JSON。")
+    parser.add_argument("--debug-in-window", action="store_true",
+                        help="放号关键窗口内 (触发后的预约逻辑) 也输出 DEBUG 日志。\n"
+                             "默认关闭，以免详细输出拖慢关键路径。")
+    return parser
+
+# --- 主程序 ---
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
+
+    # 日志由后台线程写出；退出 (包括 exit() 与 Ctrl+C) 时写完队列中剩余的日志
+    atexit.register(setup_logging(getattr(logging, args.log_level)).stop)
+
+    # 参数解析完成后才导入网络相关的模块 (requests/urllib3 等)，--help 与参数错误可以立即返回
+    from .booking import (BookingRetryPolicy, RequestHedger, accounts_finished, assign_slots_to_accounts,
+                          book_for_accounts, load_prefetched_slots, make_accounts, prefetch_slot_identifiers,
+                          print_account_stats, save_prefetched_slots)
+    from .client import BookingClient, RequestBudget, build_headers
+    from .match import SlotDiffEngine, build_preference_index, find_ranked_slots_in_events
+    from .search import POLL_AUTH_ERROR, PollRateController, SearchCoalescer, get_slot_details
+    from .tokens import TokenManager, describe_token
+    from .tracing import PhaseTracer, begin_attempt, install_tracer, start_metrics_server
+    from .warmup import (ConnectionKeeper, estimate_server_clock_offset, print_clock_calibration, print_warmup_report,
+                         warm_up_client)
+    from .watch import TargetWatcher, load_targets, watch_targets
+
+    # --- Token 决策逻辑 ---
+    token_manager = TokenManager(args.token or [], token_file=args.token_file)
+    if args.token:
+        auth_tokens = token_manager.current()
+        token_source = "命令行提供" + (f", 监视 {args.token_file}" if args.token_file else "")
+    elif token_manager.current():
+        auth_tokens = token_manager.current()
+        token_source = f"Token 文件 {args.token_file}"
+    elif DEFAULT_AUTH_TOKEN:
+        auth_tokens = [DEFAULT_AUTH_TOKEN]
+        token_manager.tokens = list(auth_tokens)
+        token_source = "内置默认"
+        log.warning("[!] 警告: 正在使用内置的默认 Token，它可能已过期或无效。")
+    else:
+        log.error("[!] 错误：必须通过 --token 或 --token-file 参数提供一个有效的认证 Token！")
+        exit(1)
+    auth_token = auth_tokens[0] # --prefetch-only 使用第一个账号的 Token；定时运行时以 token_manager 的当前值为准
+
+    # 未指定 -d 时目标日期相对下一次触发计算，之后每次触发前重新计算 (而不是固定为启动当天的“明天”)
+    target_date = args.date or rolled_target_date(next_trigger_epoch(args.schedule_time))
+    preferred_times = args.time
+    preferred_courts = args.court
+    event_id = args.event
+    book_all_mode = args.book_all
+    schedule_time = args.schedule_time
+    spin_seconds = max(0.0, args.spin_ms) / 1000.0
+    calibrate_samples = max(0, args.calibrate_samples)
+    calibrate_lead = max(0.0, args.calibrate_lead)
+    warmup_seconds = max(0.0, args.warmup_seconds)
+    keepalive_interval = max(0.5, args.keepalive_interval)
+    speculative_mode = args.speculative
+    prefetch_lead = max(0.0, args.prefetch_lead)
+    prefetch_cache = args.prefetch_cache
+    adaptive_delay = args.adaptive_delay
+    min_delay = max(0.0, args.min_delay)
+    max_delay = max(min_delay, args.max_delay)
+    critical_window = max(0.0, args.critical_window)
+    max_retries = args.max_retries
+    retry_delay = args.retry_delay
+    booking_window = args.booking_window if args.booking_window is not None else max(1, max_retries) * retry_delay
+    pool_size = args.pool_size
+    concurrency = max(1, args.concurrency)
+    top_n = args.top_n
+    batch_size = max(1, args.batch_size)
+    hedge_percentile = max(0.0, min(100.0, args.hedge_percentile))
+    targets = None
+    if args.targets:
+        try:
+            targets = load_targets(args.targets, target_date, preferred_courts, preferred_times, book_all_mode)
+        except (OSError, json.JSONDecodeError) as e:
+            log.error(f"[!] 错误：无法读取目标列表 {args.targets}: {e}")
+            exit(1)
+    max_workers = max(1, args.max_workers)
+    request_budget = max(0.0, args.request_budget)
+    search_ttl = None if args.no_search_coalesce else max(0.0, args.search_ttl_ms) / 1000.0
+    tracer = None
+    if args.trace_file or args.metrics_port:
+        tracer = PhaseTracer(args.trace_file)
+        install_tracer(tracer)
+        atexit.register(tracer.close) # 包括 Ctrl+C 退出时也把追踪文件写完整
+    history = None
+    if args.history_file:
+        from .history import SlotHistoryRecorder
+        try:
+            history = SlotHistoryRecorder(args.history_file)
+        except (OSError, ValueError) as e:
+            log.error(f"[!] 错误：无法打开时段历史文件 {args.history_file}: {e}")
+            exit(1)
+        atexit.register(history.close) # 退出时写完缓冲中的记录
+
+    # --- 打印启动信息 (更新，加入重试信息) ---
+    log.info(f"--- 预约脚本 ({date.today()}) ---")
+    log.info(f"[*] 目标日期: {target_date}{'' if args.date else ' (随每次触发滚动为触发日的第二天)'}")
+    log.info(f"[*] 偏好场地: {', '.join(preferred_courts)}")
+    log.info(f"[*] 偏好时段: {', '.join(preferred_times)}")
+    log.info(f"[*] Event ID: {event_id}")
+    log.info(f"[*] 计划执行时间 (北京时间): {schedule_time}")
+    log.info(f"[*] 预约模式: {'尝试预约所有找到的可用偏好' if book_all_mode else '预约找到的第一个可用偏好后停止'}")
+    log.info(f"[*] 失败重试: 最多 {max_retries} 次尝试, 间隔 {retry_delay} 秒") # 显示重试配置
+    if args.release_time:
+        log.info(f"[*] 放号时间 (北京时间): {args.release_time}")
+    if adaptive_delay:
+        log.info(f"[*] 自适应轮询: 间隔 {min_delay}~{max_delay} 秒, 放号前后 {critical_window} 秒内全速")
+    log.info(f"[*] 连接池大小: {pool_size}")
+    log.info(f"[*] 并发预约: 上限 {concurrency} 个请求, 候选数 {'全部' if top_n <= 0 else top_n}")
+    if batch_size > 1:
+        log.info(f"[*] 合并预约: --book-all 模式下同一场地相邻的时段每 {batch_size} 个合并为一个请求")
+    if hedge_percentile:
+        log.info(f"[*] 对冲请求: 预约超过第 {hedge_percentile:g} 百分位延迟 (至少 {args.hedge_min_ms:g} ms) 未响应时再发一份")
+    log.info(f"[*] 使用 Token 来源: {token_source}")
+    for token in auth_tokens:
+        log.info(f"[*] 使用 Token: {describe_token(token)}")
+    if targets:
+        log.info(f"[*] 多目标监视: {len(targets)} 个目标, 并发 {max_workers}, 请求预算 {request_budget or '不限'} 次/秒")
+        if search_ttl is not None:
+            log.info(f"[*] 查询合并: 同一 (eventId, 日期) 的并发查询共用一个请求, 结果缓存 {search_ttl * 1000:g} ms")
+        for target in targets:
+            log.info(f"[*]   {target['date']} {target['event']} 场地 {', '.join(target['courts'])} 时段 {', '.join(target['times'])}")
+    if args.trace_file:
+        log.info(f"[*] 阶段耗时追踪: 写入 {args.trace_file}")
+    if history:
+        log.info(f"[*] 时段历史: 状态变化追加写入 {args.history_file}")
+    if args.metrics_port:
+        start_metrics_server(tracer, args.metrics_port, args.metrics_host)
+        log.info(f"[*] 指标端点: http://{args.metrics_host}:{args.metrics_port}/metrics")
+    if len(auth_tokens) > 1:
+        log.info(f"[*] 多账号模式: {len(auth_tokens)} 个账号共享一个查询轮询器，各自预约不同的候选时段")
+
+    # --- 守护进程模式：任务由本地接口提交，不再按 -st 每天触发 ---
+    if args.daemon:
+        from .daemon import BookingDaemon, start_api_server
+        from .jobstore import JobStore
+        daemon = BookingDaemon(
+            token_manager,
+            JobStore(args.job_db) if args.job_db else None,
+            defaults={"event": event_id, "courts": preferred_courts, "times": preferred_times, "book_all": book_all_mode,
+                      "top_n": max(0, top_n), "max_retries": max(1, max_retries), "retry_delay": retry_delay},
+            pool_size=pool_size, concurrency=concurrency, batch_size=batch_size, hedge_percentile=hedge_percentile,
+            hedge_min_ms=args.hedge_min_ms, request_budget=request_budget, search_ttl=search_ttl, history=history,
+            spin_seconds=spin_seconds, warmup_seconds=warmup_seconds, keepalive_interval=keepalive_interval,
+            calibrate_samples=calibrate_samples, calibrate_lead=calibrate_lead)
+        daemon.start()
+        server = start_api_server(daemon, args.api_host, args.api_port, args.api_socket)
+        api_address = f"unix:{args.api_socket}" if args.api_socket else f"http://{args.api_host}:{args.api_port}"
+        log.info(f"[*] 守护进程已就绪，任务接口: {api_address} (POST /jobs 提交任务, GET /status 查看状态)")
+        try:
+            # 守护进程随时可能触发，整个运行期间都按关键窗口处理日志级别
+            with critical_window_logging(args.debug_in_window):
+                while True:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            log.info("\n[*] 收到 Ctrl+C，守护进程退出。")
+        finally:
+            server.shutdown()
+            server.server_close()
+            if args.api_socket:
+                os.unlink(args.api_socket)
+            daemon.stop()
+        exit(0)
+
+    # --- 只预取时段标识 (例如前一天运行) ---
+    if args.prefetch_only:
+        if not prefetch_cache:
+            log.error("[!] 错误：--prefetch-only 需要同时指定 --prefetch-cache 文件路径！")
+            exit(1)
+        prefetched = prefetch_slot_identifiers(target_date, event_id, auth_token, preferred_courts, preferred_times)
+        if not prefetched:
+            log.warning("[!] 未能预取任何时段标识。")
+            exit(1)
+        save_prefetched_slots(prefetch_cache, target_date, event_id, prefetched)
+        log.info(f"[+] 已缓存 {len(prefetched)} 个时段标识到 {prefetch_cache}")
+        exit(0)
+
+    # 偏好索引只构建一次，每次轮询只需一次线性扫描
+    preference_index = build_preference_index(preferred_courts, preferred_times)
+
+    # 验证 max_retries
+    if max_retries < 1:
+        log.warning("[!] 警告: max_retries 小于 1，将至少执行 1 次尝试。")
+        max_retries = 1
+
+    # --- 实际执行预约的函数 (引入重试逻辑) ---
+    def run_booking(client, speculative_slots=None, release_epoch=None):
+        # 获取北京时间 (UTC+8)
+        beijing_time_start = datetime.now(timezone(timedelta(hours=8)))
+        log.info(f"\n--- 开始执行预约逻辑 ({beijing_time_start.strftime('%Y-%m-%d %H:%M:%S %Z%z')}) ---")
+
+        attempts = 0
+        booking_successful_overall = False # 标记是否所有账号都已预约成功
+
+        # 每次执行独立统计各账号的预约情况；单账号时就是一个账号 (Token 取 token_manager 的当前值)
+        accounts = make_accounts(token_manager.current())
+        try:
+            build_headers(accounts[0]['token'])
+        except ValueError as e:
+            log.error(f"[!] 错误: {e}")
+            log.info(f"--- 本次预约逻辑执行因 Token 错误而中止 ---")
+            return # 无法构建 headers，直接中止
+
+        # client 是调度循环为这次触发建好 (并已预热) 的连接池，查询与预约都复用 keep-alive 连接，由调度循环负责关闭
+        conn_stats_before = client.connection_stats()
+        slot_differ = SlotDiffEngine() # 每次执行独立的轮询快照
+        rate_controller = None
+        if adaptive_delay:
+            rate_controller = PollRateController(
+                release_epoch if release_epoch is not None else time.time(),
+                retry_delay,
+                min_delay=min_delay,
+                max_delay=max_delay,
+                critical_window=critical_window
+            )
+        # 按预约错误类别决定重试节奏；有 Token 文件时认证失败的账号可在 Token 更新后恢复
+        retry_policy = BookingRetryPolicy(retry_delay, release_epoch=release_epoch, min_delay=min_delay, max_delay=max_delay)
+        recoverable = ("auth",) if token_manager.token_file else ()
+
+        # 推测预约：直接使用预取的时段标识发送预约，省去一次查询往返
+        if speculative_slots:
+            log.info(f"\n--- 推测预约: 直接预约 {len(speculative_slots)} 个预取的时段 (跳过查询) ---")
+            speculative_results = book_for_accounts(
+                assign_slots_to_accounts(speculative_slots, accounts),
+                event_id,
+                client,
+                concurrency=concurrency,
+                top_n=top_n,
+                book_all=book_all_mode,
+                batch_size=batch_size
+            )
+            if any(outcome for _, _, outcome, _ in speculative_results):
+                log.info("\n[***] 推测预约成功！ ***")
+            booking_successful_overall = all(account['successes'] for account in accounts)
+            if not booking_successful_overall:
+                log.info("[-] 推测预约未全部成功 (标识可能已过期或时段已被抢)，回退到正常的 查询-预约 流程。")
+                # 例如服务器提示尚未放号时，先等到放号时刻再开始查询
+                delay = retry_policy.next_delay([outcome for _, _, outcome, _ in speculative_results], 0.0)
+                if delay > 0:
+                    time.sleep(delay)
+
+        while attempts < max_retries and not booking_successful_overall:
+            # Token 文件更新后立即换上新 Token；全部过期则不再无谓地重试
+            token_manager.apply(accounts)
+            if token_manager.all_expired():
+                log.error("[!] 所有 Token 均已过期，停止重试。请更新 Token 文件或重新运行。")
+                break
+            # 剩下的账号都遇到了无法重试的错误 (认证失败、超过预约上限、payload 错误)，继续只会浪费请求
+            if accounts_finished(accounts, recoverable):
+                log.error("[!] 所有未成功的账号都遇到了无法重试的错误，停止重试。")
+                break
+            base_headers = build_headers(accounts[0]['token'])
+            attempts += 1
+            begin_attempt()
+            if attempts > 1:
+                log.info("\n--- 第 %d/%d 次尝试 ---", attempts, max_retries)
+            else:
+                 log.info("\n--- 第 %d/%d 次尝试 ---", attempts, max_retries) # 首次尝试也打印计数
+
+            successful_bookings_this_attempt = 0
+            poll_info = {}
+            booking_outcomes = []
+            try:
+                # 1. 查询时段信息 (每次重试都重新查询；多账号也只查询一次)
+                slot_details_data = get_slot_details(target_date, event_id, base_headers, client=client,
+                                                     wanted_courts=preferred_courts, poll_info=poll_info)
+
+                if slot_details_data:
+                    # 2. 与上一次轮询对比，只在新变为可约的时段中按偏好排名查找
+                    slot_events = slot_differ.diff(slot_details_data)
+                    if slot_events:
+                        event_counts = {}
+                        for event in slot_events:
+                            event_counts[event.kind] = event_counts.get(event.kind, 0) + 1
+                        log.info("[*] 时段变化: %s", ", ".join(f"{kind} {count}" for kind, count in sorted(event_counts.items())))
+                    else:
+                        log.info("[*] 时段状态与上次轮询相比无变化。")
+                    available_preferred_slots = find_ranked_slots_in_events(
+                        slot_events,
+                        target_date,
+                        preference_index
+                    )
+
+                    if available_preferred_slots:
+                        log.info("[***] 找到 %d 个满足偏好的可预约时段，将尝试预约...", len(available_preferred_slots))
+                        # 3. 候选时段分给尚未成功的账号 (互不重复)，各账号并发预约
+                        booking_results = book_for_accounts(
+                            assign_slots_to_accounts(available_preferred_slots, accounts),
+                            event_id,
+                            client,
+                            concurrency=concurrency,
+                            top_n=top_n,
+                            book_all=book_all_mode,
+                            batch_size=batch_size
+                        )
+                        booking_outcomes = [outcome for _, _, outcome, _ in booking_results]
+                        successful_bookings_this_attempt = sum(1 for outcome in booking_outcomes if outcome)
+                        # 认证失败时立即检查 Token 文件，不等下一个检查间隔
+                        if any(outcome.reason == "auth" for outcome in booking_outcomes):
+                            token_manager.reload(force=True)
+                        # 未成功 (或未发出) 的候选从快照中移除，下次轮询若仍可约会再次尝试
+                        booked_ids = {slot['bookSlotId'] for _, slot, outcome, _ in booking_results if outcome}
+                        for slot in available_preferred_slots:
+                            if slot['bookSlotId'] not in booked_ids:
+                                slot_differ.forget(slot['bookSlotId'])
+                        booked_in_this_round = successful_bookings_this_attempt > 0 # 特指在当前找到的这批 slots 中是否成功
+                        booking_successful_overall = all(account['successes'] for account in accounts) # 标记全局成功
+                        if booked_in_this_round and not book_all_mode and booking_successful_overall:
+                            log.info("\n*** 已成功预约一个时段，停止本次尝试。 ***")
+
+                        if book_all_mode and booked_in_this_round:
+                            log.info("\n*** 本轮尝试预约所有找到的可用时段，成功 %d 个。***", successful_bookings_this_attempt)
+                            # 在 book_all 模式下，只要有成功，也算整体成功了
+                        elif not booked_in_this_round and available_preferred_slots:
+                             log.info("[-] 本轮尝试预约找到的时段均失败。")
+
+                        # 如果是非 book_all 模式且已成功预约，则跳出重试循环
+                        if not book_all_mode and booking_successful_overall:
+                             break # 跳出 while attempts < max_retries 循环
+
+                    # else: # 未找到可用偏好时段，函数内部已打印信息
+                    #     print("[-] 未找到满足偏好的可预约时段。") # 可以在这里加一句总结
+                        pass
+                else:
+                    log.warning("[!] 获取场地信息失败，可能是网络或 Token 问题。")
+                    # 认证错误时立即检查 Token 文件，不等下一个检查间隔
+                    if poll_info.get('error') == POLL_AUTH_ERROR:
+                        token_manager.reload(force=True)
+                    # if "Token" in last_error_message: # 伪代码
+                    #    break
+
+            except Exception as e:
+                log.error(f"\n!!! 第 {attempts} 次尝试执行时遇到意外错误: {e}", exc_info=True)
+                # 发生未知异常，也计为一次失败尝试
+
+            # --- 重试判断与延时 ---
+            if not booking_successful_overall and attempts < max_retries and not accounts_finished(accounts, recoverable):
+                delay = rate_controller.next_delay(poll_info) if rate_controller else retry_delay
+                delay = retry_policy.next_delay(booking_outcomes, delay)
+                log.info("[*] 第 %d 次尝试未完全成功，将在 %.3f 秒后重试...", attempts, delay)
+                time.sleep(delay)
+            elif booking_successful_overall:
+                 log.info("\n[***] 预约成功！停止重试。 ***")
+                 # 不需要 break，因为 while 条件 `not booking_successful_overall` 会变为 false
+            elif attempts == max_retries:
+                 log.info(f"\n[---] 已达到最大重试次数 ({max_retries})，仍未预约成功。 ---")
+
+
+        # --- 单次调度任务的最终收尾 ---
+        if client.hedger:
+            client.hedger.settle() # 晚到的对冲请求返回后才知道有没有重复预约
+        print_account_stats(accounts)
+        if retry_policy.counts:
+            log.info(f"[*] 预约错误分类: {retry_policy.summary()}")
+        if client.hedger:
+            client.hedger.report()
+        conn_stats = client.connection_stats()
+        opened_in_window = conn_stats['opened'] - conn_stats_before['opened']
+        requests_in_window = conn_stats['requests'] - conn_stats_before['requests']
+        log.info(f"[*] 连接统计: 本次共 {requests_in_window} 次请求, 新建连接 {opened_in_window} 个, "
+              f"复用连接 {max(0, requests_in_window - opened_in_window)} 次")
+        beijing_time_end = datetime.now(timezone(timedelta(hours=8)))
+        log.info(f"--- 本次预约逻辑执行结束 ({beijing_time_end.strftime('%Y-%m-%d %H:%M:%S %Z%z')}) ---")
+        # run_booking 函数自然结束，等待下一次触发
+
+    # --- 精确定时执行 run_booking 函数 ---
+    log.info(f"[*] 脚本已启动，将在每天北京时间 {schedule_time} 精确触发预约 (最后 {spin_seconds * 1000:.0f} ms 忙等)...")
+
+    while True:
+        trigger_epoch = next_trigger_epoch(schedule_time)
+        trigger_display = datetime.fromtimestamp(trigger_epoch, BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        # 放号时刻取离本次触发最近的那一次 (前后 12 小时内)，没有指定时就是触发时刻
+        release_epoch = next_trigger_epoch(args.release_time, trigger_epoch - 12 * 3600) if args.release_time else trigger_epoch
+        if not args.date and rolled_target_date(trigger_epoch) != target_date:
+            target_date = rolled_target_date(trigger_epoch)
+            log.info(f"[*] 下一次触发 ({trigger_display}) 的目标日期: {target_date}")
+            if targets:
+                try:
+                    targets = load_targets(args.targets, target_date, preferred_courts, preferred_times, book_all_mode)
+                except (OSError, json.JSONDecodeError) as e:
+                    log.warning(f"[!] 重新读取目标列表失败，继续使用上一次的目标: {e}")
+        # 对冲请求需要第二条连接，连接池按两倍的并发预约数准备
+        client = BookingClient(pool_size=max(pool_size, concurrency * len(auth_tokens) * (2 if hedge_percentile else 1),
+                                             max_workers if targets else 0))
+        if hedge_percentile:
+            client.hedger = RequestHedger(hedge_percentile, min_delay=args.hedge_min_ms / 1000.0)
+        client.history = history
+        prepared = {"keeper": None, "speculative_slots": None, "clock_offset": 0.0}
+        window_end = trigger_epoch + booking_window
+        # 提前提醒：此时更新 Token 文件还来得及
+        for token, exp in token_manager.expiring_before(window_end):
+            log.warning(f"[!] Token {describe_token(token)} 会在本次预约窗口结束 "
+                        f"({datetime.fromtimestamp(window_end, BEIJING_TZ).strftime('%m-%d %H:%M:%S')}) 前过期，"
+                        f"请在触发前更新{' Token 文件' if token_manager.token_file else ' Token'}。")
+
+        def warm_up_stage():
+            # 固定 DNS、打开连接池，并在触发前持续保活
+            log.info(f"[*] 正在预热连接 ({client.pool_size} 个)...")
+            print_warmup_report(warm_up_client(client, target_date=target_date, event_id=event_id, auth_token=token_manager.current()[0]))
+            prepared["keeper"] = ConnectionKeeper(client, interval=keepalive_interval, stop_at=trigger_epoch)
+            prepared["keeper"].start()
+
+        def prefetch_stage():
+            # 预取时段标识；查询失败时回退到缓存文件
+            slots = prefetch_slot_identifiers(target_date, event_id, token_manager.current()[0], preferred_courts, preferred_times, client=client)
+            if slots and prefetch_cache:
+                save_prefetched_slots(prefetch_cache, target_date, event_id, slots)
+            elif not slots and prefetch_cache:
+                slots = load_prefetched_slots(prefetch_cache, target_date, event_id)
+            log.info(f"[*] 推测预约: 已准备 {len(slots)} 个时段标识")
+            prepared["speculative_slots"] = slots
+
+        def calibrate_stage():
+            log.info(f"[*] 正在校准服务器时钟 ({calibrate_samples} 次采样)...")
+            # 必须在触发前的 Token 检查之前结束，采样来不及时用已有的样本
+            calibration = estimate_server_clock_offset(client, calibrate_samples,
+                                                       deadline=trigger_epoch - TOKEN_CHECK_LEAD - CALIBRATION_MARGIN)
+            print_clock_calibration(calibration)
+            if calibration:
+                prepared["clock_offset"] = calibration['offset']
+
+        # 触发前的准备阶段按提前量从大到小依次执行
+        stages = []
+        if warmup_seconds:
+            stages.append((warmup_seconds, "连接预热", warm_up_stage))
+        if speculative_mode:
+            stages.append((prefetch_lead, "预取时段标识", prefetch_stage))
+        if calibrate_samples:
+            stages.append((calibrate_lead, "时钟校准", calibrate_stage))
+        for lead, stage_name, stage in sorted(stages, key=lambda item: -item[0]):
+            wait_until(trigger_epoch - lead, spin_seconds=0, label=f"{trigger_display} ({stage_name})")
+            stage()
+
+        # 服务器时间 = 本机时间 + clock_offset，因此本机应在 trigger_epoch - clock_offset 时触发
+        clock_offset = prepared["clock_offset"]
+        # 触发前最后检查一次 Token：窗口结束前就会过期的 Token 不值得开始这次预约
+        wait_until(trigger_epoch - clock_offset - TOKEN_CHECK_LEAD, spin_seconds=0, label=f"{trigger_display} (Token 检查)")
+        token_manager.reload(force=True)
+        expiring = token_manager.expiring_before(window_end)
+        keeper = prepared["keeper"]
+        if expiring:
+            if keeper:
+                keeper.stop()
+            for token, exp in expiring:
+                log.error(f"[!] Token {describe_token(token)} 会在预约窗口结束前过期，拒绝开始本次预约。")
+            wait_until(trigger_epoch - clock_offset, spin_seconds=0, label=trigger_display) # 等过触发时刻，下一轮安排到明天
+            client.close()
+            continue
+        drift = wait_until(trigger_epoch - clock_offset, spin_seconds, label=trigger_display)
+        if keeper:
+            keeper.stop()
+        log.info(f"[*] 已触发: 目标 {trigger_display} (服务器时钟), 实际偏差 {drift * 1000:+.3f} ms, 时钟修正 {clock_offset * 1000:+.1f} ms")
+        if targets:
+            if request_budget:
+                client.budget = RequestBudget(request_budget)
+            if search_ttl is not None:
+                client.search_cache = SearchCoalescer(search_ttl)
+            with critical_window_logging(args.debug_in_window):
+                recoverable = ("auth",) if token_manager.token_file else ()
+                watch_targets([TargetWatcher(target, token_manager.current(), recoverable) for target in targets], client,
+                              max_workers=max_workers, max_rounds=max_retries, delay=retry_delay, concurrency=concurrency,
+                              token_manager=token_manager, batch_size=batch_size)
+            client.budget = None
+            client.search_cache = None
+        else:
+            with critical_window_logging(args.debug_in_window):
+                run_booking(client, prepared["speculative_slots"], release_epoch=release_epoch - clock_offset)
+        if keeper:
+            log.info(f"[*] 预热保活: 共发送 {keeper.pings} 次保活请求")
+        client.close()
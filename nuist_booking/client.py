@@ -0,0 +1,181 @@
+"""共享 HTTP 客户端：keep-alive 连接池、固定 IP、全局请求预算与请求头"""
+import socket
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .config import BASE_URL, DEFAULT_EVENT_ID, DEFAULT_POOL_SIZE
+from .tracing import record_connect, record_span
+
+# --- 带计时的连接类 ---
+class TimedHTTPConnection(HTTPConnection):
+    """新建 TCP 连接时记录 connect span (未固定 IP 时包含 DNS 解析)"""
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        record_connect(time.perf_counter() - started, host=self.host)
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """同上，https 连接的 connect span 还包含 TLS 握手"""
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        record_connect(time.perf_counter() - started, host=self.host, tls=True)
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+# --- 共享 HTTP 客户端 (连接池) ---
+class BookingClient:
+    """
+    整个 run_booking 期间共享的 HTTP 客户端。
+    searchByDate 和 afterConfirm 都走同一个 requests.Session，
+    keep-alive 连接会被复用，避免每次轮询/预约都重新建立 TCP 连接。
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self.session = requests.Session()
+        # Cookie 由 build_headers 显式给出，不让 Session 保存服务器下发的 Cookie 覆盖 token
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # 只访问一个主机，pool_connections=1 即可；pool_maxsize 决定同时保持的连接数
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        # 换成带计时的连接类，新建连接时记录 connect span
+        self.adapter.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.budget = None # 可选的全局请求预算 (RequestBudget)，所有请求发出前都要先取得额度
+        self.hedger = None # 可选的对冲请求 (RequestHedger)，预约请求经由它发送
+        self.search_cache = None # 可选的查询合并 (SearchCoalescer)，由 get_slot_details 使用
+        self.history = None # 可选的时段历史记录 (SlotHistoryRecorder)，每次成功的查询结果都交给它
+        self.pinned_origin = None # 例如 http://wechatmeeting.nuist.edu.cn
+        self.pinned_address = None # 例如 http://1.2.3.4
+        self.pinned_host = None
+
+    def pin_host(self, base_url=None):
+        """
+        预先解析 base_url 的域名并固定使用解析出的 IP，后续请求不再经过 DNS。
+        仅对 http 生效 (https 需要用域名校验证书)。
+        Returns:
+            str: 解析出的 IP；无法固定时返回 None。
+        """
+        parts = urlsplit(base_url or BASE_URL)
+        if parts.scheme != "http" or not parts.hostname:
+            return None
+        port = parts.port or 80
+        started = time.perf_counter()
+        infos = socket.getaddrinfo(parts.hostname, port, socket.AF_INET, socket.SOCK_STREAM)
+        record_span("dns", time.perf_counter() - started, host=parts.hostname)
+        if not infos:
+            return None
+        ip = infos[0][4][0]
+        self.pinned_origin = f"{parts.scheme}://{parts.netloc}"
+        self.pinned_address = f"{parts.scheme}://{ip}" + (f":{parts.port}" if parts.port else "")
+        self.pinned_host = parts.netloc
+        return ip
+
+    def _prepare(self, url, kwargs):
+        """若已固定 IP，则把 URL 中的域名替换为 IP，并保证 Host 头仍为原域名"""
+        if self.pinned_origin and url.startswith(self.pinned_origin):
+            url = self.pinned_address + url[len(self.pinned_origin):]
+            headers = dict(kwargs.get('headers') or {})
+            headers['Host'] = self.pinned_host
+            kwargs['headers'] = headers
+        return url, kwargs
+
+    def post(self, url, **kwargs):
+        """与 requests.post 用法一致，但复用连接池"""
+        if self.budget:
+            self.budget.acquire()
+        url, kwargs = self._prepare(url, kwargs)
+        return self.session.post(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """轻量 HEAD 请求 (用于时钟校准等)，同样复用连接池"""
+        if self.budget:
+            self.budget.acquire()
+        url, kwargs = self._prepare(url, kwargs)
+        return self.session.head(url, **kwargs)
+
+    def connection_stats(self):
+        """
+        统计连接的新建与复用次数。
+        Returns:
+            dict: {"opened": 新建连接数, "reused": 复用已有连接的请求数, "requests": 总请求数}
+        """
+        opened = 0
+        total_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            total_requests += pool.num_requests
+        return {"opened": opened, "reused": max(0, total_requests - opened), "requests": total_requests}
+
+    def close(self):
+        if self.hedger:
+            self.hedger.close()
+        self.session.close()
+
+# --- 全局请求预算 ---
+class RequestBudget:
+    """
+    令牌桶：整个进程每秒最多发出 rate 个请求 (允许 burst 个突发)。
+    多个目标共享一个 BookingClient 时，用它限制对服务器的总请求量。
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.perf_counter()
+        self.waited = 0.0 # 因预算不足累计等待的秒数
+        self.granted = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个请求额度，额度不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.perf_counter()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.granted += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+# --- 请求头 ---
+def build_headers(token):
+    """根据传入的 token 构建请求头"""
+    if not token:
+        raise ValueError("Token 不能为空！")
+    return {
+        'Host': 'wechatmeeting.nuist.edu.cn',
+        'Connection': 'keep-alive',
+        # 'Content-Length': '...', # 通常由 requests 自动处理
+        'User-Agent': 'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Mobile Safari/537.36 MicroMessenger/8.0.51 PythonAutomationScript/1.0',
+        'Accept': 'application/json, text/plain, */*',
+        'Content-Type': 'application/json',
+        'Origin': BASE_URL,
+        'X-Requested-With': 'com.tencent.mm',
+        # 'Sec-Fetch-Site': 'same-origin', # 可选
+        # 'Sec-Fetch-Mode': 'cors', # 可选
+        # 'Sec-Fetch-Dest': 'empty', # 可选
+        'Referer': f'{BASE_URL}/wechat/book3/book.html?type=eventInfo?eventId={DEFAULT_EVENT_ID}', # 会在需要时被覆盖
+        'Accept-Encoding': 'gzip, deflate',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+        'Cookie': f'token={token}' # 注意：实际应用中 Cookie 可能更复杂
+    }
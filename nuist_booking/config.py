@@ -0,0 +1,46 @@
+"""运行参数的默认值与常量 (只依赖标准库，导入开销可以忽略)"""
+import os
+from datetime import date, timedelta, timezone
+
+BASE_URL = os.environ.get("NUIST_BASE_URL", "http://wechatmeeting.nuist.edu.cn") # 可指向 mock_server.py 做本地测试
+DEFAULT_EVENT_ID = "b8d2f7e00603f0f5af4de278c0b461b8"
+# 注意：Token 会过期，运行时请替换或确保命令行提供
+DEFAULT_AUTH_TOKEN = "" # 建议默认留空，强制命令行提供或提示
+DEFAULT_TARGET_DATE = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+DEFAULT_SCHEDULE_TIME = "08:04" # 默认执行时间，根据实际调整
+DEFAULT_MAX_RETRIES = 1000        # 新增：默认最大重试次数
+DEFAULT_RETRY_DELAY = 0.5        # 新增：默认重试间隔（秒）
+DEFAULT_POOL_SIZE = 4            # 连接池大小 (同一主机保持的 keep-alive 连接数)
+DEFAULT_CONCURRENCY = 4          # 同时发出的预约请求上限
+DEFAULT_BATCH_SIZE = 1           # 一个预约请求里最多合并几个相邻时段 (1 表示不合并)
+DEFAULT_SPIN_MS = 20             # 触发前最后多少毫秒改为忙等 (spin-wait)
+DEFAULT_CALIBRATION_SAMPLES = 8  # 服务器时钟校准的采样次数
+DEFAULT_CALIBRATION_LEAD = 30    # 触发前多少秒进行时钟校准
+CALIBRATION_MARGIN = 0.5         # 时钟校准最晚在触发 (一次性运行时为触发前的 Token 检查) 前这么多秒结束
+DEFAULT_WARMUP_SECONDS = 60      # 触发前多少秒开始预热连接
+DEFAULT_KEEPALIVE_INTERVAL = 5   # 预热后保活请求的间隔（秒）
+DEFAULT_PREFETCH_LEAD = 180      # 推测预约模式下，触发前多少秒预取时段标识
+DEFAULT_MIN_DELAY = 0.05         # 自适应轮询: 放号关键窗口内的最小间隔（秒）
+DEFAULT_MAX_DELAY = 3.0          # 自适应轮询: 远离放号时的最大间隔（秒）
+DEFAULT_CRITICAL_WINDOW = 5.0    # 自适应轮询: 放号前后多少秒内全速轮询
+DEFAULT_FAR_WINDOW = 60.0        # 自适应轮询: 距放号超过多少秒视为 "还远"
+DEFAULT_MAX_WORKERS = 4          # 多目标监视: 同时轮询的目标数上限
+DEFAULT_REQUEST_BUDGET = 10.0    # 多目标监视: 全局每秒请求数上限
+DEFAULT_HEDGE_MIN_MS = 20.0      # 对冲请求: 最短等待时间（毫秒）
+DEFAULT_HEDGE_INITIAL_DELAY = 0.3 # 对冲请求: 延迟样本不足时的等待时间（秒）
+HEDGE_MIN_SAMPLES = 5            # 对冲请求: 至少有这么多延迟样本才按百分位计算
+HEDGE_SAMPLE_WINDOW = 200        # 对冲请求: 只保留最近这么多个延迟样本
+HEDGE_SETTLE_TIMEOUT = 15.0      # 对冲请求: 汇总前最多等这么久，让先到一份成功后晚到的另一份返回 (与预约请求的超时相同)
+DEFAULT_SEARCH_TTL_MS = 20.0     # 查询合并: 成功的查询结果缓存多少毫秒
+DEFAULT_HISTORY_BUFFER = 4096    # 时段历史: 缓冲这么多条记录后写盘
+DEFAULT_HISTORY_FLUSH_INTERVAL = 5.0 # 时段历史: 距上次写盘超过这么多秒时，下一次记录顺便写盘
+DEFAULT_HISTORY_QUEUE = 256      # 时段历史: 最多这么多个查询结果等待后台线程处理，队列满时丢弃新的结果
+DEFAULT_TOKEN_CHECK_INTERVAL = 2.0 # --token-file 的检查间隔（秒）
+TOKEN_CHECK_LEAD = 1.0             # 触发前多少秒做最后一次 Token 有效期检查
+DEFAULT_METRICS_HOST = "127.0.0.1" # Prometheus 指标端点默认只监听本机
+DEFAULT_API_HOST = "127.0.0.1"     # 守护进程: 任务接口默认只监听本机
+DEFAULT_API_PORT = 8765            # 守护进程: 任务接口的默认端口
+DEFAULT_ARM_LEAD = 1.0             # 守护进程: 触发前多少秒锁定这一批任务并进入精确等待
+DEFAULT_RECALIBRATE_INTERVAL = 600.0 # 守护进程: 时钟校准结果超过多少秒视为过时，触发前重新校准
+FIRE_GROUP_WINDOW = 0.005          # 守护进程: 触发时刻相差不到这么多秒的任务一起触发
+BEIJING_TZ = timezone(timedelta(hours=8))
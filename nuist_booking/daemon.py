@@ -0,0 +1,503 @@
+"""
+守护进程模式：常驻一个进程，让解释器、连接池与服务器时钟校准一直保持在“热”的状态，
+预约任务 (日期、场地、时段、触发时间) 通过本地 HTTP 或 Unix socket 接口提交，提交本身不占用触发时刻的任何开销。
+
+接口 (请求与响应都是 JSON):
+    GET    /status      守护进程状态 (时钟校准、连接统计、Token、各状态的任务数)
+    GET    /jobs        全部任务 (?status=pending 只列出某个状态)
+    GET    /jobs/<id>   单个任务的状态
+    POST   /jobs        提交任务 (或任务列表)，例如 {"courts": ["场地1"], "times": ["18:00"], "trigger": "08:00:00", "daily": true}
+    DELETE /jobs/<id>   取消尚未触发的任务 (每天重复的任务取消后不再排队)
+    POST   /tokens      换上新 Token，例如 {"tokens": ["eyJ..."]} (与 --token-file 热加载效果相同)
+
+任务保存在 JobStore (SQLite) 中；用 --job-db 指定文件时守护进程重启后任务会继续排队。
+"""
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+from .booking import RequestHedger
+from .client import BookingClient, RequestBudget
+from .config import (BEIJING_TZ, DEFAULT_API_HOST, DEFAULT_ARM_LEAD, DEFAULT_BATCH_SIZE, DEFAULT_CALIBRATION_LEAD,
+                     DEFAULT_CALIBRATION_SAMPLES, DEFAULT_CONCURRENCY, DEFAULT_EVENT_ID, DEFAULT_HEDGE_MIN_MS,
+                     DEFAULT_KEEPALIVE_INTERVAL, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE, DEFAULT_RECALIBRATE_INTERVAL,
+                     DEFAULT_RETRY_DELAY, DEFAULT_SEARCH_TTL_MS, DEFAULT_SPIN_MS, DEFAULT_WARMUP_SECONDS,
+                     FIRE_GROUP_WINDOW)
+from .jobstore import (JOB_ARMED, JOB_CANCELLED, JOB_FAILED, JOB_MISSED, JOB_PENDING, JOB_RUNNING,
+                       JOB_SUCCEEDED, JobStore)
+from .logs import log
+from .search import SearchCoalescer
+from .tokens import describe_token
+from .trigger import (next_trigger_epoch, rolled_target_date, validate_time_format, validate_trigger_time,
+                      wait_until)
+from .warmup import (ConnectionKeeper, estimate_server_clock_offset, print_clock_calibration, print_warmup_report,
+                     warm_up_client)
+from .watch import TargetWatcher, watch_targets
+
+JOB_FIELDS = ("event", "date", "days_ahead", "courts", "times", "trigger", "daily", "book_all", "top_n", "max_retries",
+              "retry_delay")
+
+def _format_epoch(epoch):
+    return datetime.fromtimestamp(epoch, BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def build_job(spec, defaults, now=None):
+    """
+    校验接口提交的任务并补全默认值 (defaults 为守护进程命令行参数给出的 courts/times/event 等)。
+    now 是服务器时钟的当前时刻 (本机时间 + 时钟修正)，立即触发的任务以它作为 next_fire，与定时任务同一基准。
+    没有 trigger 时立即触发；没有 date 时每次触发都预约触发当天 (北京时间) 之后第 days_ahead 天 (默认 1，即“明天”)。
+    daily 为 true 时每次执行完按 trigger 排到第二天再次触发 (目标日期随之前进)，此时不能指定固定的 date。
+    Raises:
+        ValueError: 字段缺失或格式错误，消息可直接返回给调用方。
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("任务必须是 JSON 对象")
+    unknown = sorted(set(spec) - set(JOB_FIELDS))
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    job = dict(defaults)
+    job.update({key: value for key, value in spec.items() if value is not None})
+
+    if not isinstance(job.get('event'), str) or not job['event']:
+        raise ValueError("event 必须是非空字符串")
+    for key in ("courts", "times"):
+        if not isinstance(job.get(key), list) or not job[key] or not all(isinstance(v, str) and v for v in job[key]):
+            raise ValueError(f"{key} 必须是非空的字符串列表")
+    try:
+        for time_str in job['times']:
+            validate_time_format(time_str)
+        if job.get('trigger') is not None:
+            validate_trigger_time(str(job['trigger']))
+    except Exception as e: # argparse.ArgumentTypeError，消息已经是面向用户的说明
+        raise ValueError(str(e)) from None
+    for key in ("book_all", "daily"):
+        if not isinstance(job.get(key, False), bool):
+            raise ValueError(f"{key} 必须是 true 或 false")
+    if job.get('daily') and (not job.get('trigger') or job.get('date')):
+        raise ValueError("daily 任务需要 trigger，且不能指定固定的 date (目标日期按 days_ahead 随每次触发前进)")
+    for key, minimum in (("top_n", 0), ("max_retries", 1), ("days_ahead", 0)):
+        if not isinstance(job.get(key), int) or isinstance(job[key], bool) or job[key] < minimum:
+            raise ValueError(f"{key} 必须是不小于 {minimum} 的整数")
+    if not isinstance(job.get('retry_delay'), (int, float)) or isinstance(job['retry_delay'], bool) or job['retry_delay'] < 0:
+        raise ValueError("retry_delay 必须是不小于 0 的秒数")
+
+    now = time.time() if now is None else now
+    fire_epoch = next_trigger_epoch(job['trigger'], now) if job.get('trigger') else now
+    if job.get('date'):
+        try:
+            datetime.strptime(job['date'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的日期: {job['date']!r}，请使用 YYYY-MM-DD 格式") from None
+    job.update({
+        "next_fire": fire_epoch, # 服务器时钟 (北京时间) 的触发时刻
+        "target_date": job.get('date') or rolled_target_date(fire_epoch, job['days_ahead']),
+        "status": JOB_PENDING,
+        "created": time.time(),
+        "polls": 0,
+        "runs": 0,
+        "booked": [],
+    })
+    return job
+
+class BookingDaemon:
+    """
+    常驻的预约调度器：一个 BookingClient 贯穿整个进程生命周期，任务按触发时刻排队。
+    每个触发时刻之前按提前量依次执行 连接预热 (之后保活) -> 时钟校准 (结果过时才重新校准) -> 精确等待，
+    触发后每个任务在自己的线程里用 TargetWatcher 轮询与预约，共享同一个连接池，多个任务同时执行时还共用请求预算；
+    同一 (eventId, 日期) 的任务还共用查询请求 (search_ttl 为 None 时关闭查询合并)。
+    """
+    def __init__(self, token_manager, store=None, defaults=None, pool_size=DEFAULT_POOL_SIZE, concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE, hedge_percentile=0.0, hedge_min_ms=DEFAULT_HEDGE_MIN_MS,
+                 request_budget=0.0, search_ttl=DEFAULT_SEARCH_TTL_MS / 1000.0, history=None,
+                 spin_seconds=DEFAULT_SPIN_MS / 1000.0, warmup_seconds=DEFAULT_WARMUP_SECONDS,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, calibrate_samples=DEFAULT_CALIBRATION_SAMPLES,
+                 calibrate_lead=DEFAULT_CALIBRATION_LEAD, recalibrate_interval=DEFAULT_RECALIBRATE_INTERVAL,
+                 arm_lead=DEFAULT_ARM_LEAD):
+        self.token_manager = token_manager
+        self.store = store or JobStore() # 只由持有 self.cond 的线程访问
+        self.defaults = {"event": DEFAULT_EVENT_ID, "courts": ["场地1"], "times": ["10:00"], "trigger": None,
+                         "daily": False, "book_all": False, "top_n": 0, "max_retries": DEFAULT_MAX_RETRIES,
+                         "retry_delay": DEFAULT_RETRY_DELAY, "date": None, "days_ahead": 1}
+        self.defaults.update(defaults or {})
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.spin_seconds = spin_seconds
+        self.warmup_seconds = warmup_seconds
+        self.keepalive_interval = keepalive_interval
+        self.calibrate_samples = calibrate_samples
+        self.calibrate_lead = calibrate_lead
+        self.recalibrate_interval = recalibrate_interval
+        self.arm_lead = arm_lead
+
+        # 对冲请求需要第二条连接，连接池按两倍的并发预约数准备
+        tokens = token_manager.current()
+        self.client = BookingClient(pool_size=max(pool_size, concurrency * max(1, len(tokens)) * (2 if hedge_percentile else 1)))
+        if hedge_percentile:
+            self.client.hedger = RequestHedger(hedge_percentile, min_delay=hedge_min_ms / 1000.0)
+        # 与命令行的多目标监视一致，请求预算只在多个任务同时执行时生效 (由 _apply_budget 挂到 client 上)
+        self.budget = RequestBudget(request_budget) if request_budget else None
+        if search_ttl is not None:
+            self.client.search_cache = SearchCoalescer(search_ttl) # 同一 (eventId, 日期) 的多个任务共用查询请求
+        self.client.history = history # 可选的 SlotHistoryRecorder，由调用方负责关闭
+
+        self.cond = threading.Condition()
+        self.running = 0 # 已触发、尚未结束的任务数
+        self.keeper = None
+        self.warm_for = None # 当前连接预热所针对的触发时刻
+        self.calibration = None
+        self.calibrated_at = float('-inf')
+        self.clock_offset = 0.0
+        self.started = time.time()
+        self.stopping = False
+        self.scheduler = threading.Thread(target=self._schedule_loop, name="scheduler", daemon=True)
+
+    def start(self):
+        """启动时恢复任务库中的任务，先做一次预热与时钟校准 (解释器层面的懒加载也在这里完成)，然后开始调度"""
+        self._resume()
+        tokens = self.token_manager.current()
+        log.info(f"[*] 守护进程: 正在预热连接 ({self.client.pool_size} 个)...")
+        print_warmup_report(warm_up_client(self.client, target_date=rolled_target_date(time.time()),
+                                           event_id=self.defaults['event'], auth_token=tokens[0] if tokens else None))
+        if self.calibrate_samples:
+            self._calibrate()
+        self.scheduler.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.keeper:
+            self.keeper.stop()
+        self.client.close()
+        with self.cond:
+            self.store.close()
+
+    def _resume(self):
+        """
+        处理任务库里上次运行留下的任务：执行到一半被中断的任务记为失败；
+        守护进程停止期间错过的任务，若仍在其预约窗口 (max_retries × retry_delay) 内则立即触发，否则记为错过。
+        每天重复的任务在这两种情况下都直接排到下一次触发。
+        """
+        now = time.time()
+        server_now = self._server_now()
+        with self.cond:
+            interrupted = self.store.list(status=JOB_ARMED) + self.store.list(status=JOB_RUNNING)
+            for job in interrupted:
+                self._complete(job, JOB_FAILED, now, error="守护进程重启，本次执行被中断")
+            missed = [job for job in self.store.due(server_now)
+                      if job['next_fire'] + job['max_retries'] * job['retry_delay'] < server_now]
+            for job in missed:
+                self._complete(job, JOB_MISSED, now, error=f"守护进程未运行，错过了触发时间 {job['fire_at']}")
+            counts = self.store.counts()
+        if self.store.path != ":memory:":
+            log.info(f"[*] 任务库 {self.store.path}: 等待中 {counts.get(JOB_PENDING, 0)} 个, 共 {sum(counts.values())} 个"
+                     f"{f', 中断 {len(interrupted)} 个' if interrupted else ''}{f', 错过 {len(missed)} 个' if missed else ''}")
+
+    def _server_now(self):
+        """按最近一次校准结果换算的服务器时钟；next_fire 都以它为准"""
+        return time.time() + self.clock_offset
+
+    def _apply_budget(self):
+        """只有一个任务在执行时不限速，两个以上同时执行时共用请求预算 (调用方持有 self.cond)"""
+        self.client.budget = self.budget if self.running > 1 else None
+
+    def _complete(self, job, status, now=None, **fields):
+        """记录一次执行的结果 (调用方持有 self.cond)；每天重复的任务随后排到下一次触发，目标日期随之前进"""
+        now = time.time() if now is None else now
+        fields.update(finished=now, last_status=status)
+        if job['daily']:
+            next_fire = next_trigger_epoch(job['trigger'], max(now + self.clock_offset, job['next_fire']))
+            fields.update(status=JOB_PENDING, next_fire=next_fire,
+                          target_date=rolled_target_date(next_fire, job['days_ahead']))
+        else:
+            fields['status'] = status
+        self.store.update(job['id'], **fields)
+
+    # --- 接口调用的方法 ---
+    def submit(self, spec):
+        """
+        校验并加入一个任务 (或一个任务列表，在同一个事务里写入)，返回任务快照；
+        任何一个任务格式错误时抛出 ValueError，整批都不写入。
+        """
+        specs = spec if isinstance(spec, list) else [spec]
+        with self.cond:
+            jobs = [build_job(item, self.defaults, self._server_now()) for item in specs]
+            ids = self.store.add(jobs)
+            self.cond.notify_all() # 新任务可能比当前等待的触发时刻更早
+            snapshots = [self.store.get(job_id) for job_id in ids]
+        for job in snapshots[:5]:
+            log.info(f"[+] 新任务 #{job['id']}: {job['target_date']} {job['event'][:8]} 场地 {', '.join(job['courts'])} "
+                     f"时段 {', '.join(job['times'])}, 触发时间 {job['fire_at']}{' (每天重复)' if job['daily'] else ''}")
+        if len(snapshots) > 5:
+            log.info(f"[+] ... 共新增 {len(snapshots)} 个任务")
+        earliest = min(job['next_fire'] for job in snapshots) if snapshots else None
+        for token, exp in self.token_manager.expiring_before(earliest) if earliest else ():
+            log.warning(f"[!] Token {describe_token(token)} 会在新任务触发前过期，请及时更新 Token。")
+        return snapshots if isinstance(spec, list) else snapshots[0]
+
+    def get(self, job_id):
+        with self.cond:
+            return self.store.get(job_id)
+
+    def list_jobs(self, status=None):
+        with self.cond:
+            return self.store.list(status=status)
+
+    def cancel(self, job_id):
+        """取消尚未触发的任务；任务不存在返回 None，已经触发时抛出 ValueError"""
+        with self.cond:
+            job = self.store.get(job_id)
+            if job is None:
+                return None
+            if job['status'] != JOB_PENDING:
+                raise ValueError(f"任务 #{job_id} 当前状态为 {job['status']}，只能取消等待中的任务")
+            self.store.update(job_id, status=JOB_CANCELLED, finished=time.time())
+            self.cond.notify_all()
+            job = self.store.get(job_id)
+        log.info(f"[*] 任务 #{job_id} 已取消")
+        return job
+
+    def push_tokens(self, tokens):
+        """换上新 Token (之后的轮询与预约立即使用)；返回是否有变化"""
+        if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+            raise ValueError("tokens 必须是字符串列表")
+        return self.token_manager.update(tokens, source="守护进程接口")
+
+    def status(self):
+        with self.cond:
+            counts = self.store.counts()
+            next_fire = self.store.next_fire()
+            calibration = self.calibration
+            calibrated_at = self.calibrated_at
+        return {
+            "uptime": round(time.time() - self.started, 3),
+            "jobs": counts,
+            "running": self.running,
+            "next_fire": _format_epoch(next_fire) if next_fire else None,
+            "job_db": self.store.path,
+            "clock_offset_ms": round(calibration['offset'] * 1000, 3) if calibration else None,
+            "clock_error_ms": round(calibration['error'] * 1000, 3) if calibration else None,
+            "calibrated_at": _format_epoch(calibrated_at) if calibration else None,
+            "connections": self.client.connection_stats(),
+            "search_cache": self.client.search_cache.stats() if self.client.search_cache else None,
+            "history": ({"path": self.client.history.path, "snapshots": self.client.history.snapshots,
+                         "records": self.client.history.records, "dropped": self.client.history.dropped} if self.client.history else None),
+            "keepalive": bool(self.keeper and self.keeper.is_alive()),
+            "tokens": [describe_token(token) for token in self.token_manager.current()],
+        }
+
+    # --- 调度 ---
+    def _warm_up(self, fire_epoch, local_fire):
+        """触发前重新打开连接池中的连接 (服务器可能已关闭空闲连接)，并保活到触发时刻"""
+        log.info(f"[*] 守护进程: 为 {_format_epoch(fire_epoch)} 的触发预热连接...")
+        self.warm_for = fire_epoch
+        if self.keeper:
+            self.keeper.stop()
+        print_warmup_report(warm_up_client(self.client))
+        self.keeper = ConnectionKeeper(self.client, interval=self.keepalive_interval, stop_at=local_fire)
+        self.keeper.start()
+
+    def _calibrate(self, fire_epoch=None, local_fire=None):
+        log.info(f"[*] 正在校准服务器时钟 ({self.calibrate_samples} 次采样)...")
+        self.calibrated_at = time.time() # 校准失败也不在这次触发前反复重试
+        # 必须在锁定这一批任务 (arm) 之前结束
+        deadline = local_fire - self.arm_lead if local_fire is not None else None
+        calibration = estimate_server_clock_offset(self.client, self.calibrate_samples, deadline=deadline)
+        print_clock_calibration(calibration)
+        with self.cond:
+            if calibration:
+                self.calibration = calibration
+                self.clock_offset = calibration['offset']
+
+    def _next_stage(self, fire_epoch, local_fire, now):
+        """
+        返回下一次触发前的下一个阶段 (开始时刻, 函数)，函数为 None 表示进入精确等待并触发。
+        剩余时间已经不够的准备阶段直接跳过 (例如提交时就已到期的任务)。
+        """
+        remaining = local_fire - now
+        stages = [(local_fire - self.arm_lead, None)]
+        if self.warmup_seconds and self.warm_for != fire_epoch and remaining > self.arm_lead:
+            stages.append((local_fire - self.warmup_seconds, self._warm_up))
+        if (self.calibrate_samples and local_fire - self.calibrate_lead - self.calibrated_at > self.recalibrate_interval
+                and remaining > self.arm_lead + self.calibrate_samples): # 每次采样最多等 1 秒对齐整秒
+            stages.append((local_fire - self.calibrate_lead, self._calibrate))
+        return min(stages, key=lambda stage: stage[0])
+
+    def _schedule_loop(self):
+        while True:
+            with self.cond:
+                if self.stopping:
+                    return
+                fire_epoch = self.store.next_fire()
+                if fire_epoch is None:
+                    self.cond.wait()
+                    continue
+                # 服务器时间 = 本机时间 + clock_offset，因此本机应在 fire_epoch - clock_offset 时触发
+                local_fire = fire_epoch - self.clock_offset
+                now = time.time()
+                start_at, stage = self._next_stage(fire_epoch, local_fire, now)
+                if now < start_at:
+                    self.cond.wait(start_at - now) # 新任务提交或取消时提前醒来重新计算
+                    continue
+                if stage is None:
+                    batch = self.store.due(fire_epoch + FIRE_GROUP_WINDOW)
+                    for job in batch:
+                        self.store.update(job['id'], status=JOB_ARMED)
+            if stage is not None:
+                try:
+                    stage(fire_epoch, local_fire)
+                except Exception as e: # 准备阶段失败不影响按时触发
+                    log.warning(f"[!] 守护进程: 触发前的准备阶段失败: {e}", exc_info=True)
+                continue
+            self._fire(batch, local_fire)
+
+    def _fire(self, batch, local_fire):
+        if self.keeper:
+            self.keeper.stop()
+        label = ", ".join(f"#{job['id']}" for job in batch)
+        self.token_manager.reload(force=True)
+        if self.token_manager.all_expired():
+            log.error(f"[!] 所有 Token 均已过期，任务 {label} 无法执行。请通过 /tokens 接口或 Token 文件更新 Token。")
+            with self.cond:
+                for job in batch:
+                    self._complete(job, JOB_FAILED, error="所有 Token 均已过期")
+            return
+        drift = wait_until(local_fire, self.spin_seconds, label=f"{batch[0]['fire_at']} (任务 {label})")
+        log.info(f"[*] 已触发任务 {label}: 实际偏差 {drift * 1000:+.3f} ms, 时钟修正 {self.clock_offset * 1000:+.1f} ms")
+        with self.cond:
+            for job in batch:
+                job.update(started=time.time(), drift_ms=round(drift * 1000, 3), runs=job['runs'] + 1)
+                self.store.update(job['id'], status=JOB_RUNNING, started=job['started'], drift_ms=job['drift_ms'],
+                                  runs=job['runs'])
+                self.running += 1
+            self._apply_budget()
+        for job in batch:
+            threading.Thread(target=self._run_job, args=(job,), name=f"job-{job['id']}", daemon=True).start()
+
+    def _run_job(self, job):
+        """触发后的查询-预约循环，复用多目标监视的 TargetWatcher (守护进程里 Token 随时可以更新，认证失败可恢复)"""
+        watcher = TargetWatcher(dict(job, date=job['target_date']), self.token_manager.current(), recoverable=("auth",))
+        error = None
+        try:
+            watch_targets([watcher], self.client, max_workers=1, max_rounds=job['max_retries'], delay=job['retry_delay'],
+                          concurrency=self.concurrency, token_manager=self.token_manager, batch_size=self.batch_size)
+        except Exception as e:
+            log.error(f"[!] 任务 #{job['id']} 执行时遇到意外错误: {e}", exc_info=True)
+            error = str(e)
+        booked = [label for account in watcher.accounts for label in account['booked']]
+        if not booked and error is None:
+            blocked = sorted({account['blocked'] for account in watcher.accounts if account['blocked']})
+            error = f"预约失败 ({', '.join(blocked)})" if blocked else f"{watcher.polls} 轮内未预约成功"
+        duplicates = [label for account in watcher.accounts for label in account['duplicates']]
+        if duplicates: # 预约成功的任务 error 为空，用它告诉接口调用方需要核对的重复预约
+            error = "; ".join(filter(None, [error, f"对冲请求可能重复预约了: {'; '.join(duplicates)}，请核对预约记录"]))
+        status = JOB_SUCCEEDED if booked else JOB_FAILED
+        with self.cond:
+            self._complete(job, status, polls=watcher.polls, booked=booked, error=error)
+            self.running -= 1
+            self._apply_budget()
+            self.cond.notify_all()
+            next_fire = self.store.get(job['id'])['fire_at'] if job['daily'] else None
+        log.info(f"[*] 任务 #{job['id']} ({job['target_date']}) 结束: {status}"
+                 + (f", 已预约: {'; '.join(booked)}" if booked else "") + (f" ({error})" if error else "")
+                 + (f"; 下次触发 {next_fire}" if next_fire else ""))
+
+# --- 本地接口 ---
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """在 Unix socket 上提供与 TCP 相同的 HTTP 接口 (curl --unix-socket 可直接访问)"""
+    daemon_threads = True
+
+def start_api_server(daemon, host=DEFAULT_API_HOST, port=None, socket_path=None):
+    """
+    在后台线程中提供任务接口：指定 socket_path 时监听 Unix socket (权限 0600，只有当前用户可访问)，否则监听 host:port。
+    Returns:
+        服务器对象 (调用 shutdown() 停止)。
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _reply_job(self, job):
+            if job is None:
+                self._reply(404, {"error": "任务不存在"})
+            else:
+                self._reply(200, job)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'null')
+            except ValueError:
+                raise ValueError("请求体不是有效的 JSON") from None
+
+        def _job_id(self):
+            parts = urlsplit(self.path).path.strip('/').split('/')
+            return int(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() else None
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/')
+            if path == '/status':
+                self._reply(200, daemon.status())
+            elif path == '/jobs':
+                status = parse_qs(url.query).get('status', [None])[0]
+                self._reply(200, daemon.list_jobs(status))
+            elif self._job_id() is not None:
+                self._reply_job(daemon.get(self._job_id()))
+            else:
+                self._reply(404, {"error": "未知路径"})
+
+        def do_POST(self):
+            path = urlsplit(self.path).path.rstrip('/')
+            try:
+                if path == '/jobs':
+                    self._reply(201, daemon.submit(self._read_json()))
+                elif path == '/tokens':
+                    body = self._read_json()
+                    changed = daemon.push_tokens(body.get('tokens') if isinstance(body, dict) else None)
+                    self._reply(200, {"changed": changed, "tokens": daemon.status()['tokens']})
+                else:
+                    self._reply(404, {"error": "未知路径"})
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+
+        def do_DELETE(self):
+            job_id = self._job_id()
+            if job_id is None:
+                self._reply(404, {"error": "未知路径"})
+                return
+            try:
+                job = daemon.cancel(job_id)
+            except ValueError as e:
+                self._reply(409, {"error": str(e)})
+                return
+            self._reply_job(job)
+
+        def log_message(self, format, *args):
+            pass # 接口请求不打印到控制台
+
+    if socket_path:
+        # 上次异常退出留下的 socket 文件会让 bind 失败；只删除 socket，不碰同名的普通文件
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        old_umask = os.umask(0o177) # socket 文件在 bind 时就以 0600 创建，不留其他用户可以连接的窗口
+        try:
+            server = ThreadingUnixHTTPServer(socket_path, ApiHandler)
+        finally:
+            os.umask(old_umask)
+    else:
+        server = ThreadingHTTPServer((host, port), ApiHandler)
+        server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    return server
@@ -0,0 +1,277 @@
+"""
+时段可约状态的历史记录：每次 searchByDate 的结果只把 "和上一次相比发生变化" 的时段追加写入一个定长记录的二进制文件，
+用来回看被取消的时段何时重新出现 (只依赖标准库)。
+
+文件格式：16 字节文件头 (HISTORY_MAGIC) 之后是连续的 16 字节记录 (HISTORY_RECORD)：
+    时间戳 (float64, Unix 秒) | 目标编号 (uint32) | slotOrder (int16) | status (int8) | 填充
+目标编号对应旁边的 <path>.keys 文件 (每行一个 JSON: event/date/resource/name)，按出现顺序编号。
+记录按时间顺序追加，读取端用 mmap 按时间二分查找，不需要把文件读进内存。
+"""
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from .config import DEFAULT_HISTORY_BUFFER, DEFAULT_HISTORY_FLUSH_INTERVAL, DEFAULT_HISTORY_QUEUE
+from .logs import log
+from .match import SlotDiffEngine
+from .tracing import traced
+
+HISTORY_MAGIC = b"NBSLOTH1" + b"\0" * 8
+HISTORY_RECORD = struct.Struct("<dIhbx")
+
+_MAX_TRACKED_DATES = 32 # 最多同时保存这么多个 (eventId, 日期) 的快照，守护进程跑几个月内存也不会增长
+_diff = SlotDiffEngine.diff.__wrapped__ # 记录器的整次调用记为 history span，内部的对比不再单独记 diff span
+
+HistoryRecord = namedtuple("HistoryRecord", ["timestamp", "event", "date", "resource_id", "court", "slot_order", "status"])
+
+def _small_int(value, low, high):
+    """slotOrder/status 不是整数或超出范围时记为 -1"""
+    return value if isinstance(value, int) and low <= value <= high else -1
+
+class SlotHistoryRecorder:
+    """
+    追加写入时段状态变化。每个 (eventId, 日期) 用一个 SlotDiffEngine 保存上一次的快照，
+    只有新出现或状态变化的时段才写一条记录；进程启动后的第一次查询相当于写入一份完整快照。
+    record 只把查询结果放进有界队列，解析、对比、打包与写盘都在后台线程完成，查询线程不会被磁盘 I/O 拖慢也不会阻塞；
+    后台线程跟不上 (磁盘卡住) 时丢弃新的结果并计数 (dropped)，之后的结果仍与最近一次处理过的快照对比，变化不会丢，只是时间戳推后。
+    内存占用只有最近若干个日期的快照、至多 queue_size 个待处理的结果和至多 buffer_records 条待写记录。多个线程可以同时调用 record。
+    """
+    def __init__(self, path, buffer_records=DEFAULT_HISTORY_BUFFER, flush_interval=DEFAULT_HISTORY_FLUSH_INTERVAL,
+                 queue_size=DEFAULT_HISTORY_QUEUE):
+        self.path = path
+        self.buffer_records = max(1, buffer_records)
+        self.flush_interval = flush_interval
+        self.keys = {} # (event, date, resourceId) -> 目标编号
+        if os.path.exists(f"{path}.keys"):
+            with open(f"{path}.keys", 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.keys[(entry['event'], entry['date'], entry['resource'])] = len(self.keys)
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            # 文件头立即落盘：SlotHistory 在第一批记录写入之前也能打开新文件
+            self.file.write(HISTORY_MAGIC)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(HISTORY_MAGIC)) != HISTORY_MAGIC:
+                    self.file.close()
+                    raise ValueError(f"{path} 不是时段历史文件")
+            # 上次异常退出时可能留下半条记录，截掉以保证后续记录对齐
+            extra = (self.file.tell() - len(HISTORY_MAGIC)) % HISTORY_RECORD.size
+            if extra:
+                self.file.truncate(self.file.tell() - extra)
+                self.file.seek(0, os.SEEK_END)
+        self.keys_file = open(f"{path}.keys", 'a', encoding='utf-8')
+        self.differs = {} # (event, date) -> SlotDiffEngine，只由后台线程访问
+        self.buffer = bytearray()
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+        self.last_timestamp = 0.0
+        self.snapshots = 0 # 记录过的查询结果数
+        self.records = 0   # 写入的记录数
+        self.dropped = 0   # 队列满时丢弃的查询结果数
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._drop_lock = threading.Lock()
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name="history", daemon=True)
+        self.worker.start()
+
+    def record(self, event_id, target_date, slot_data, timestamp=None):
+        """
+        把一次成功的查询结果交给后台线程记录，从不阻塞。slot_data 是解析后的字典 (交出后不能再修改)，
+        或者响应的 JSON 文本 (由后台线程完整解析；查询只解析了部分场地时用它，历史里仍有全部场地)。
+        Returns:
+            bool: 是否放进了队列 (队列满或已关闭时为 False)。
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((event_id, target_date, slot_data, time.time() if timestamp is None else timestamp))
+            return True
+        except queue.Full:
+            with self._drop_lock: # 不用 self._lock：flush/close 持有它时可能正等着队列腾出空位
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 100 == 0:
+                log.warning("[!] 时段历史: 后台写入跟不上，已丢弃 %d 个查询结果", dropped)
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self.pending:
+                    self._flush()
+                continue
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self._flush()
+                item.set()
+                continue
+            self._write(*item)
+            if self.pending >= self.buffer_records or time.monotonic() - self.flushed_at >= self.flush_interval:
+                self._flush()
+        self._flush()
+
+    @traced("history")
+    def _write(self, event_id, target_date, slot_data, timestamp):
+        """对比上一次的快照并打包变化的时段，返回本次写入的记录数"""
+        if isinstance(slot_data, str):
+            try:
+                slot_data = json.loads(slot_data)
+            except ValueError:
+                return 0
+        differ = self.differs.get((event_id, target_date))
+        if differ is None:
+            if len(self.differs) >= _MAX_TRACKED_DATES:
+                del self.differs[next(iter(self.differs))] # 丢掉最早开始记录的日期；它再被查询时重新写一份完整快照
+            differ = self.differs[(event_id, target_date)] = SlotDiffEngine()
+        events = _diff(differ, slot_data)
+        self.snapshots += 1
+        if not events:
+            return 0
+        timestamp = self.last_timestamp = max(timestamp, self.last_timestamp) # 保证时间戳不减，读取端才能二分
+        for event in events:
+            key = (event_id, target_date, event.resource_id)
+            index = self.keys.get(key)
+            if index is None:
+                index = self.keys[key] = len(self.keys)
+                # 目标编号先于引用它的记录落盘，读取端不会遇到未知编号
+                self.keys_file.write(json.dumps({"event": event_id, "date": target_date, "resource": event.resource_id,
+                                                 "name": event.resource_name}, ensure_ascii=False) + "\n")
+                self.keys_file.flush()
+            self.buffer += HISTORY_RECORD.pack(timestamp, index, _small_int(event.slot.get('slotOrder'), -32768, 32767),
+                                               _small_int(event.status, -128, 127))
+        self.pending += len(events)
+        self.records += len(events)
+        return len(events)
+
+    def _flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer.clear()
+            self.pending = 0
+        self.flushed_at = time.monotonic()
+
+    def flush(self):
+        """等后台线程处理完此前交给它的查询结果并写盘"""
+        with self._lock:
+            if self.closed:
+                return
+            done = threading.Event()
+            self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """处理完队列中剩余的查询结果，写盘后关闭文件"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.worker.join()
+        self.file.close()
+        self.keys_file.close()
+
+class SlotHistory:
+    """
+    只读打开时段历史文件 (mmap)。打开时只读取 .keys 文件，记录按需解码；
+    可以在记录器写入的同时打开，只看得到打开那一刻已经写盘的记录。
+        with SlotHistory("history.bin") as history:
+            for record in history.reappearances(since=time.time() - 7 * 86400, court="场地1"):
+                print(record)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.keys = []
+        if os.path.exists(f"{path}.keys"):
+            with open(f"{path}.keys", 'r', encoding='utf-8') as f:
+                self.keys = [json.loads(line) for line in f]
+        with open(path, 'rb') as f:
+            if f.read(len(HISTORY_MAGIC)) != HISTORY_MAGIC:
+                raise ValueError(f"{path} 不是时段历史文件")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self.map) - len(HISTORY_MAGIC)) // HISTORY_RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def timestamp_at(self, index):
+        return struct.unpack_from("<d", self.map, len(HISTORY_MAGIC) + index * HISTORY_RECORD.size)[0]
+
+    def bisect(self, timestamp):
+        """第一条时间戳不早于 timestamp 的记录的下标"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp_at(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _matching_keys(self, event=None, date=None, court=None):
+        """满足过滤条件的目标编号集合；没有过滤条件时返回 None"""
+        if event is None and date is None and court is None:
+            return None
+        return {index for index, key in enumerate(self.keys)
+                if (event is None or key['event'] == event) and (date is None or key['date'] == date)
+                and (court is None or key['name'] == court)}
+
+    def _iter_raw(self, start, stop):
+        """逐条解码 [start, stop) 的记录；通过 memoryview 直接读 mmap，不把这段数据复制一份"""
+        offset = len(HISTORY_MAGIC)
+        with memoryview(self.map) as view:
+            with view[offset + start * HISTORY_RECORD.size:offset + stop * HISTORY_RECORD.size] as chunk:
+                yield from HISTORY_RECORD.iter_unpack(chunk)
+
+    def _make_record(self, timestamp, index, slot_order, status):
+        key = self.keys[index]
+        return HistoryRecord(timestamp, key['event'], key['date'], key['resource'], key['name'], slot_order, status)
+
+    def records(self, since=None, until=None, event=None, date=None, court=None, status=None):
+        """按时间顺序产出 [since, until) 内满足条件的 HistoryRecord"""
+        start = self.bisect(since) if since is not None else 0
+        stop = self.bisect(until) if until is not None else self.count
+        wanted = self._matching_keys(event, date, court)
+        for timestamp, index, slot_order, slot_status in self._iter_raw(start, stop):
+            if (wanted is None or index in wanted) and (status is None or slot_status == status):
+                yield self._make_record(timestamp, index, slot_order, slot_status)
+
+    def reappearances(self, since=None, until=None, event=None, date=None, court=None, from_status=None):
+        """
+        产出 [since, until) 内 "由不可约变回可约 (status 0)" 的记录，即被取消后重新放出的时段。
+        放号本身 (未开放 -> 可约) 也是这种变化；只关心取消时传入 from_status (例如已预约的状态值)，只看从它变回 0 的记录。
+        每个时段此前的状态需要从头回放才能知道；文件里只有状态变化，回放的记录数远小于轮询次数。
+        """
+        stop = self.bisect(until) if until is not None else self.count
+        wanted = self._matching_keys(event, date, court)
+        last = {}
+        for timestamp, index, slot_order, slot_status in self._iter_raw(0, stop):
+            if wanted is not None and index not in wanted:
+                continue
+            previous = last.get((index, slot_order))
+            last[(index, slot_order)] = slot_status
+            if (slot_status == 0 and previous not in (None, 0) and (from_status is None or previous == from_status)
+                    and (since is None or timestamp >= since)):
+                yield self._make_record(timestamp, index, slot_order, slot_status)
@@ -0,0 +1,137 @@
+"""守护进程的任务存储：SQLite 表 + 按下次触发时刻的部分索引，进程重启后任务原样恢复 (只依赖标准库)"""
+import json
+import sqlite3
+from datetime import datetime
+
+from .config import BEIJING_TZ
+
+# 任务状态
+JOB_PENDING = "pending"       # 等待触发，可以取消
+JOB_ARMED = "armed"           # 已进入触发前的精确等待
+JOB_RUNNING = "running"       # 已触发，正在查询/预约
+JOB_SUCCEEDED = "succeeded"   # 至少预约成功一个时段
+JOB_FAILED = "failed"         # 结束但没有预约成功
+JOB_MISSED = "missed"         # 守护进程停机期间错过了触发时间及其预约窗口，没有执行
+JOB_CANCELLED = "cancelled"
+
+# 列名与任务字典的键一一对应；courts/times/booked 以 JSON 文本保存，daily/book_all 以 0/1 保存
+JOB_COLUMNS = ("status", "next_fire", "trigger", "daily", "event", "date", "days_ahead", "courts", "times", "book_all",
+               "top_n", "max_retries", "retry_delay", "target_date", "created", "started", "finished", "drift_ms",
+               "polls", "runs", "last_status", "booked", "error")
+_JSON_COLUMNS = frozenset(("courts", "times", "booked"))
+_BOOL_COLUMNS = frozenset(("daily", "book_all"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    next_fire REAL NOT NULL,         -- 下次触发时刻 (服务器时钟的 Unix 时间戳)
+    trigger TEXT,                    -- HH:MM[:SS[.fff]]，为空表示提交后立即触发
+    daily INTEGER NOT NULL DEFAULT 0,
+    event TEXT NOT NULL,
+    date TEXT,                       -- 固定的目标日期；为空时每次触发按 days_ahead 重新计算
+    days_ahead INTEGER NOT NULL DEFAULT 1,
+    courts TEXT NOT NULL,
+    times TEXT NOT NULL,
+    book_all INTEGER NOT NULL DEFAULT 0,
+    top_n INTEGER NOT NULL DEFAULT 0,
+    max_retries INTEGER NOT NULL,
+    retry_delay REAL NOT NULL,
+    target_date TEXT,                -- 本次 (或最近一次) 触发实际预约的日期
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    drift_ms REAL,
+    polls INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 0,
+    last_status TEXT,                -- 最近一次执行的结果 (每天重复的任务执行后 status 会回到 pending)
+    booked TEXT NOT NULL DEFAULT '[]',
+    error TEXT
+);
+-- 调度器只关心等待中的任务：部分索引只包含 pending 行，已结束的历史任务再多也不影响查找
+CREATE INDEX IF NOT EXISTS jobs_pending_by_fire ON jobs (next_fire) WHERE status = 'pending';
+"""
+
+def _encode(column, value):
+    if column in _JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False)
+    if column in _BOOL_COLUMNS:
+        return int(bool(value))
+    return value
+
+_SELECT = f"SELECT id, {', '.join(JOB_COLUMNS)} FROM jobs"
+
+def _row_to_job(row):
+    """(id, *JOB_COLUMNS) 元组 -> 任务字典；列出上千个任务时这里是主要开销，所以不用 sqlite3.Row 按列名取值"""
+    job = dict(zip(JOB_COLUMNS, row[1:]))
+    job["id"] = row[0]
+    for column in _JSON_COLUMNS:
+        job[column] = json.loads(job[column])
+    for column in _BOOL_COLUMNS:
+        job[column] = bool(job[column])
+    job["fire_at"] = datetime.fromtimestamp(job["next_fire"], BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return job
+
+class JobStore:
+    """
+    任务表的薄封装。path 为 ":memory:" 时不落盘 (守护进程未指定 --job-db 时)。
+    连接在多个线程间共享，本身不加锁：调用方 (BookingDaemon) 在自己的锁内访问。
+    """
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None) # 自动提交，批量写入显式开事务
+        if path != ":memory:":
+            # WAL：写入只追加日志，不阻塞读；每次状态变化都要落盘，NORMAL 同步级别足够 (断电最多丢最后一次提交)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def add(self, jobs):
+        """在一个事务里插入多个任务 (executemany)，返回各自的 id (与 jobs 顺序一致)"""
+        sql = f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})"
+        rows = [[_encode(column, job.get(column)) for column in JOB_COLUMNS] for job in jobs]
+        with self.conn: # 成功时提交，异常时回滚
+            # IMMEDIATE 先拿到写锁：AUTOINCREMENT 的新 id 从 sqlite_sequence 记录的值起连续分配，不会被其他写入者插队
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'jobs'").fetchone()
+            first = (row[0] if row else 0) + 1
+            self.conn.executemany(sql, rows)
+        return list(range(first, first + len(rows)))
+
+    def update(self, job_id, **fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?",
+                          [_encode(column, value) for column, value in fields.items()] + [job_id])
+
+    def get(self, job_id):
+        row = self.conn.execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, status=None, limit=None):
+        """按 id 顺序列出任务，可按状态过滤"""
+        sql, params = _SELECT, []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_row_to_job(row) for row in self.conn.execute(sql, params)]
+
+    def next_fire(self):
+        """最早的等待中任务的触发时刻；没有等待中的任务时返回 None (走部分索引，只读一行)"""
+        row = self.conn.execute("SELECT next_fire FROM jobs WHERE status = 'pending' ORDER BY next_fire LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def due(self, until):
+        """触发时刻不晚于 until 的等待中任务，按触发时刻排序"""
+        rows = self.conn.execute(f"{_SELECT} WHERE status = 'pending' AND next_fire <= ? ORDER BY next_fire", (until,))
+        return [_row_to_job(row) for row in rows]
+
+    def counts(self):
+        """各状态的任务数"""
+        return {status: count for status, count in self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+    def close(self):
+        self.conn.close()
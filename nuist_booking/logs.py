@@ -0,0 +1,79 @@
+"""
+日志：热路径只把定形后的记录放进队列，写终端在后台线程完成。
+每次尝试/轮询都会打印的日志用 log.info("... %s", value) 传参，不用 f-string：级别关闭时 (例如关键窗口内的 DEBUG)
+参数完全不会被格式化；只在启动、结束时打印一次的日志不受影响。DEBUG 下的完整响应 JSON 用 JsonDump 包装，
+序列化留给后台线程。
+"""
+import contextlib
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+log = logging.getLogger("book_badminton")
+
+_SNAPSHOT_TYPES = (str, int, float, bool, type(None))
+_exception_formatter = logging.Formatter()
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    入队前在调用线程里把消息定形：%s 参数的拼接与异常堆栈在这里完成，入队的记录不再引用调用方的对象
+    (查询结果字典、响应数据、异常栈帧)，后台线程读到的就是调用那一刻的值，栈帧也不会被队列拖住。
+    只有 JsonDump 参数 (DEBUG 下的完整响应 JSON，交出后不再修改) 留给后台线程序列化；终端 I/O 都在后台线程。
+    与标准 QueueHandler.prepare 不同，这里不调用 format()，也不复制记录。
+    """
+    def prepare(self, record):
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        args = record.args
+        if args and isinstance(args, tuple) and any(isinstance(arg, JsonDump) for arg in args):
+            # 其余参数换成不可变的快照；非标量参数在日志里都以 %s 出现，提前转成字符串结果不变
+            record.args = tuple(arg if isinstance(arg, (JsonDump,) + _SNAPSHOT_TYPES) else str(arg) for arg in args)
+        elif args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+class JsonDump:
+    """把对象包装成 "打印时才 json.dumps" 的日志参数，DEBUG 关闭时完全不做序列化"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, indent=2, ensure_ascii=False)
+
+def setup_logging(level=logging.INFO, stream=None):
+    """
+    把 log 的输出改为 队列 -> 后台线程 -> stream (默认 stdout)，输出格式与原来的 print 一致。
+    Returns:
+        QueueListener: 调用 stop() 会写完队列中剩余的日志。
+    """
+    # 输出只用 %(message)s：不收集调用位置 (findCaller 要逐帧回溯) 与线程/进程信息，每条记录省下一半的创建开销
+    # (logging HOWTO "Optimization" 一节给出的做法)
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
+    log.handlers[:] = [DeferredQueueHandler(log_queue)]
+    log.setLevel(level)
+    log.propagate = False
+    listener.start()
+    return listener
+
+@contextlib.contextmanager
+def critical_window_logging(allow_debug=False):
+    """放号关键窗口内默认关闭 DEBUG 级别的详细输出 (逐场地明细、完整响应 JSON)，退出后恢复"""
+    previous = log.level
+    if not allow_debug and previous < logging.INFO:
+        log.setLevel(logging.INFO)
+    try:
+        yield
+    finally:
+        log.setLevel(previous)
@@ -0,0 +1,232 @@
+"""时段匹配：偏好排名、一次扫描的偏好索引与增量差异引擎"""
+import logging
+from collections import namedtuple
+
+from .logs import log
+from .tracing import traced
+
+@traced("match")
+def find_all_available_preferred_slots(slot_data, target_date, preferred_courts, preferred_times, require_available=True):
+    """
+    在返回的数据中查找 *所有* 满足偏好列表（场地和时间）的可预约时段。
+    require_available=False 时忽略时段状态，返回所有偏好时段 (用于提前缓存时段标识)。
+    Returns:
+        list: 包含所有可预约时段的 slot_details 字典的列表，如果找不到则返回空列表。
+    """
+    available_slots = []
+    if not slot_data or slot_data.get('status') != 0:
+        # get_slot_details 已经打印了错误，这里可以不重复打印
+        # print("[!] 时段数据无效或包含错误，无法查找。")
+        return available_slots
+
+    resources = slot_data.get('data', {}).get('list', [])
+    if not resources:
+        log.warning("[!] 未找到任何场地资源。")
+        return available_slots
+
+    # 逐场地/逐时段的明细只在 DEBUG 级别输出，且整次匹配合成一条日志 (每条日志记录本身就要几微秒)；关闭时不做任何格式化
+    detail = [] if log.isEnabledFor(logging.DEBUG) else None
+    if detail is not None:
+        detail += ["[*] 开始按偏好查找 *所有* 可预约时段...", f"[*]   偏好场地: {', '.join(preferred_courts)}",
+                   f"[*]   偏好时段 (开始时间): {', '.join(preferred_times)}"]
+
+    preferred_courts_set = set(preferred_courts)
+    preferred_times_set = set(preferred_times)
+    found_courts = set()
+
+    for resource in resources:
+        resource_name = resource.get('name')
+        resource_id = resource.get('id')
+        if resource_name in preferred_courts_set:
+            found_courts.add(resource_name)
+            if detail is not None:
+                detail.append(f"[*]   正在检查场地: {resource_name} (ID: {resource_id})")
+            slot_info_list = resource.get('slotInfo', [])
+            for slot in slot_info_list:
+                start_time = slot.get('startTime')
+                if start_time in preferred_times_set:
+                    slot_end_time = slot.get('endTime', '未知')
+                    display_time = f"{start_time}-{slot_end_time}"
+                    # 检查状态是否可预约 (status == 0)
+                    if slot.get('status') == 0 or not require_available:
+                        if detail is not None:
+                            detail.append(f"[+++]     发现可预约偏好: {resource_name} {display_time}!")
+                        slot_details = {
+                            "bookDate": target_date,
+                            "bookSlotId": slot.get('slotId'),
+                            "bookSlot": display_time, # 用于显示，实际接口可能不需要
+                            "number": 1,
+                            "price": "", # 价格可能需要从 API 获取或确认是否需要
+                            "resourceId": resource_id,
+                            "slotOrder": slot.get('slotOrder'),
+                            "seatId": "", # 如果需要座位 ID，需处理
+                            "scheduleId": slot.get('scheduleId'),
+                            "resourceName": resource_name # 用于日志记录
+                        }
+                        available_slots.append(slot_details)
+                    # else: # 减少不必要的日志
+                    #     print(f"[-]       时段 {display_time} 状态为 {slot.get('status')}，不可预约。")
+
+    if detail is not None:
+        log.debug("%s", "\n".join(detail))
+
+    # 检查是否有偏好的场地未在结果中找到
+    missing_courts = preferred_courts_set - found_courts
+    if missing_courts:
+        log.warning("[!]   未在查询结果中找到以下偏好场地: %s", ', '.join(missing_courts))
+
+    if not available_slots:
+        log.info("[-] 未找到任何满足偏好的可预约时段。")
+
+    return available_slots
+
+# --- 偏好索引：按偏好排名的一次扫描匹配 ---
+def build_preference_index(preferred_courts, preferred_times):
+    """
+    启动时构建一次偏好索引: {场地名: {开始时间: 排名}}，排名 0 为最优。
+    排名先按场地顺序、再按时间顺序 (与 v4 的查找顺序一致)，查找 (场地, 开始时间) 均为 O(1)。
+    """
+    index = {}
+    for court_rank, court in enumerate(preferred_courts):
+        times = index.setdefault(court, {})
+        for time_rank, start_time in enumerate(preferred_times):
+            times.setdefault(start_time, court_rank * len(preferred_times) + time_rank)
+    return index
+
+@traced("match")
+def find_ranked_available_slots(slot_data, target_date, preference_index, require_available=True):
+    """
+    对返回数据做一次线性扫描，按偏好排名 (而不是服务器返回顺序) 给出可预约时段，
+    这样第一个预约请求总是指向用户最想要的时段。
+    require_available=False 时忽略时段状态 (用于提前缓存时段标识)。
+    Returns:
+        list: 按排名排序的 slot_details 字典列表 (含 "rank" 字段)，找不到时返回空列表。
+    """
+    if not slot_data or slot_data.get('status') != 0:
+        return []
+    resources = slot_data.get('data', {}).get('list', [])
+    if not resources:
+        log.warning("[!] 未找到任何场地资源。")
+        return []
+
+    ranked = []
+    found_courts = set()
+    for resource in resources:
+        resource_name = resource.get('name')
+        time_ranks = preference_index.get(resource_name)
+        if time_ranks is None:
+            continue
+        found_courts.add(resource_name)
+        resource_id = resource.get('id')
+        for slot in resource.get('slotInfo', []):
+            rank = time_ranks.get(slot.get('startTime'))
+            if rank is None or (require_available and slot.get('status') != 0):
+                continue
+            ranked.append((rank, {
+                "bookDate": target_date,
+                "bookSlotId": slot.get('slotId'),
+                "bookSlot": f"{slot.get('startTime')}-{slot.get('endTime', '未知')}",
+                "number": 1,
+                "price": "",
+                "resourceId": resource_id,
+                "slotOrder": slot.get('slotOrder'),
+                "seatId": "",
+                "scheduleId": slot.get('scheduleId'),
+                "resourceName": resource_name,
+                "rank": rank
+            }))
+
+    missing_courts = preference_index.keys() - found_courts
+    if missing_courts:
+        log.warning("[!]   未在查询结果中找到以下偏好场地: %s", ', '.join(missing_courts))
+    ranked.sort(key=lambda item: item[0])
+    slots = [details for _, details in ranked]
+    if slots:
+        log.info("[+++] 发现 %d 个偏好时段, 首选: %s %s (第 %d 偏好)", len(slots), slots[0]['resourceName'], slots[0]['bookSlot'],
+                 slots[0]['rank'] + 1)
+    else:
+        log.info("[-] 未找到任何满足偏好的可预约时段。")
+    return slots
+
+# --- 增量时段差异引擎 ---
+SLOT_NEW = "new"         # 第一次看到的时段
+SLOT_FREED = "freed"     # 状态变为可约 (status 0)
+SLOT_TAKEN = "taken"     # 状态由可约变为不可约
+SLOT_CHANGED = "changed" # 其他状态变化 (例如 1 -> 2)
+
+SlotEvent = namedtuple("SlotEvent", ["kind", "slot_id", "status", "previous_status", "resource_id", "resource_name", "slot"])
+
+class SlotDiffEngine:
+    """
+    保存上一次轮询的快照 {slotId: status}，每次轮询只产出发生变化的时段事件，
+    使匹配与预约的工作量与变化量成正比，而不是与场馆规模成正比。
+    """
+    def __init__(self):
+        self.snapshot = {}
+
+    @traced("diff")
+    def diff(self, slot_data):
+        """对比新的查询结果与上一次快照，返回 SlotEvent 列表并更新快照"""
+        events = []
+        if not slot_data or slot_data.get('status') != 0:
+            return events
+        snapshot = self.snapshot
+        for resource in (slot_data.get('data') or {}).get('list') or []:
+            resource_id = resource.get('id')
+            resource_name = resource.get('name')
+            for slot in resource.get('slotInfo', []):
+                slot_id = slot.get('slotId')
+                status = slot.get('status')
+                previous = snapshot.get(slot_id, snapshot) # 用 snapshot 本身作为 "不存在" 的哨兵
+                if previous is snapshot:
+                    kind = SLOT_NEW
+                elif previous == status:
+                    continue
+                elif status == 0:
+                    kind = SLOT_FREED
+                elif previous == 0:
+                    kind = SLOT_TAKEN
+                else:
+                    kind = SLOT_CHANGED
+                snapshot[slot_id] = status
+                events.append(SlotEvent(kind, slot_id, status, None if previous is snapshot else previous,
+                                        resource_id, resource_name, slot))
+        return events
+
+    def forget(self, slot_id):
+        """忘记某个时段的状态：下次轮询时若仍可约，会重新作为新事件产出 (用于预约失败后重试)"""
+        self.snapshot.pop(slot_id, None)
+
+@traced("match")
+def find_ranked_slots_in_events(events, target_date, preference_index):
+    """
+    只在本次变为可约 (new/freed 且 status 0) 的时段中按偏好排名查找候选。
+    Returns:
+        list: 按排名排序的 slot_details 字典列表 (含 "rank" 字段)。
+    """
+    ranked = []
+    for event in events:
+        if event.status != 0 or event.kind not in (SLOT_NEW, SLOT_FREED):
+            continue
+        time_ranks = preference_index.get(event.resource_name)
+        if time_ranks is None:
+            continue
+        slot = event.slot
+        rank = time_ranks.get(slot.get('startTime'))
+        if rank is None:
+            continue
+        ranked.append((rank, {
+            "bookDate": target_date,
+            "bookSlotId": event.slot_id,
+            "bookSlot": f"{slot.get('startTime')}-{slot.get('endTime', '未知')}",
+            "number": 1,
+            "price": "",
+            "resourceId": event.resource_id,
+            "slotOrder": slot.get('slotOrder'),
+            "seatId": "",
+            "scheduleId": slot.get('scheduleId'),
+            "resourceName": event.resource_name,
+            "rank": rank
+        }))
+    ranked.sort(key=lambda item: item[0])
+    return [details for _, details in ranked]
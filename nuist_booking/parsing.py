@@ -0,0 +1,141 @@
+"""searchByDate 响应的选择性解析：只完整解码想要的场地，其余部分直接跳过"""
+import json
+import re
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# 跳过一个不含嵌套数组的 JSON 数组 (slotInfo 中是扁平对象)，正确处理字符串中的括号与转义
+_FLAT_ARRAY_TAIL = re.compile(r'[^\[\]"]*(?:"(?:[^"\\]|\\.)*"[^\[\]"]*)*\]')
+
+def _skip_ws(text, pos):
+    return _JSON_WHITESPACE.match(text, pos).end()
+
+def _skip_flat_array(text, pos):
+    """
+    跳过 pos 处 ('[') 不含嵌套数组的 JSON 数组，返回其结束后的位置；无法安全跳过时返回 None。
+    快速路径: 第一个 ']' 之前没有 '[' 和反斜杠、且引号成对，则它就是数组结尾 (全部是 C 层面的查找)。
+    """
+    end = text.find(']', pos + 1)
+    if end < 0:
+        return None
+    if text.find('[', pos + 1, end) < 0 and text.find('\\', pos + 1, end) < 0 and text.count('"', pos + 1, end) % 2 == 0:
+        return end + 1
+    # 慢速路径: 字符串中含有括号或转义字符时用正则逐段扫描
+    match = _FLAT_ARRAY_TAIL.match(text, pos + 1)
+    return match.end() if match else None
+
+def _iter_object_members(text, pos):
+    """
+    逐个产出 JSON 对象成员: 产出 (key, value_pos)，调用方通过 send(新位置) 告知值结束的位置。
+    pos 指向 '{'。生成器结束时返回对象结束后的位置 (StopIteration.value)。
+    """
+    pos = _skip_ws(text, pos + 1)
+    if text[pos] == '}':
+        return pos + 1
+    while True:
+        if text[pos] != '"':
+            raise ValueError(f"选择性解析: 位置 {pos} 处应为对象键")
+        key, pos = json.decoder.scanstring(text, pos + 1)
+        pos = _skip_ws(text, pos)
+        if text[pos] != ':':
+            raise ValueError(f"选择性解析: 位置 {pos} 处应为 ':'")
+        pos = yield key, _skip_ws(text, pos + 1)
+        pos = _skip_ws(text, pos)
+        if text[pos] == ',':
+            pos = _skip_ws(text, pos + 1)
+        elif text[pos] == '}':
+            return pos + 1
+        else:
+            raise ValueError(f"选择性解析: 位置 {pos} 处应为 ',' 或 '}}'")
+
+def _walk_object(text, pos, handle_member):
+    """遍历 pos 处的 JSON 对象，handle_member(key, value_pos) 返回值结束位置；返回对象结束后的位置"""
+    members = _iter_object_members(text, pos)
+    try:
+        key, value_pos = next(members)
+        while True:
+            key, value_pos = members.send(handle_member(key, value_pos))
+    except StopIteration as stop:
+        return stop.value
+
+def _parse_resource(text, pos, wanted):
+    """解析一个场地对象；已知不是偏好场地时跳过其 slotInfo 而不解码。返回 (resource, 结束位置)"""
+    resource = {}
+
+    def handle_member(key, value_pos):
+        if key == 'slotInfo' and 'name' in resource and resource['name'] not in wanted and text[value_pos] == '[':
+            end = _skip_flat_array(text, value_pos)
+            if end is not None:
+                return end # 非偏好场地：只扫描不解码
+        value, end = _JSON_DECODER.raw_decode(text, value_pos)
+        resource[key] = value
+        return end
+
+    return resource, _walk_object(text, pos, handle_member)
+
+def parse_slot_payload_selective(text, wanted_courts):
+    """
+    选择性解析 searchByDate 的响应文本：只解码偏好场地及其 slotInfo，
+    其余场地的 slotInfo 只扫描不构建对象；偏好场地全部找到且已读到 status 后提前结束。
+    返回结构与完整 json.loads 一致 (data.list 中只包含偏好场地；提前结束时 data 中排在 list 之后的字段不会出现)。
+    格式不符合预期时抛出 ValueError，调用方应回退到完整解析。
+    """
+    wanted = set(wanted_courts)
+    payload = {}
+    kept = []
+    pos = _skip_ws(text, 0)
+    if text[pos] != '{':
+        raise ValueError("选择性解析: 响应不是 JSON 对象")
+
+    class _Done(Exception):
+        pass
+
+    def handle_list(value_pos):
+        if text[value_pos] != '[':
+            value, end = _JSON_DECODER.raw_decode(text, value_pos)
+            return end
+        found = set()
+        item_pos = _skip_ws(text, value_pos + 1)
+        if text[item_pos] == ']':
+            return item_pos + 1
+        while True:
+            if text[item_pos] == '{':
+                resource, item_pos = _parse_resource(text, item_pos, wanted)
+                if resource.get('name') in wanted:
+                    kept.append(resource)
+                    found.add(resource['name'])
+                    if found == wanted and 'status' in payload:
+                        raise _Done() # 偏好场地已全部找到，剩余内容不再解析
+            else:
+                _, item_pos = _JSON_DECODER.raw_decode(text, item_pos)
+            item_pos = _skip_ws(text, item_pos)
+            if text[item_pos] == ',':
+                item_pos = _skip_ws(text, item_pos + 1)
+            elif text[item_pos] == ']':
+                return item_pos + 1
+            else:
+                raise ValueError(f"选择性解析: 位置 {item_pos} 处应为 ',' 或 ']'")
+
+    def handle_data_member(key, value_pos):
+        if key == 'list':
+            payload['data']['list'] = kept
+            return handle_list(value_pos)
+        value, end = _JSON_DECODER.raw_decode(text, value_pos)
+        payload['data'][key] = value
+        return end
+
+    def handle_top_member(key, value_pos):
+        if key == 'data' and text[value_pos] == '{':
+            payload['data'] = {}
+            return _walk_object(text, value_pos, handle_data_member)
+        value, end = _JSON_DECODER.raw_decode(text, value_pos)
+        payload[key] = value
+        return end
+
+    try:
+        _walk_object(text, pos, handle_top_member)
+    except _Done:
+        pass
+    except IndexError:
+        raise ValueError("选择性解析: 响应被截断")
+    return payload
@@ -0,0 +1,280 @@
+"""searchByDate 查询 (带错误分类) 与自适应轮询速率"""
+import json
+import threading
+import time
+
+import requests
+
+from .config import (BASE_URL, DEFAULT_CRITICAL_WINDOW, DEFAULT_FAR_WINDOW, DEFAULT_MAX_DELAY,
+                     DEFAULT_MIN_DELAY, DEFAULT_SEARCH_TTL_MS)
+from .logs import log
+from .parsing import parse_slot_payload_selective
+from .tracing import http_started, record_http_spans, record_span, traced
+
+# --- 查询结果的错误类型 ---
+POLL_OK = None
+POLL_TIMEOUT = "timeout"
+POLL_SERVER_ERROR = "server_error"   # HTTP 5xx
+POLL_RATE_LIMITED = "rate_limited"   # HTTP 429 或 "请求过于频繁" 一类提示
+POLL_AUTH_ERROR = "auth_error"
+POLL_API_ERROR = "api_error"         # 其他 status != 0 的业务错误
+POLL_NETWORK_ERROR = "network_error"
+RATE_LIMIT_KEYWORDS = ("频繁", "稍后再试", "限流", "太快")
+
+def _record_poll(poll_info, started, error, http_status=None):
+    """把本次查询的耗时与错误类型写入调用方传入的 poll_info 字典"""
+    if poll_info is not None:
+        poll_info['latency'] = time.perf_counter() - started
+        poll_info['error'] = error
+        poll_info['http_status'] = http_status
+
+def get_slot_details(target_date, event_id, headers, client=None, wanted_courts=None, poll_info=None):
+    """
+    获取指定日期的场地时段信息 (传入 client 时复用其连接池)。
+    传入 wanted_courts 时只解析这些场地 (见 parse_slot_payload_selective)，减少每次轮询的 CPU 与内存开销。
+    传入 poll_info 字典时，会写入本次查询的 latency (秒)、error (POLL_* 常量) 与 http_status，供轮询速率控制使用。
+    client 带有 search_cache (SearchCoalescer) 时，同一 (eventId, 日期) 的并发查询共用一个请求 (见 SearchCoalescer)。
+    """
+    coalescer = getattr(client, 'search_cache', None)
+    if coalescer is None:
+        return _search_by_date(target_date, event_id, headers, client, wanted_courts, poll_info)
+    return coalescer.fetch(target_date, event_id, wanted_courts, poll_info,
+                           lambda courts, info: _search_by_date(target_date, event_id, headers, client, courts, info))
+
+@traced("search")
+def _search_by_date(target_date, event_id, headers, client, wanted_courts, poll_info):
+    """真正发出一次 searchByDate 请求 (参数同 get_slot_details)"""
+    search_url = f"{BASE_URL}/api/v2/appBookGeneral/date/slot/searchByDate"
+    payload = {
+        "date": target_date,
+        "eventId": event_id
+    }
+    log.info("[*] 正在查询日期 %s 的场地时段信息...", target_date)
+    started = time.perf_counter()
+    try:
+        # 确保 Referer 使用当前的 event_id
+        current_headers = headers.copy()
+        current_headers['Referer'] = f'{BASE_URL}/wechat/book3/book.html?type=eventInfo?eventId={event_id}'
+        http = client or requests
+        request_started = http_started()
+        response = http.post(search_url, headers=current_headers, json=payload, timeout=10)
+        record_http_spans("search", response, request_started)
+        response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+        decode_started = time.perf_counter()
+        text = None
+        if wanted_courts:
+            try:
+                text = response.content.decode(response.encoding or 'utf-8')
+                data = parse_slot_payload_selective(text, wanted_courts)
+                record_span("decode", time.perf_counter() - decode_started, op="selective")
+            except (ValueError, UnicodeDecodeError):
+                text = None
+                data = response.json() # 格式不符合预期时回退到完整解析
+                record_span("decode", time.perf_counter() - decode_started, op="fallback")
+        else:
+            data = response.json()
+            record_span("decode", time.perf_counter() - decode_started, op="full")
+        if data.get('status') != 0:
+            message = data.get('message') or ''
+            log.warning("[!] 查询API返回错误: status=%s, message=%s", data.get('status'), data.get('message', '无消息'))
+            # 特别处理 Token 失效常见的 status code (根据实际 API 情况调整)
+            if data.get('status') == 9999 or data.get('status') == 4011: # 假设 9999 或 4011 表示 Token 问题
+                 log.warning("[!] 查询失败：API 返回认证错误，请检查 Token 是否有效或过期。")
+                 _record_poll(poll_info, started, POLL_AUTH_ERROR, response.status_code)
+            elif any(keyword in message for keyword in RATE_LIMIT_KEYWORDS):
+                _record_poll(poll_info, started, POLL_RATE_LIMITED, response.status_code)
+            else:
+                _record_poll(poll_info, started, POLL_API_ERROR, response.status_code)
+            return None
+        log.info("[+] 查询成功 (HTTP %s)", response.status_code)
+        _record_poll(poll_info, started, POLL_OK, response.status_code)
+        history = getattr(client, 'history', None)
+        if history is not None:
+            # 只是入队；只解析了部分场地时交出原始文本，由记录器的后台线程完整解析，历史里仍有全部场地
+            history.record(event_id, target_date, data if text is None else text)
+        return data
+    except requests.exceptions.Timeout:
+        log.warning("[!] 查询时段信息超时。")
+        _record_poll(poll_info, started, POLL_TIMEOUT)
+        return None
+    except requests.exceptions.HTTPError as e:
+        log.warning("[!] 查询时段信息失败 (HTTP %s): %s", e.response.status_code, e)
+        status_code = e.response.status_code
+        if status_code in [401, 403]:
+             log.warning("[!] 查询失败：认证错误 (401/403)，请检查 Token 是否有效或过期。")
+             _record_poll(poll_info, started, POLL_AUTH_ERROR, status_code)
+        elif status_code == 429:
+            _record_poll(poll_info, started, POLL_RATE_LIMITED, status_code)
+        elif status_code >= 500:
+            _record_poll(poll_info, started, POLL_SERVER_ERROR, status_code)
+        else:
+            _record_poll(poll_info, started, POLL_API_ERROR, status_code)
+        # 可以根据需要处理其他状态码
+        return None
+    except requests.exceptions.RequestException as e:
+        log.warning("[!] 查询时段信息失败: %s", e)
+        _record_poll(poll_info, started, POLL_NETWORK_ERROR)
+        return None
+    except json.JSONDecodeError:
+        log.warning("[!] 查询时段信息失败: 无法解析 JSON 响应 - %s...", response.text[:200])
+        _record_poll(poll_info, started, POLL_API_ERROR, response.status_code)
+        return None
+
+# --- 查询合并 ---
+def _covers(have, want):
+    """解析了 have 这些场地的结果能否回答只关心 want 的查询 (None 表示全部场地)"""
+    if have is None:
+        return True
+    return want is not None and want <= have
+
+class _Flight:
+    """一个正在进行的 searchByDate 请求，跟随者等待它完成后共用结果"""
+    __slots__ = ("courts", "done", "data", "poll_info")
+
+    def __init__(self, courts):
+        self.courts = courts
+        self.done = threading.Event()
+        self.data = None
+        self.poll_info = {}
+
+class SearchCoalescer:
+    """
+    同一进程内多个目标/账号查询同一个 (eventId, 日期) 时合并 searchByDate 请求：
+    - single-flight：已有相同查询在途时不再发请求，等它返回后共用结果；
+    - 微 TTL 缓存：成功的结果在 ttl 秒内直接返回给随后到达的查询 (ttl 为 0 时只做 single-flight)。
+    结果只按场地集合向下共享：解析了全部场地 (或场地集合更大) 的结果可以回答只关心部分场地的查询，反之不行；
+    因此每个 key 记住所有查询者关心过的场地，发请求时按它们的并集做选择性解析，第一轮之后各目标的查询都能互相共用。
+    查询失败的结果不进缓存，但会交给同一次在途请求的所有跟随者 (它们各自按 poll_info 退避/重试)。
+    返回的 data 由所有共享者共用，调用方不能修改。
+    """
+    def __init__(self, ttl=DEFAULT_SEARCH_TTL_MS / 1000.0):
+        self.ttl = max(0.0, ttl)
+        self.inflight = {} # (eventId, 日期) -> [_Flight, ...]
+        self.cache = {}    # (eventId, 日期) -> (过期时刻, 场地集合, data, poll_info)
+        self.courts = {}   # (eventId, 日期) -> 查询者关心过的场地并集 (None 表示有查询者要全部场地)
+        self.hits = 0      # 由缓存直接返回的查询数
+        self.misses = 0    # 实际发出请求的查询数
+        self.coalesced = 0 # 等待在途请求、共用其结果的查询数
+        self._lock = threading.Lock()
+
+    def fetch(self, target_date, event_id, wanted_courts, poll_info, search):
+        """
+        返回 (event_id, target_date) 的查询结果；需要真正发请求时调用 search(场地列表或 None, poll_info)。
+        缓存命中或共用在途请求时，poll_info 会填入那次请求的 latency/error/http_status。
+        """
+        key = (event_id, target_date)
+        courts = frozenset(wanted_courts) if wanted_courts else None
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached and cached[0] > time.perf_counter() and _covers(cached[1], courts):
+                self.hits += 1
+                _, _, data, info = cached
+                if poll_info is not None:
+                    poll_info.update(info)
+                return data
+            flight = next((flight for flight in self.inflight.get(key, ()) if _covers(flight.courts, courts)), None)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                known = self.courts.get(key, frozenset())
+                union = None if courts is None or known is None else known | courts
+                self.courts[key] = union
+                leader = _Flight(union)
+                self.inflight.setdefault(key, []).append(leader)
+                self.misses += 1
+        if flight is not None:
+            flight.done.wait()
+            if poll_info is not None:
+                poll_info.update(flight.poll_info)
+            return flight.data
+
+        try:
+            leader.data = search(sorted(leader.courts) if leader.courts else None, leader.poll_info)
+        finally: # search 抛出异常时跟随者得到 None，不会一直等下去
+            with self._lock:
+                flights = self.inflight[key]
+                flights.remove(leader)
+                if not flights:
+                    del self.inflight[key]
+                if leader.data is not None and self.ttl > 0:
+                    self.cache[key] = (time.perf_counter() + self.ttl, leader.courts, leader.data, leader.poll_info)
+            leader.done.set()
+        if poll_info is not None:
+            poll_info.update(leader.poll_info)
+        return leader.data
+
+    def report(self):
+        """打印合并/缓存命中次数与省下的上游请求"""
+        with self._lock:
+            hits, misses, coalesced = self.hits, self.misses, self.coalesced
+        total = hits + misses + coalesced
+        if not total:
+            return
+        log.info(f"[*] 查询合并: 共 {total} 次查询, 实际请求 {misses} 次, 合并在途请求 {coalesced} 次, "
+                 f"缓存命中 {hits} 次 (TTL {self.ttl * 1000:.0f} ms), 省下 {(total - misses) / total:.0%} 的上游请求")
+
+    def stats(self):
+        with self._lock:
+            return {"ttl_ms": self.ttl * 1000, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+# --- 自适应轮询速率 ---
+class PollRateController:
+    """
+    根据距离放号时间的远近、观测到的服务器延迟以及错误信号 (超时、5xx、限流) 决定下一次轮询前的等待时间：
+    放号前后的关键几秒内全速轮询；离放号还远时放慢；服务器吃力时指数退避。
+    每次决策都会打印出来，便于调参。
+    """
+    def __init__(self, release_epoch, base_delay, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 critical_window=DEFAULT_CRITICAL_WINDOW, far_window=DEFAULT_FAR_WINDOW):
+        self.release_epoch = release_epoch
+        self.base_delay = base_delay
+        self.min_delay = min(min_delay, base_delay)
+        self.max_delay = max(max_delay, base_delay)
+        self.critical_window = critical_window
+        self.far_window = max(far_window, critical_window)
+        self.backoff = 1.0
+        self.latency_ewma = None
+        self.decisions = 0
+
+    def next_delay(self, poll_info=None, now=None):
+        """根据本次查询结果 (get_slot_details 填写的 poll_info) 计算下一次轮询前的等待秒数"""
+        now = time.time() if now is None else now
+        poll_info = poll_info or {}
+        error = poll_info.get('error')
+        latency = poll_info.get('latency')
+        if latency is not None and error != POLL_TIMEOUT:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+
+        # 1. 距离放号时间: 关键窗口内全速，远离放号时放慢，中间线性过渡
+        distance = self.release_epoch - now
+        if abs(distance) <= self.critical_window:
+            delay, reason = self.min_delay, f"关键窗口 (距放号 {distance:+.2f}s)"
+        elif distance > self.far_window:
+            delay, reason = self.max_delay, f"距放号还远 ({distance:.0f}s)"
+        elif distance > 0:
+            ratio = (distance - self.critical_window) / (self.far_window - self.critical_window)
+            delay = self.min_delay + ratio * (self.max_delay - self.min_delay)
+            reason = f"接近放号 ({distance:.1f}s)"
+        else:
+            delay, reason = self.base_delay, f"放号后常规轮询 ({-distance:.1f}s)"
+
+        # 2. 服务器变慢时 (关键窗口外) 不让请求堆积：等待时间不少于平均延迟
+        if self.latency_ewma is not None and abs(distance) > self.critical_window and delay < self.latency_ewma:
+            delay = self.latency_ewma
+            reason += f", 服务器延迟 {self.latency_ewma * 1000:.0f}ms"
+
+        # 3. 错误信号: 限流/5xx/超时指数退避，成功后逐步恢复
+        if error in (POLL_RATE_LIMITED, POLL_SERVER_ERROR, POLL_TIMEOUT):
+            self.backoff = min(self.backoff * 2, 32.0)
+            reason += f", {error} 退避 x{self.backoff:.0f}"
+        else:
+            self.backoff = max(1.0, self.backoff / 2)
+            if self.backoff > 1.0:
+                reason += f", 退避恢复中 x{self.backoff:.0f}"
+        if self.backoff > 1.0:
+            delay = max(delay, self.min_delay * self.backoff, self.base_delay * self.backoff / 2)
+
+        delay = min(max(delay, 0.0), self.max_delay * (self.backoff if error == POLL_RATE_LIMITED else 1))
+        self.decisions += 1
+        log.info("[*] 轮询间隔决策 #%d: %.3fs (%s)", self.decisions, delay, reason)
+        return delay
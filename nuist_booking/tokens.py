@@ -0,0 +1,119 @@
+"""Token 生命周期：本地解码 exp，并支持从文件热加载新 Token"""
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from .config import BEIJING_TZ, DEFAULT_TOKEN_CHECK_INTERVAL
+from .logs import log
+
+def token_expiry(token):
+    """
+    本地解码 JWT payload 中的 exp (不校验签名，只用来判断有效期)。
+    Returns:
+        float: 过期时间 (Unix 时间戳)；不是 JWT 或没有 exp 时返回 None。
+    """
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    exp = claims.get('exp') if isinstance(claims, dict) else None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+def describe_token(token):
+    """用于日志的 Token 摘要：前后几位 + 过期时间"""
+    exp = token_expiry(token)
+    expiry_text = datetime.fromtimestamp(exp, BEIJING_TZ).strftime('%m-%d %H:%M:%S') if exp else "未知"
+    return f"{token[:15]}...{token[-15:]} (过期时间: {expiry_text})"
+
+class TokenManager:
+    """
+    持有各账号当前的 Token (顺序与账号一致)。
+    指定 token_file 时按 mtime 轮询该文件 (每行一个 Token，# 开头为注释)，文件更新后无需重启即可换上新 Token，
+    预热好的进程与连接池都保持不变。其他渠道 (例如守护进程的接口) 可以直接调用 update()。
+    """
+    def __init__(self, tokens, token_file=None, check_interval=DEFAULT_TOKEN_CHECK_INTERVAL):
+        self.lock = threading.Lock()
+        self.tokens = list(tokens)
+        self.token_file = token_file
+        self.check_interval = check_interval
+        self.file_mtime = None
+        self.next_check = 0.0
+        self.reloads = 0
+        if token_file:
+            self.reload(force=True)
+
+    def update(self, tokens, source=""):
+        """换上一组新 Token；返回是否有变化"""
+        tokens = [token for token in tokens if token]
+        if not tokens:
+            return False
+        with self.lock:
+            if tokens == self.tokens:
+                return False
+            self.tokens = tokens
+            self.reloads += 1
+        log.info(f"[*] 已更新 {len(tokens)} 个 Token{f' (来自 {source})' if source else ''}:")
+        for token in tokens:
+            log.info(f"[*]   {describe_token(token)}")
+        return True
+
+    def reload(self, force=False):
+        """检查 token_file 是否有更新 (最多每 check_interval 秒一次 stat，force 时立即检查)；返回 Token 是否有变化"""
+        if not self.token_file:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if not force and now < self.next_check:
+                return False
+            self.next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.token_file).st_mtime_ns
+                if mtime == self.file_mtime:
+                    return False
+                with open(self.token_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                log.warning(f"[!] 读取 Token 文件失败 ({self.token_file}): {e}")
+                return False
+            self.file_mtime = mtime
+        tokens = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+        if not tokens:
+            log.warning(f"[!] Token 文件 ({self.token_file}) 为空，继续使用现有 Token。")
+            return False
+        return self.update(tokens, source=self.token_file)
+
+    def current(self):
+        """返回当前的 Token 列表 (必要时先检查文件更新)"""
+        self.reload()
+        with self.lock:
+            return list(self.tokens)
+
+    def apply(self, accounts):
+        """把当前 Token 写回各账号 (按顺序)，之后构建的请求头都会使用新 Token；因认证失败停止的账号换上新 Token 后恢复"""
+        tokens = self.current()
+        for account, token in zip(accounts, tokens):
+            if account['token'] != token and account.get('blocked') == "auth":
+                account['blocked'] = None
+            account['token'] = token
+
+    def expiring_before(self, deadline):
+        """返回会在 deadline (Unix 时间戳) 之前过期的 Token 列表 [(token, exp)]；没有 exp 的 Token 不计入"""
+        result = []
+        for token in self.current():
+            exp = token_expiry(token)
+            if exp is not None and exp <= deadline:
+                result.append((token, exp))
+        return result
+
+    def all_expired(self, now=None):
+        """所有 Token 都能解出 exp 且都已过期时返回 True"""
+        now = time.time() if now is None else now
+        tokens = self.current()
+        return bool(tokens) and len(self.expiring_before(now)) == len(tokens)
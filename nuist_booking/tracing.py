@@ -0,0 +1,197 @@
+"""阶段耗时追踪 (JSONL 追踪文件 + Prometheus 文本指标)；未安装追踪器时所有调用都是空操作"""
+import functools
+import json
+import queue
+import threading
+import time
+
+from .config import DEFAULT_METRICS_HOST
+
+TRACE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_TRACE_STOP = object() # 通知写出线程结束
+
+class PhaseTracer:
+    """
+    记录热路径上每个阶段的耗时 (span)：dns、connect、ttfb、download、decode、match、diff、search、book。
+    每个 span 累计到按 (phase, op) 区分的直方图里，供 /metrics 输出；指定追踪文件时还写成其中的一行 JSON。
+    与 logs.py 的日志一样，调用线程只在锁内更新直方图，span 字典放进队列后就返回，
+    JSON 序列化、写文件与刷盘都在后台线程完成，不占用轮询/预约线程的时间，也不在锁内等待磁盘。
+    dns 只在 BookingClient.pin_host (预热时固定 IP) 中记录；没有固定 IP 的连接 (例如 https) 由 urllib3 在建立连接时解析域名，
+    这部分时间包含在 connect span 里，不单独出现。
+    """
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.trace_file = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+        self.spans = queue.SimpleQueue() if self.trace_file else None # 等待写出的 span 字典
+        self.attempt = 0
+        self.last_attempt = (0, "") # 没有自己发起尝试的线程 (例如并发预约线程) 归到最近一轮
+        self.histograms = {} # (phase, op) -> [各桶累计计数, 总耗时, 次数]
+        self.results = {}    # (phase, ok) -> 次数
+        self.writer = None
+        if self.trace_file:
+            self.writer = threading.Thread(target=self._write_spans, args=(self.spans,), name="trace", daemon=True)
+            self.writer.start()
+
+    def begin_attempt(self, label=""):
+        """开始新一轮尝试；当前线程之后记录的 span 都带上这一轮的编号 (多目标并发轮询时互不干扰)"""
+        with self.lock:
+            self.attempt += 1
+            self.last_attempt = _trace_local.attempt = (self.attempt, label)
+            return self.attempt
+
+    def record(self, phase, seconds, op="", ok=None, **attrs):
+        with self.lock:
+            histogram = self.histograms.get((phase, op))
+            if histogram is None:
+                histogram = self.histograms[(phase, op)] = [[0] * len(TRACE_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(TRACE_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if ok is not None:
+                self.results[(phase, ok)] = self.results.get((phase, ok), 0) + 1
+        spans = self.spans
+        if spans is None:
+            return
+        # 所属的一轮与线程名只能在调用线程里取；序列化与写文件留给写出线程
+        attempt, label = getattr(_trace_local, 'attempt', None) or self.last_attempt
+        span = {"ts": round(time.time(), 6), "attempt": attempt, "phase": phase, "ms": round(seconds * 1000, 3)}
+        if label:
+            span["target"] = label
+        if op:
+            span["op"] = op
+        if ok is not None:
+            span["ok"] = ok
+        span["thread"] = threading.current_thread().name
+        span.update(attrs)
+        spans.put(span)
+
+    def _write_spans(self, spans):
+        """后台线程：把队列中的 span 逐行写入追踪文件，队列暂时排空时刷一次盘"""
+        while True:
+            span = spans.get()
+            if span is _TRACE_STOP:
+                break
+            self.trace_file.write(json.dumps(span, ensure_ascii=False) + "\n")
+            if spans.empty():
+                self.trace_file.flush()
+
+    def render_metrics(self):
+        """按 Prometheus 文本格式 (0.0.4) 输出累计的直方图与计数"""
+        with self.lock:
+            lines = [
+                "# HELP nuist_phase_duration_seconds Duration of each hot-path phase.",
+                "# TYPE nuist_phase_duration_seconds histogram",
+            ]
+            for (phase, op), (buckets, total, count) in sorted(self.histograms.items()):
+                labels = f'phase="{phase}",op="{op}"'
+                for bound, bucket_count in zip(TRACE_BUCKETS, buckets):
+                    lines.append(f'nuist_phase_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'nuist_phase_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"nuist_phase_duration_seconds_sum{{{labels}}} {total:.6f}")
+                lines.append(f"nuist_phase_duration_seconds_count{{{labels}}} {count}")
+            lines += [
+                "# HELP nuist_phase_results_total Outcome of each traced call (ok=true: data returned / candidates found / booked).",
+                "# TYPE nuist_phase_results_total counter",
+            ]
+            for (phase, ok), count in sorted(self.results.items()):
+                lines.append(f'nuist_phase_results_total{{phase="{phase}",ok="{str(ok).lower()}"}} {count}')
+            lines += [
+                "# HELP nuist_attempts_total Booking attempts (polling rounds) started.",
+                "# TYPE nuist_attempts_total counter",
+                f"nuist_attempts_total {self.attempt}",
+            ]
+            return "\n".join(lines) + "\n"
+
+    def close(self):
+        """写完队列中剩余的 span 后关闭追踪文件；之后记录的 span 只进入直方图"""
+        with self.lock:
+            spans, self.spans = self.spans, None
+        if spans is None:
+            return
+        spans.put(_TRACE_STOP)
+        self.writer.join()
+        self.trace_file.close()
+        self.trace_file = None
+
+_active_tracer = None # 由 install_tracer 设置；为 None 时所有追踪调用都是空操作
+_trace_local = threading.local() # 每个线程最近一次新建连接的耗时，用于从 TTFB 中扣除
+
+def install_tracer(tracer):
+    global _active_tracer
+    _active_tracer = tracer
+
+def record_span(phase, seconds, op="", ok=None, **attrs):
+    if _active_tracer is not None:
+        _active_tracer.record(phase, seconds, op, ok, **attrs)
+
+def begin_attempt(label=""):
+    if _active_tracer is not None:
+        _active_tracer.begin_attempt(label)
+
+def traced(phase):
+    """装饰器：把整个函数调用记录为一个 span，返回值的真假作为 ok"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active_tracer is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                record_span(phase, time.perf_counter() - started, ok=bool(result), func=func.__name__)
+        return wrapper
+    return decorate
+
+def http_started():
+    """在发送请求前调用：清零当前线程的连接耗时记录并返回起始时刻"""
+    _trace_local.connect_seconds = 0.0
+    return time.perf_counter()
+
+def record_http_spans(op, response, started):
+    """
+    根据一次已完成的请求记录 ttfb 与 download 两个 span。
+    requests 的 response.elapsed 覆盖从发送到收到响应头 (含可能的新建连接)，扣除连接耗时即为 TTFB；
+    其余到 body 读完的时间记为 download。
+    """
+    if _active_tracer is None:
+        return
+    total = time.perf_counter() - started
+    header_time = response.elapsed.total_seconds()
+    connect_time = getattr(_trace_local, 'connect_seconds', 0.0)
+    record_span("ttfb", max(0.0, header_time - connect_time), op=op, http_status=response.status_code)
+    record_span("download", max(0.0, total - header_time), op=op, bytes=len(response.content))
+
+def record_connect(seconds, **attrs):
+    """由计时连接类在新建 TCP 连接后调用：记下本线程的连接耗时 (供 TTFB 扣除) 并记录 connect span"""
+    _trace_local.connect_seconds = seconds
+    record_span("connect", seconds, **attrs)
+
+def start_metrics_server(tracer, port, host=DEFAULT_METRICS_HOST):
+    """在后台线程中提供 Prometheus 文本格式的 /metrics 端点，返回 HTTP 服务器对象 (调用 shutdown() 停止)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # 只在启用指标端点时才需要
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = tracer.render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # 抓取请求不打印到控制台
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    return httpd
@@ -0,0 +1,74 @@
+"""触发时间的解析与校验，以及精确等待到触发时刻 (只依赖标准库，参数解析阶段即可使用)"""
+import argparse
+import re
+import time
+from datetime import datetime, timedelta
+
+from .config import BEIJING_TZ, DEFAULT_SPIN_MS
+from .logs import log
+
+# --- 时间格式验证函数 (保持不变) ---
+def validate_time_format(time_str):
+    """验证时间字符串是否为 HH:MM 格式"""
+    if not re.match(r'^([01]\d|2[0-3]):([0-5]\d)$', time_str):
+        raise argparse.ArgumentTypeError(f"无效的时间格式: '{time_str}'. 请使用 HH:MM 格式 (例如: 08:04, 15:30)。")
+    return time_str
+
+def validate_trigger_time(time_str):
+    """验证触发时间格式：HH:MM、HH:MM:SS 或 HH:MM:SS.fff (亚秒精度)"""
+    if not re.match(r'^([01]\d|2[0-3]):([0-5]\d)(:([0-5]\d)(\.\d{1,6})?)?$', time_str):
+        raise argparse.ArgumentTypeError(f"无效的触发时间格式: '{time_str}'. 请使用 HH:MM、HH:MM:SS 或 HH:MM:SS.fff 格式 (例如: 08:04, 08:00:00.150)。")
+    return time_str
+
+# --- 精确触发 (替代 schedule 的 1 秒轮询) ---
+def parse_trigger_time(time_str):
+    """把 HH:MM[:SS[.fff]] 解析为当天零点起的秒数 (浮点数)"""
+    parts = time_str.split(':')
+    hours, minutes = int(parts[0]), int(parts[1])
+    seconds = float(parts[2]) if len(parts) > 2 else 0.0
+    return hours * 3600 + minutes * 60 + seconds
+
+def next_trigger_epoch(time_str, now_epoch=None):
+    """计算下一次到达北京时间 time_str 的 Unix 时间戳 (秒，浮点数)"""
+    if now_epoch is None:
+        now_epoch = time.time()
+    now = datetime.fromtimestamp(now_epoch, BEIJING_TZ)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    target = midnight.timestamp() + parse_trigger_time(time_str)
+    if target <= now_epoch:
+        target += 24 * 3600
+    return target
+
+def rolled_target_date(fire_epoch, days_ahead=1):
+    """
+    以触发时刻所在的北京时间日期为基准往后推 days_ahead 天，作为这次触发要预约的日期。
+    每天运行时目标日期随触发日期前进，而不是停留在启动 (导入) 当天算出的“明天”。
+    """
+    fire_day = datetime.fromtimestamp(fire_epoch, BEIJING_TZ).date()
+    return (fire_day + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+
+def wait_until(target_epoch, spin_seconds=DEFAULT_SPIN_MS / 1000.0, label=""):
+    """
+    等待到 target_epoch (本机 Unix 时间戳) 为止：先粗粒度 sleep，
+    最后 spin_seconds 内改用 perf_counter 忙等，以获得亚毫秒级的触发精度。
+    Returns:
+        float: 实际触发时刻与目标时刻的偏差 (秒，正数表示晚了)。
+    """
+    last_print_minute = None
+    while True:
+        remaining = target_epoch - time.time()
+        if remaining <= spin_seconds:
+            break
+        now = datetime.now(BEIJING_TZ)
+        # 每分钟打印一次等待信息，避免刷屏
+        if now.minute != last_print_minute:
+            log.info(f"[*] 当前时间 (北京时间): {now.strftime('%Y-%m-%d %H:%M:%S')}, 距离目标时间 {label} 还有 {remaining:.1f} 秒...")
+            last_print_minute = now.minute
+        # 粗等待：最多睡到分钟边界或 spin 窗口开始，避免一次睡过头
+        time.sleep(min(remaining - spin_seconds, 60 - now.second - now.microsecond / 1e6, 30))
+
+    # 精等待：把剩余时间换算到单调时钟上忙等，不受系统时间调整影响
+    deadline = time.perf_counter() + (target_epoch - time.time())
+    while time.perf_counter() < deadline:
+        pass
+    return time.time() - target_epoch
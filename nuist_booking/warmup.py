@@ -0,0 +1,185 @@
+"""触发前的准备：服务器时钟校准、连接预热与保活"""
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from .client import build_headers
+from .config import BASE_URL, BEIJING_TZ, DEFAULT_CALIBRATION_SAMPLES, DEFAULT_KEEPALIVE_INTERVAL
+from .logs import log
+from .match import find_ranked_available_slots
+from .search import get_slot_details
+
+# --- 服务器时钟校准 ---
+def estimate_server_clock_offset(client, samples=DEFAULT_CALIBRATION_SAMPLES, url=None, deadline=None):
+    """
+    通过 HTTP Date 响应头估计服务器时钟与本机时钟的偏差。
+
+    Date 头只有秒级精度：若请求在本机时间 [t0, t1] 内往返、服务器返回的 Date 为 S，
+    则服务器时钟偏差 offset = 服务器时间 - 本机时间 必定落在 [S - t1, S + 1 - t0] 内。
+    多次采样取交集；第二次起把请求安排在预计的服务器整秒边界附近发出，使区间不断收窄。
+    每次对齐整秒最多要等 1 秒，传入 deadline (本机 Unix 时间) 时，来不及在它之前完成的采样不再进行，
+    用已有的样本给出结果并打印警告，校准不会拖过触发时刻。
+
+    Returns:
+        dict: {"offset", "lower", "upper", "error", "one_way_latency", "min_rtt", "samples"}，
+              单位均为秒；没有任何有效样本时返回 None。
+    """
+    url = url or BASE_URL
+    lower, upper = -math.inf, math.inf
+    min_rtt = math.inf
+    best_midpoint = None # 交集为空时的后备估计 (RTT 最小的那次采样)
+    valid = 0
+
+    for i in range(samples):
+        if valid and math.isfinite(lower) and math.isfinite(upper):
+            # 把请求安排在服务器时钟即将跨过整秒的时刻到达，以最大程度地切分区间
+            predicted = (lower + upper) / 2
+            one_way = min_rtt / 2
+            now = time.time()
+            server_arrival = now + one_way + predicted
+            wait = math.ceil(server_arrival) - server_arrival
+            if wait < 0.05:
+                wait += 1.0
+            if deadline is not None and now + wait + min_rtt > deadline:
+                log.warning(f"[!] 时钟校准: 截止时刻前来不及再采样，只用了 {valid}/{samples} 次采样 "
+                            "(可增大 --calibrate-lead 或减少 --calibrate-samples)")
+                break
+            time.sleep(wait)
+        elif deadline is not None and time.time() >= deadline:
+            log.warning(f"[!] 时钟校准: 已过截止时刻，只用了 {valid}/{samples} 次采样")
+            break
+        t0 = time.time()
+        timeout = 5 if deadline is None else max(0.1, min(5, deadline - t0))
+        try:
+            response = client.head(url, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            log.warning(f"[!] 时钟校准第 {i + 1} 次采样失败: {e}")
+            continue
+        t1 = time.time()
+        date_header = response.headers.get('Date')
+        if not date_header:
+            log.warning("[!] 服务器响应没有 Date 头，无法校准时钟。")
+            return None
+        try:
+            server_second = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            log.warning(f"[!] 无法解析 Date 头: {date_header}")
+            continue
+
+        valid += 1
+        rtt = t1 - t0
+        if rtt < min_rtt:
+            min_rtt = rtt
+            best_midpoint = server_second + 0.5 - (t0 + t1) / 2
+        new_lower = max(lower, server_second - t1)
+        new_upper = min(upper, server_second + 1 - t0)
+        if new_lower > new_upper:
+            # 区间矛盾 (服务器 Date 取整方式不同或时钟跳变)，丢弃之前的交集重新收敛
+            new_lower, new_upper = server_second - t1, server_second + 1 - t0
+        lower, upper = new_lower, new_upper
+
+    if not valid:
+        return None
+    if not (math.isfinite(lower) and math.isfinite(upper)):
+        lower = upper = best_midpoint
+    return {
+        "offset": (lower + upper) / 2,
+        "lower": lower,
+        "upper": upper,
+        "error": (upper - lower) / 2,
+        "one_way_latency": min_rtt / 2,
+        "min_rtt": min_rtt,
+        "samples": valid,
+    }
+
+def print_clock_calibration(calibration):
+    """打印时钟校准结果"""
+    if not calibration:
+        log.warning("[!] 时钟校准失败，将使用本机时钟触发。")
+        return
+    log.info(f"[*] 服务器时钟偏差: {calibration['offset'] * 1000:+.1f} ms "
+          f"(误差 ±{calibration['error'] * 1000:.1f} ms, 区间 [{calibration['lower'] * 1000:+.1f}, {calibration['upper'] * 1000:+.1f}] ms)")
+    log.info(f"[*] 单程延迟估计: {calibration['one_way_latency'] * 1000:.1f} ms "
+          f"(最小 RTT {calibration['min_rtt'] * 1000:.1f} ms, 有效样本 {calibration['samples']} 个)")
+
+# --- 连接预热 ---
+def warm_up_client(client, connections=None, target_date=None, event_id=None, auth_token=None):
+    """
+    在触发前预热：固定 DNS 解析结果、并发打开连接池中的全部连接，
+    并执行一次查询/匹配/JSON 编解码，让解释器层面的懒加载在临界区之外完成。
+    Returns:
+        dict: 各阶段耗时 (秒) 与打开的连接数，用于报告从临界区移走的开销。
+    """
+    report = {"dns": 0.0, "connect": 0.0, "interpreter": 0.0, "pinned_ip": None, "connections": 0}
+    connections = connections or client.pool_size
+
+    started = time.perf_counter()
+    try:
+        report["pinned_ip"] = client.pin_host()
+    except OSError as e:
+        log.warning(f"[!] 预热: DNS 解析失败，将继续使用域名访问: {e}")
+    report["dns"] = time.perf_counter() - started
+
+    # 同时发出 connections 个请求，迫使连接池建立相应数量的独立连接
+    before = client.connection_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [executor.submit(client.head, BASE_URL, timeout=5) for _ in range(connections)]
+        for future in futures:
+            try:
+                future.result()
+            except requests.exceptions.RequestException as e:
+                log.warning(f"[!] 预热: 打开连接失败: {e}")
+    report["connect"] = time.perf_counter() - started
+    report["connections"] = client.connection_stats()["opened"] - before["opened"]
+
+    # 走一遍真实的查询与匹配逻辑 (结果丢弃)，触发 requests/json 等模块内部的首次初始化
+    started = time.perf_counter()
+    if auth_token and target_date and event_id:
+        slot_data = get_slot_details(target_date, event_id, build_headers(auth_token), client=client)
+        find_ranked_available_slots(slot_data, target_date, {})
+    json.loads(json.dumps({"records": [{"bookSlot": "预热"}]}, ensure_ascii=False))
+    datetime.now(BEIJING_TZ).strftime('%Y-%m-%d %H:%M:%S %Z%z')
+    report["interpreter"] = time.perf_counter() - started
+    return report
+
+def print_warmup_report(report):
+    """打印预热报告"""
+    total = report["dns"] + report["connect"] + report["interpreter"]
+    log.info(f"[*] 预热完成: 已从临界区移走约 {total * 1000:.1f} ms 的开销")
+    log.info(f"[*]   DNS 解析: {report['dns'] * 1000:.1f} ms (固定 IP: {report['pinned_ip'] or '未固定'})")
+    log.info(f"[*]   建立连接: {report['connect'] * 1000:.1f} ms (新建 {report['connections']} 个 keep-alive 连接)")
+    log.info(f"[*]   解释器预热 (首次查询/解析): {report['interpreter'] * 1000:.1f} ms")
+
+class ConnectionKeeper(threading.Thread):
+    """预热后定期发送轻量请求，让连接池中的连接在触发前保持存活"""
+    def __init__(self, client, interval=DEFAULT_KEEPALIVE_INTERVAL, stop_at=None):
+        super().__init__(daemon=True)
+        self.client = client
+        self.interval = interval
+        self.stop_at = stop_at # 本机时间戳，到点自动停止，避免保活请求占用触发时刻的连接
+        self.pings = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            if self.stop_at is not None and time.time() + self.interval / 2 >= self.stop_at:
+                break
+            connections = self.client.pool_size
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                futures = [executor.submit(self.client.head, BASE_URL, timeout=2) for _ in range(connections)]
+                for future in futures:
+                    try:
+                        future.result()
+                        self.pings += 1
+                    except requests.exceptions.RequestException:
+                        pass
+
+    def stop(self):
+        self._stop_event.set()
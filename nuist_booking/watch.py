@@ -0,0 +1,132 @@
+"""多目标监视：一个进程同时监视多个 (eventId, 日期)，共享连接池与请求预算"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .booking import (BookingRetryPolicy, accounts_finished, assign_slots_to_accounts, book_for_accounts,
+                      make_accounts, print_account_stats)
+from .client import build_headers
+from .config import (DEFAULT_CONCURRENCY, DEFAULT_EVENT_ID, DEFAULT_MAX_RETRIES, DEFAULT_MAX_WORKERS,
+                     DEFAULT_RETRY_DELAY)
+from .logs import log
+from .match import SlotDiffEngine, build_preference_index, find_ranked_slots_in_events
+from .search import get_slot_details
+from .tracing import begin_attempt
+
+def load_targets(path, default_date, default_courts, default_times, default_book_all):
+    """
+    读取目标列表 JSON 文件，每项形如:
+        {"event": "...", "date": "2025-04-20" 或 "dates": [...], "courts": [...], "times": [...], "book_all": false}
+    未给出的字段使用命令行参数的值。
+    Returns:
+        list: 展开后的目标字典列表 (每个日期一项)。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        dates = entry.get('dates') or [entry.get('date') or default_date]
+        for target_date in dates:
+            targets.append({
+                "event": entry.get('event') or DEFAULT_EVENT_ID,
+                "date": target_date,
+                "courts": entry.get('courts') or default_courts,
+                "times": entry.get('times') or default_times,
+                "book_all": entry.get('book_all', default_book_all),
+                "top_n": entry.get('top_n', 0),
+            })
+    return targets
+
+class TargetWatcher:
+    """单个 (eventId, 日期) 目标：拥有自己的偏好索引、差异快照、账号统计与预约策略"""
+    def __init__(self, target, tokens, recoverable=()):
+        self.event_id = target['event']
+        self.target_date = target['date']
+        self.courts = target['courts']
+        self.book_all = target['book_all']
+        self.top_n = target['top_n']
+        self.preference_index = build_preference_index(target['courts'], target['times'])
+        self.differ = SlotDiffEngine()
+        self.accounts = make_accounts(tokens)
+        self.recoverable = recoverable # 可恢复的 blocked 原因 (例如有 Token 文件时的 auth)
+        self.last_outcomes = []
+        self.polls = 0
+        self.label = f"{self.target_date} {self.event_id[:8]}"
+
+    @property
+    def done(self):
+        return accounts_finished(self.accounts, self.recoverable)
+
+    def poll_once(self, client, concurrency=DEFAULT_CONCURRENCY, batch_size=1):
+        """查询一次，只对新变为可约的偏好时段发起预约；返回本次成功预约数"""
+        self.polls += 1
+        self.last_outcomes = []
+        begin_attempt(self.label)
+        headers = build_headers(self.accounts[0]['token'])
+        slot_data = get_slot_details(self.target_date, self.event_id, headers, client=client, wanted_courts=self.courts)
+        if not slot_data:
+            return 0
+        candidates = find_ranked_slots_in_events(self.differ.diff(slot_data), self.target_date, self.preference_index)
+        if not candidates:
+            return 0
+        log.info("[***] [%s] 找到 %d 个新的可约偏好时段，将尝试预约...", self.label, len(candidates))
+        results = book_for_accounts(assign_slots_to_accounts(candidates, self.accounts), self.event_id, client,
+                                    concurrency=concurrency, top_n=self.top_n, book_all=self.book_all,
+                                    batch_size=batch_size)
+        self.last_outcomes = [outcome for _, _, outcome, _ in results]
+        booked_ids = {slot['bookSlotId'] for _, slot, outcome, _ in results if outcome}
+        for slot in candidates:
+            if slot['bookSlotId'] not in booked_ids:
+                self.differ.forget(slot['bookSlotId'])
+        return len(booked_ids)
+
+def watch_targets(watchers, client, max_workers=DEFAULT_MAX_WORKERS, max_rounds=DEFAULT_MAX_RETRIES,
+                  delay=DEFAULT_RETRY_DELAY, concurrency=DEFAULT_CONCURRENCY, token_manager=None, batch_size=1):
+    """
+    在有界线程池上并发轮询多个目标，所有请求共享 client 的连接池 (及其请求预算)。
+    每轮对所有未完成的目标各查询一次，直到全部完成或达到 max_rounds 轮。
+    传入 token_manager 时每轮开始前换上最新的 Token，所有 Token 都过期后停止。
+    每轮之后的等待时间由 BookingRetryPolicy 按本轮各目标的预约错误类别调整。
+    """
+    rounds = 0
+    retry_policy = BookingRetryPolicy(delay)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while rounds < max_rounds:
+            if token_manager:
+                if token_manager.all_expired():
+                    log.error("[!] 所有 Token 均已过期，停止轮询。请更新 Token 文件或重新运行。")
+                    break
+                for watcher in watchers:
+                    token_manager.apply(watcher.accounts)
+            active = [watcher for watcher in watchers if not watcher.done]
+            if not active:
+                log.info("\n[***] 所有目标均已结束 (预约成功或遇到无法重试的错误)。 ***")
+                break
+            rounds += 1
+            log.info("\n--- 第 %d/%d 轮: 轮询 %d 个目标 ---", rounds, max_rounds, len(active))
+            futures = {executor.submit(watcher.poll_once, client, concurrency, batch_size): watcher for watcher in active}
+            for future in as_completed(futures):
+                watcher = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    log.warning("[!] [%s] 轮询时遇到意外错误: %s", watcher.label, e, exc_info=True)
+            if rounds < max_rounds and any(not watcher.done for watcher in watchers):
+                outcomes = [outcome for watcher in active for outcome in watcher.last_outcomes]
+                time.sleep(retry_policy.next_delay(outcomes, delay))
+        else:
+            log.info(f"\n[---] 已达到最大轮数 ({max_rounds})。 ---")
+
+    if client.hedger:
+        client.hedger.settle() # 晚到的对冲请求返回后才知道有没有重复预约
+    for watcher in watchers:
+        log.info(f"[*] 目标 {watcher.label}: 轮询 {watcher.polls} 次, {'已结束' if watcher.done else '未完成'}")
+        print_account_stats(watcher.accounts)
+    if retry_policy.counts:
+        log.info(f"[*] 预约错误分类: {retry_policy.summary()}")
+    if client.hedger:
+        client.hedger.report()
+    if client.search_cache:
+        client.search_cache.report()
+    if client.budget:
+        log.info(f"[*] 请求预算: 共放行 {client.budget.granted} 个请求, 因预算限制累计等待 {client.budget.waited:.2f} 秒")
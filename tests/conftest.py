@@ -0,0 +1,26 @@
+import os
+import sys
+import time
+
+import pytest
+
+# 测试直接导入仓库里的 nuist_booking 与 mock_server (没有安装成包)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """
+    在后台线程里运行 mock_server.MockBookingServer (已放号、无延迟)，并把 nuist_booking 的 BASE_URL 指向它。
+    BASE_URL 在各模块导入时就已取值，所以逐个模块替换。
+    """
+    from mock_server import MockBookingServer
+    from nuist_booking import booking, client, config, search, warmup
+
+    server = MockBookingServer(release_epoch=time.time() - 1, latency_ms=0, max_unused=10, seed=1)
+    base_url = server.start()
+    for module in (config, client, search, booking, warmup):
+        monkeypatch.setattr(module, "BASE_URL", base_url)
+    yield server
+    server.stop()
@@ -0,0 +1,121 @@
+"""守护进程的任务存储 (JobStore)、任务校验 (build_job) 与重启后的任务恢复 (BookingDaemon._resume)"""
+import threading
+import time
+
+import pytest
+
+from nuist_booking.daemon import BookingDaemon, build_job
+from nuist_booking.jobstore import (JOB_ARMED, JOB_FAILED, JOB_MISSED, JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED,
+                                    JobStore)
+from nuist_booking.trigger import rolled_target_date
+
+DEFAULTS = {"event": "event", "courts": ["场地1"], "times": ["18:00"], "trigger": None, "daily": False,
+            "book_all": False, "top_n": 0, "max_retries": 10, "retry_delay": 1.0, "date": None, "days_ahead": 1}
+
+def make_job(next_fire, **spec):
+    job = build_job(spec, DEFAULTS, now=next_fire)
+    job["next_fire"] = next_fire
+    return job
+
+def test_add_get_list_and_due():
+    store = JobStore()
+    ids = store.add([make_job(300.0), make_job(100.0, courts=["场地2", "场地3"], book_all=True), make_job(200.0)])
+    assert ids == [1, 2, 3]
+    job = store.get(2)
+    assert job["courts"] == ["场地2", "场地3"] and job["book_all"] is True and job["booked"] == []
+    assert job["status"] == JOB_PENDING and job["daily"] is False
+    assert store.get(99) is None
+    assert [job["id"] for job in store.list()] == [1, 2, 3]
+    assert store.next_fire() == 100.0
+    assert [job["id"] for job in store.due(250.0)] == [2, 3]
+
+    store.update(2, status=JOB_SUCCEEDED, booked=[{"court": "场地2"}])
+    assert store.get(2)["booked"] == [{"court": "场地2"}]
+    assert [job["id"] for job in store.list(status=JOB_PENDING, limit=1)] == [1]
+    assert store.next_fire() == 200.0
+    assert store.counts() == {JOB_PENDING: 2, JOB_SUCCEEDED: 1}
+    assert store.add([make_job(50.0)]) == [4]
+    store.close()
+
+def test_jobs_survive_reopen(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    store.add([make_job(100.0, times=["18:00", "19:00"])])
+    store.close()
+    store = JobStore(path)
+    try:
+        assert store.get(1)["times"] == ["18:00", "19:00"]
+        assert store.add([make_job(200.0)]) == [2]
+    finally:
+        store.close()
+
+@pytest.mark.parametrize("spec, message", [
+    ([], "JSON 对象"),
+    ({"when": "now"}, "未知字段"),
+    ({"event": ""}, "event"),
+    ({"courts": []}, "courts"),
+    ({"times": ["25:00"]}, "无效的时间格式"),
+    ({"trigger": "8点"}, "无效的触发时间格式"),
+    ({"daily": True}, "daily"),
+    ({"daily": True, "trigger": "08:00", "date": "2099-01-01"}, "daily"),
+    ({"book_all": "yes"}, "book_all"),
+    ({"max_retries": 0}, "max_retries"),
+    ({"top_n": True}, "top_n"),
+    ({"retry_delay": -1}, "retry_delay"),
+    ({"date": "2099/01/01"}, "无效的日期"),
+])
+def test_build_job_rejects_invalid_specs(spec, message):
+    with pytest.raises(ValueError, match=message):
+        build_job(spec, DEFAULTS, now=1000.0)
+
+def test_build_job_defaults():
+    now = time.time()
+    job = build_job({"days_ahead": 2}, DEFAULTS, now=now)
+    assert job["next_fire"] == now and job["target_date"] == rolled_target_date(now, 2)
+    job = build_job({"trigger": "08:00", "daily": True}, DEFAULTS, now=now)
+    assert now < job["next_fire"] <= now + 24 * 3600
+    assert job["target_date"] == rolled_target_date(job["next_fire"], 1)
+    assert build_job({"date": "2099-01-01"}, DEFAULTS, now=now)["target_date"] == "2099-01-01"
+
+def make_daemon(store, clock_offset=0.0):
+    """只带任务库的 BookingDaemon：_resume 不需要连接池与 Token"""
+    daemon = BookingDaemon.__new__(BookingDaemon)
+    daemon.store = store
+    daemon.cond = threading.Condition()
+    daemon.clock_offset = clock_offset
+    return daemon
+
+def test_resume_marks_missed_and_interrupted_jobs():
+    now = time.time()
+    store = JobStore()
+    missed, in_window, future, armed, running, daily = store.add([
+        make_job(now - 60),                                # 预约窗口 10 × 1 秒，早已过去
+        make_job(now - 1),                                 # 仍在窗口内：保持等待，调度器立即触发
+        make_job(now + 3600),
+        make_job(now - 1),
+        make_job(now - 1),
+        make_job(now - 3600, trigger="08:00", daily=True), # 每天重复的任务错过后排到下一次
+    ])
+    store.update(armed, status=JOB_ARMED)
+    store.update(running, status=JOB_RUNNING)
+    make_daemon(store)._resume()
+
+    assert store.get(missed)["status"] == JOB_MISSED
+    assert "错过" in store.get(missed)["error"]
+    assert store.get(in_window)["status"] == JOB_PENDING
+    assert store.get(future)["status"] == JOB_PENDING
+    assert store.get(armed)["status"] == JOB_FAILED
+    assert store.get(running)["status"] == JOB_FAILED and "中断" in store.get(running)["error"]
+    job = store.get(daily)
+    assert (job["status"], job["last_status"]) == (JOB_PENDING, JOB_MISSED)
+    assert now < job["next_fire"] <= now + 24 * 3600
+    assert job["target_date"] == rolled_target_date(job["next_fire"], 1)
+    assert [job["id"] for job in store.due(time.time())] == [in_window]
+
+def test_resume_uses_server_clock():
+    # 服务器时钟比本机快 1 分钟：按本机时间还在窗口内的任务实际上已经错过
+    now = time.time()
+    store = JobStore()
+    (job_id,) = store.add([make_job(now - 5)])
+    make_daemon(store, clock_offset=60.0)._resume()
+    assert store.get(job_id)["status"] == JOB_MISSED
@@ -0,0 +1,64 @@
+"""增量时段差异引擎 (SlotDiffEngine) 与基于事件的偏好匹配"""
+from nuist_booking.match import (SLOT_CHANGED, SLOT_FREED, SLOT_NEW, SLOT_TAKEN, SlotDiffEngine, build_preference_index,
+                                 find_ranked_available_slots, find_ranked_slots_in_events)
+
+def make_payload(statuses):
+    """statuses: {(场地名, 开始时间): status}"""
+    resources = {}
+    for (court, start), status in statuses.items():
+        resources.setdefault(court, []).append({"slotId": f"{court}/{start}", "startTime": start, "endTime": "--",
+                                                "status": status, "slotOrder": 1, "scheduleId": "sch"})
+    return {"status": 0, "data": {"list": [{"id": f"id-{court}", "name": court, "slotInfo": slots}
+                                           for court, slots in resources.items()]}}
+
+def kinds(events):
+    return {event.slot_id: (event.kind, event.previous_status, event.status) for event in events}
+
+def test_first_poll_reports_every_slot_as_new():
+    events = SlotDiffEngine().diff(make_payload({("场地1", "18:00"): 0, ("场地1", "19:00"): 2}))
+    assert kinds(events) == {"场地1/18:00": (SLOT_NEW, None, 0), "场地1/19:00": (SLOT_NEW, None, 2)}
+    assert {event.resource_name for event in events} == {"场地1"}
+
+def test_only_changes_are_reported():
+    differ = SlotDiffEngine()
+    differ.diff(make_payload({("场地1", "18:00"): 0, ("场地1", "19:00"): 1, ("场地2", "18:00"): 2, ("场地2", "19:00"): 0}))
+    events = differ.diff(make_payload({("场地1", "18:00"): 1, ("场地1", "19:00"): 0, ("场地2", "18:00"): 1,
+                                       ("场地2", "19:00"): 0}))
+    assert kinds(events) == {
+        "场地1/18:00": (SLOT_TAKEN, 0, 1),
+        "场地1/19:00": (SLOT_FREED, 1, 0),
+        "场地2/18:00": (SLOT_CHANGED, 2, 1),
+    }
+    assert differ.diff(make_payload({("场地1", "18:00"): 1, ("场地1", "19:00"): 0, ("场地2", "18:00"): 1,
+                                     ("场地2", "19:00"): 0})) == []
+
+def test_failed_or_empty_queries_leave_snapshot_untouched():
+    differ = SlotDiffEngine()
+    differ.diff(make_payload({("场地1", "18:00"): 2}))
+    assert differ.diff(None) == []
+    assert differ.diff({"status": 9999, "message": "认证失败"}) == []
+    assert kinds(differ.diff(make_payload({("场地1", "18:00"): 0}))) == {"场地1/18:00": (SLOT_FREED, 2, 0)}
+
+def test_forget_reports_slot_again():
+    differ = SlotDiffEngine()
+    payload = make_payload({("场地1", "18:00"): 0})
+    differ.diff(payload)
+    differ.forget("场地1/18:00")
+    differ.forget("不存在的时段")
+    assert kinds(differ.diff(payload)) == {"场地1/18:00": (SLOT_NEW, None, 0)}
+
+def test_events_ranked_by_preference():
+    index = build_preference_index(["场地2", "场地1"], ["19:00", "18:00"])
+    payload = make_payload({("场地1", "18:00"): 0, ("场地1", "19:00"): 0, ("场地2", "18:00"): 0, ("场地2", "19:00"): 1,
+                            ("场地3", "18:00"): 0, ("场地1", "20:00"): 0})
+    differ = SlotDiffEngine()
+    slots = find_ranked_slots_in_events(differ.diff(payload), "2099-01-01", index)
+    assert [(slot["resourceName"], slot["bookSlot"][:5], slot["rank"]) for slot in slots] == \
+        [("场地2", "18:00", 1), ("场地1", "19:00", 2), ("场地1", "18:00", 3)]
+    # 与整份扫描的结果一致
+    assert slots == find_ranked_available_slots(payload, "2099-01-01", index)
+    # 之后只有变为可约的时段才成为候选
+    payload["data"]["list"][1]["slotInfo"][1]["status"] = 0 # 场地2 19:00 被取消
+    payload["data"]["list"][0]["slotInfo"][0]["status"] = 1 # 场地1 18:00 被抢
+    slots = find_ranked_slots_in_events(differ.diff(payload), "2099-01-01", index)
+    assert [(slot["resourceName"], slot["bookSlot"][:5], slot["rank"]) for slot in slots] == [("场地2", "19:00", 0)]
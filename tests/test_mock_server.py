@@ -0,0 +1,25 @@
+"""模拟服务器的控制接口：格式错误的请求体返回 400，而不是让处理线程抛出异常"""
+import time
+
+import pytest
+import requests
+
+@pytest.mark.parametrize("raw", [b"{not json", b"\xff\xfe", b"[1, 2]", b'{"release_epoch": "soon"}'])
+def test_reset_rejects_malformed_body(mock_server, raw):
+    response = requests.post(f"{mock_server.base_url}/__mock__/reset", data=raw, timeout=5)
+    assert response.status_code == 400
+    assert response.json()["status"] == 1 and response.json()["message"]
+
+def test_reset_sets_release_epoch(mock_server):
+    release_epoch = time.time() + 3600
+    response = requests.post(f"{mock_server.base_url}/__mock__/reset", json={"release_epoch": release_epoch}, timeout=5)
+    assert response.json() == {"status": 0}
+    assert requests.get(f"{mock_server.base_url}/__mock__/stats", timeout=5).json()["release_epoch"] == release_epoch
+    # 空请求体只清空状态，不改放号时间
+    assert requests.post(f"{mock_server.base_url}/__mock__/reset", timeout=5).json() == {"status": 0}
+    assert mock_server.release_epoch == release_epoch
+
+def test_api_rejects_non_object_body(mock_server):
+    response = requests.post(f"{mock_server.base_url}/api/v2/appBookGeneral/date/slot/searchByDate", data=b"[]",
+                             timeout=5)
+    assert response.status_code == 400
@@ -0,0 +1,78 @@
+"""searchByDate 响应的选择性解析 (parse_slot_payload_selective)：结果必须与完整 json.loads 后只保留偏好场地一致"""
+import json
+
+import pytest
+
+from nuist_booking.client import BookingClient, build_headers
+from nuist_booking.parsing import parse_slot_payload_selective
+from nuist_booking.search import get_slot_details
+
+def make_payload(courts=4, slots=3):
+    return {
+        "status": 0,
+        "message": "查询成功",
+        "data": {
+            "total": courts,
+            "list": [
+                {"id": f"r{c}", "name": f"场地{c + 1}",
+                 "slotInfo": [{"slotId": f"s{c}-{s}", "startTime": f"{8 + s:02d}:00", "endTime": f"{9 + s:02d}:00",
+                               "status": s % 3, "slotOrder": s + 1, "note": "含 [括号] 与 \"引号\" 的备注"}
+                              for s in range(slots)]}
+                for c in range(courts)
+            ],
+        },
+    }
+
+def expected(payload, wanted):
+    full = json.loads(json.dumps(payload))
+    full["data"]["list"] = [resource for resource in full["data"]["list"] if resource["name"] in wanted]
+    return full
+
+@pytest.mark.parametrize("wanted", [["场地1"], ["场地2", "场地4"], ["场地1", "场地2", "场地3", "场地4"], ["场地9"]])
+def test_matches_full_parse(wanted):
+    payload = make_payload()
+    text = json.dumps(payload, ensure_ascii=False, indent=1)
+    assert parse_slot_payload_selective(text, wanted) == expected(payload, wanted)
+
+def test_stops_after_all_wanted_courts_found():
+    # 偏好场地都找到后剩余内容不再解析：之后的场地与 data 中排在 list 之后的字段都不会出现
+    payload = make_payload()
+    payload["data"]["page"] = 1
+    text = json.dumps(payload, ensure_ascii=False) + " 这里不是 JSON"
+    parsed = parse_slot_payload_selective(text, ["场地1"])
+    assert [resource["name"] for resource in parsed["data"]["list"]] == ["场地1"]
+    assert "page" not in parsed["data"]
+
+def test_status_after_list_is_still_read():
+    # status 出现在 data 之后时不能因为提前结束而丢掉
+    payload = make_payload()
+    text = json.dumps({"data": payload["data"], "status": 0, "message": "ok"}, ensure_ascii=False)
+    parsed = parse_slot_payload_selective(text, ["场地1"])
+    assert parsed["status"] == 0
+    assert [resource["name"] for resource in parsed["data"]["list"]] == ["场地1"]
+
+def test_nested_array_in_slot_info_falls_back_to_decoding():
+    payload = make_payload(courts=2)
+    payload["data"]["list"][0]["slotInfo"][0]["tags"] = [[1, 2], ["]"]]
+    text = json.dumps(payload, ensure_ascii=False)
+    assert parse_slot_payload_selective(text, ["场地2"]) == expected(payload, ["场地2"])
+
+def test_error_payload_without_data():
+    assert parse_slot_payload_selective('{"status": 9999, "message": "认证失败"}', ["场地1"]) == \
+        {"status": 9999, "message": "认证失败"}
+
+@pytest.mark.parametrize("text", ['[1, 2]', '{"status": 0, "data": {"list": [{"name": "场地1", "slotInfo": ['])
+def test_malformed_input_raises_value_error(text):
+    with pytest.raises(ValueError):
+        parse_slot_payload_selective(text, ["场地1"])
+
+def test_get_slot_details_against_mock(mock_server):
+    client = BookingClient(pool_size=2)
+    try:
+        headers = build_headers("tokA")
+        full = get_slot_details("2099-01-01", "event", headers, client=client)
+        selective = get_slot_details("2099-01-01", "event", headers, client=client, wanted_courts=["场地2", "场地5"])
+    finally:
+        client.close()
+    assert full["status"] == 0 and len(full["data"]["list"]) == 8
+    assert selective == expected(full, {"场地2", "场地5"})
@@ -0,0 +1,99 @@
+"""预约错误分类 (classify_booking_error) 与按类别决定等待时间的 BookingRetryPolicy"""
+import time
+
+import pytest
+import requests
+
+from nuist_booking.booking import (BOOK_BACKOFF, BOOK_RETRY, BOOK_RETRY_AFTER_RELEASE, BOOK_RETRY_NOW, BOOK_TERMINAL,
+                                   BookingOutcome, BookingRetryPolicy, book_court, booking_failure,
+                                   classify_booking_error, prefetch_slot_identifiers)
+from nuist_booking.client import BookingClient, build_headers
+
+OK = BookingOutcome(None, "", 0, "预约成功", 200)
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({"exception": requests.exceptions.ReadTimeout("read timed out")}, (BOOK_BACKOFF, "timeout")),
+    ({"exception": requests.exceptions.ConnectionError("refused")}, (BOOK_BACKOFF, "network")),
+    ({"http_status": 401}, (BOOK_TERMINAL, "auth")),
+    ({"http_status": 403, "exception": requests.exceptions.HTTPError("403")}, (BOOK_TERMINAL, "auth")),
+    ({"status": 9999, "message": "认证失败，请重新登录"}, (BOOK_TERMINAL, "auth")),
+    ({"http_status": 429}, (BOOK_BACKOFF, "rate_limited")),
+    ({"http_status": 502, "exception": requests.exceptions.HTTPError("502")}, (BOOK_BACKOFF, "server_error")),
+    ({"status": 1, "message": "预约时间段不能为空"}, (BOOK_TERMINAL, "payload")),
+    ({"status": 1, "message": "超过最大未使用预约个数"}, (BOOK_TERMINAL, "quota")),
+    ({"status": 1, "message": "不在开放日期范围内！"}, (BOOK_RETRY_AFTER_RELEASE, "not_open")),
+    ({"status": 1, "message": "请求过于频繁，请稍后再试"}, (BOOK_BACKOFF, "rate_limited")),
+    ({"status": 1, "message": "该时段已被预约"}, (BOOK_RETRY_NOW, "taken")),
+    ({"status": 1, "message": "系统维护中"}, (BOOK_RETRY, "unknown")),
+    ({"status": 1, "message": None}, (BOOK_RETRY, "unknown")),
+])
+def test_classify_booking_error(kwargs, expected):
+    assert classify_booking_error(**kwargs) == expected
+
+def test_booking_outcome_truthiness():
+    failure = booking_failure(exception=requests.exceptions.ConnectionError("refused"))
+    assert OK and not failure
+    assert failure.message == "refused"
+
+def failure(message=None, http_status=200, exception=None):
+    return booking_failure(1 if message else None, message or "", http_status, exception)
+
+TAKEN = failure("该时段已被预约")
+UNKNOWN = failure("系统维护中")
+NOT_OPEN = failure("不在开放日期范围内！")
+BUSY = failure(http_status=503)
+
+@pytest.mark.parametrize("outcomes, expected", [
+    ([], 0.5),
+    ([OK, OK], 0.5),
+    ([TAKEN], 0.0),
+    ([TAKEN, UNKNOWN], 0.5),
+    ([TAKEN, UNKNOWN, NOT_OPEN], 10.0),
+    ([TAKEN, UNKNOWN, NOT_OPEN, BUSY], 2.0),
+])
+def test_next_delay_priority(outcomes, expected):
+    policy = BookingRetryPolicy(1.0, release_epoch=1010.0, min_delay=0.1, max_delay=30.0)
+    assert policy.next_delay(outcomes, 0.5, now=1000.0) == pytest.approx(expected)
+
+def test_backoff_grows_is_capped_and_resets():
+    policy = BookingRetryPolicy(1.0, min_delay=0.1, max_delay=5.0)
+    delays = [policy.next_delay([BUSY], 0.5) for _ in range(4)]
+    assert delays == [2.0, 4.0, 5.0, 5.0]
+    # 退避不少于常规间隔
+    assert policy.next_delay([BUSY], 8.0) == 8.0
+    # 出现其他结果后连续退避计数清零
+    assert policy.next_delay([TAKEN], 0.5) == 0.0
+    assert policy.next_delay([BUSY], 0.5) == 2.0
+
+def test_not_open_after_release_uses_min_delay():
+    policy = BookingRetryPolicy(1.0, release_epoch=1000.0, min_delay=0.1)
+    assert policy.next_delay([NOT_OPEN], 0.5, now=1000.5) == pytest.approx(0.1)
+    assert BookingRetryPolicy(1.0, min_delay=0.1).next_delay([NOT_OPEN], 0.5, now=1000.5) == pytest.approx(0.1)
+    # min_delay 不超过常规间隔
+    assert BookingRetryPolicy(0.05, min_delay=0.1).min_delay == 0.05
+
+def test_counts_and_summary():
+    policy = BookingRetryPolicy(1.0)
+    policy.next_delay([TAKEN, TAKEN, OK, BUSY], 0.5)
+    policy.next_delay([TAKEN], 0.5)
+    assert policy.counts == {(BOOK_RETRY_NOW, "taken"): 3, (BOOK_BACKOFF, "server_error"): 1}
+    assert policy.summary() == "server_error (backoff) 1, taken (retry_now) 3"
+
+def test_book_court_outcomes_against_mock(mock_server):
+    client = BookingClient(pool_size=2)
+    try:
+        slots = prefetch_slot_identifiers("2099-01-01", "event", "tokA", ["场地1"], ["08:00", "09:00"], client=client)
+        headers = build_headers("tokA")
+        assert book_court(slots[0], "event", headers, client=client)
+        taken = book_court(slots[0], "event", build_headers("tokB"), client=client)
+        assert (taken.error_class, taken.reason, taken.http_status) == (BOOK_RETRY_NOW, "taken", 200)
+
+        mock_server.max_unused = 1
+        quota = book_court(slots[1], "event", headers, client=client)
+        assert (quota.error_class, quota.reason) == (BOOK_TERMINAL, "quota")
+
+        mock_server.reset(release_epoch=time.time() + 3600)
+        not_open = book_court(slots[1], "event", headers, client=client)
+        assert (not_open.error_class, not_open.reason) == (BOOK_RETRY_AFTER_RELEASE, "not_open")
+    finally:
+        client.close()
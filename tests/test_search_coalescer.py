@@ -0,0 +1,168 @@
+"""查询合并 (SearchCoalescer)：single-flight、微 TTL 缓存与按场地并集共享"""
+import threading
+import time
+
+from nuist_booking.client import BookingClient, build_headers
+from nuist_booking.search import POLL_OK, SearchCoalescer, get_slot_details
+
+class FakeSearch:
+    """记录每次真正发出的查询；block 为 True 时等到 release() 才返回，用来制造在途请求"""
+    def __init__(self, result=("data",), block=False, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        if not block:
+            self.gate.set()
+
+    def __call__(self, courts, poll_info):
+        self.calls.append(courts)
+        self.started.set()
+        self.gate.wait(5)
+        poll_info.update(latency=0.01, error=POLL_OK, http_status=200)
+        if self.error:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self.gate.set()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.001)
+
+def run_concurrently(coalescer, search, followers, courts=("场地1",)):
+    """先让一个查询成为在途请求，再发起 followers 个相同查询，全部跟上之后放行；返回各查询的 (结果, poll_info)"""
+    results = [None] * (followers + 1)
+
+    def fetch(i):
+        info = {}
+        results[i] = (coalescer.fetch("2099-01-01", "event", list(courts), info, search), info)
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(followers + 1)]
+    threads[0].start()
+    assert search.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: coalescer.coalesced == followers)
+    search.release()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_concurrent_fetches_share_one_request():
+    coalescer = SearchCoalescer(ttl=0)
+    search = FakeSearch(block=True)
+    results = run_concurrently(coalescer, search, followers=4)
+    assert search.calls == [["场地1"]]
+    assert all(data == ("data",) for data, _ in results)
+    # 跟随者也拿到那次请求的延迟与错误类型
+    assert all(info == {"latency": 0.01, "error": POLL_OK, "http_status": 200} for _, info in results)
+    assert coalescer.stats() == {"ttl_ms": 0.0, "hits": 0, "misses": 1, "coalesced": 4}
+
+def test_ttl_cache_hit_and_expiry():
+    coalescer = SearchCoalescer(ttl=0.05)
+    search = FakeSearch()
+    info = {}
+    assert coalescer.fetch("2099-01-01", "event", ["场地1"], None, search) == ("data",)
+    assert coalescer.fetch("2099-01-01", "event", ["场地1"], info, search) == ("data",)
+    assert info["http_status"] == 200
+    assert (len(search.calls), coalescer.hits) == (1, 1)
+    # 其他日期不共用
+    coalescer.fetch("2099-01-02", "event", ["场地1"], None, search)
+    assert len(search.calls) == 2
+    time.sleep(0.06)
+    coalescer.fetch("2099-01-01", "event", ["场地1"], None, search)
+    assert len(search.calls) == 3
+
+def test_zero_ttl_does_not_cache():
+    coalescer = SearchCoalescer(ttl=0)
+    search = FakeSearch()
+    for _ in range(3):
+        coalescer.fetch("2099-01-01", "event", ["场地1"], None, search)
+    assert len(search.calls) == 3 and coalescer.hits == 0
+
+def test_courts_union_and_coverage():
+    coalescer = SearchCoalescer(ttl=60)
+    search = FakeSearch()
+    coalescer.fetch("2099-01-01", "event", ["场地1"], None, search)
+    # 场地2 不在缓存结果里：按并集重新查询，之后两个场地都能命中
+    coalescer.fetch("2099-01-01", "event", ["场地2"], None, search)
+    coalescer.fetch("2099-01-01", "event", ["场地1"], None, search)
+    coalescer.fetch("2099-01-01", "event", ["场地2", "场地1"], None, search)
+    assert search.calls == [["场地1"], ["场地1", "场地2"]]
+    assert coalescer.hits == 2
+    # 要全部场地的查询只能由完整解析的结果回答，之后任何场地集合都能命中
+    coalescer.fetch("2099-01-01", "event", None, None, search)
+    coalescer.fetch("2099-01-01", "event", ["场地7"], None, search)
+    assert search.calls[2:] == [None]
+    assert coalescer.hits == 3
+
+def test_follower_wanting_more_courts_sends_its_own_request():
+    coalescer = SearchCoalescer(ttl=0)
+    search = FakeSearch(block=True)
+    threads = [threading.Thread(target=coalescer.fetch, args=("2099-01-01", "event", [court], None, search))
+               for court in ("场地1", "场地2")]
+    threads[0].start()
+    assert search.started.wait(5)
+    threads[1].start()
+    # 第二个查询不能共用只解析了场地1 的在途请求，不等它结束就按并集发出自己的请求
+    wait_for(lambda: len(search.calls) == 2)
+    search.release()
+    for thread in threads:
+        thread.join(5)
+    assert search.calls == [["场地1"], ["场地1", "场地2"]]
+    assert coalescer.coalesced == 0
+
+def test_failures_are_shared_but_not_cached():
+    coalescer = SearchCoalescer(ttl=60)
+    search = FakeSearch(result=None, block=True)
+    results = run_concurrently(coalescer, search, followers=2)
+    assert [data for data, _ in results] == [None, None, None]
+    search.result = ("data",)
+    assert coalescer.fetch("2099-01-01", "event", ["场地1"], None, search) == ("data",)
+    assert len(search.calls) == 2
+
+def test_exception_releases_followers():
+    coalescer = SearchCoalescer(ttl=60)
+    search = FakeSearch(block=True, error=RuntimeError("boom"))
+    results = [None]
+
+    def leader():
+        try:
+            coalescer.fetch("2099-01-01", "event", ["场地1"], None, search)
+        except RuntimeError as e:
+            results[0] = e
+
+    def follower():
+        results.append(coalescer.fetch("2099-01-01", "event", ["场地1"], None, search))
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    threads[0].start()
+    assert search.started.wait(5)
+    threads[1].start()
+    wait_for(lambda: coalescer.coalesced == 1)
+    search.release()
+    for thread in threads:
+        thread.join(5)
+    assert isinstance(results[0], RuntimeError) and results[1:] == [None]
+    assert not coalescer.inflight and not coalescer.cache
+
+def test_get_slot_details_shares_requests_against_mock(mock_server):
+    client = BookingClient(pool_size=2)
+    client.search_cache = SearchCoalescer(ttl=60)
+    try:
+        headers = build_headers("tokA")
+        first = get_slot_details("2099-01-01", "event", headers, client=client, wanted_courts=["场地1"])
+        info = {}
+        second = get_slot_details("2099-01-01", "event", headers, client=client, wanted_courts=["场地1"],
+                                  poll_info=info)
+        third = get_slot_details("2099-01-01", "event", headers, client=client, wanted_courts=["场地3"])
+    finally:
+        client.close()
+    assert second is first and info["error"] == POLL_OK and info["http_status"] == 200
+    assert [resource["name"] for resource in third["data"]["list"]] == ["场地1", "场地3"]
+    assert [request["kind"] for request in mock_server.stats()["requests"]] == ["search", "search"]
@@ -0,0 +1,15 @@
+"""命令行入口的导入开销：导入时不能带进 requests，且要在 bench_hotpath.py startup 的预算之内"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_cli_import_does_not_load_requests():
+    code = "import sys, nuist_booking.cli; sys.exit('requests' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT).returncode == 0
+
+def test_cli_import_within_budget():
+    proc = subprocess.run([sys.executable, "bench_hotpath.py", "startup"], cwd=REPO_ROOT,
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
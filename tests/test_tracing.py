@@ -0,0 +1,43 @@
+"""阶段耗时追踪 (PhaseTracer)：span 由后台线程写入 JSONL，close() 时写完队列"""
+import json
+import threading
+
+from nuist_booking.tracing import PhaseTracer
+
+def test_spans_are_written_by_background_thread(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = PhaseTracer(str(path))
+    tracer.begin_attempt("场地1")
+    tracer.record("search", 0.012, ok=True, func="get_slot_details")
+
+    def book():
+        tracer.begin_attempt("场地2")
+        tracer.record("book", 0.003, op="batch", ok=False)
+
+    thread = threading.Thread(target=book, name="booker")
+    thread.start()
+    thread.join()
+    tracer.record("decode", 0.0004, op="selective")
+    tracer.close()
+    tracer.record("search", 0.02) # 关闭之后只进入直方图
+
+    spans = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(span["attempt"], span.get("target"), span["phase"], span.get("op")) for span in spans] == [
+        (1, "场地1", "search", None), (2, "场地2", "book", "batch"), (1, "场地1", "decode", "selective")]
+    assert spans[0]["ms"] == 12.0 and spans[0]["ok"] is True and spans[0]["func"] == "get_slot_details"
+    assert spans[1]["thread"] == "booker"
+    assert not tracer.writer.is_alive()
+    tracer.close() # 重复关闭无副作用
+
+def test_metrics_without_trace_file():
+    tracer = PhaseTracer()
+    tracer.begin_attempt()
+    tracer.record("search", 0.004, ok=True)
+    tracer.record("search", 0.2, ok=False)
+    metrics = tracer.render_metrics()
+    assert 'nuist_phase_duration_seconds_bucket{phase="search",op="",le="0.005"} 1' in metrics
+    assert 'nuist_phase_duration_seconds_count{phase="search",op=""} 2' in metrics
+    assert 'nuist_phase_results_total{phase="search",ok="false"} 1' in metrics
+    assert "nuist_attempts_total 1" in metrics
+    assert tracer.writer is None
+    tracer.close()